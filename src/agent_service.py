@@ -0,0 +1,189 @@
+# Author: Kartheek Nagelli
+from __future__ import annotations
+import asyncio, functools, json, pathlib, time, urllib.parse
+from collections import Counter, OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+import agentic_workflow
+from doc_store import DocStore
+from utils.data import ART_DIR, published_version
+from utils.metrics import inc, observe
+from logs import get_logger
+
+TABLES = ("corpus_clean", "summaries")
+REASONS = {200: "OK", 400: "Bad Request", 404: "Not Found", 500: "Internal Server Error"}
+
+def _norm(query: str) -> str:
+    return " ".join(query.lower().split())
+
+def _lru_put(lru: OrderedDict, key, value, size: int) -> None:
+    lru[key] = value
+    lru.move_to_end(key)
+    while len(lru) > size:
+        lru.popitem(last=False)
+
+class AgentService:
+    """Answers agent queries against a warm DocStore and keyword, vector and entity indexes. Identical in-flight
+    queries share one execution; plans and results are LRU-cached per artifact
+    version. When the pipeline publishes a new version (utils.data.publish_version) it is
+    loaded in the background and swapped in; queries keep using the old one until then."""
+
+    def __init__(self, art_dir: pathlib.Path = ART_DIR, cache_size: int = 1024, reload_seconds: float = 2.0,
+                 workers: int = 4):
+        self.art_dir = pathlib.Path(art_dir)
+        self.cache_size, self.reload_seconds = cache_size, reload_seconds
+        self.pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="agent")
+        self.version: str | None = None
+        self.store: DocStore | None = None
+        self.plans: OrderedDict = OrderedDict()
+        self.results: OrderedDict = OrderedDict()
+        self.inflight: dict[tuple, asyncio.Future] = {}
+        self.stats: Counter = Counter()
+        self.log = get_logger("agent_service")
+        self._watcher: asyncio.Task | None = None
+
+    def _load(self) -> tuple[str | None, DocStore]:
+        version = published_version(self.art_dir)  # read first: a publish during loading triggers another reload
+        store = DocStore(self.art_dir).warm(*TABLES)
+        agentic_workflow.open_index(self.art_dir)
+        agentic_workflow.open_vector_index(self.art_dir)
+        agentic_workflow.open_entity_index(self.art_dir)
+        return version, store
+
+    async def start(self) -> AgentService:
+        self.version, self.store = await asyncio.get_running_loop().run_in_executor(self.pool, self._load)
+        self.log.info(f"agent service warm, artifact version {self.version}")
+        if self.reload_seconds > 0:
+            self._watcher = asyncio.create_task(self._watch())
+        return self
+
+    async def reload_if_changed(self) -> bool:
+        if published_version(self.art_dir) == self.version:
+            return False
+        t0 = time.perf_counter()
+        version, store = await asyncio.get_running_loop().run_in_executor(self.pool, self._load)
+        self.version, self.store = version, store
+        self.results.clear()
+        self.stats["reloads"] += 1
+        self.log.info(f"reloaded artifact version {version} in {time.perf_counter() - t0:.2f}s")
+        return True
+
+    async def _watch(self) -> None:
+        while True:
+            await asyncio.sleep(self.reload_seconds)
+            try:
+                await self.reload_if_changed()
+            except Exception:
+                # Half-written or broken artifacts: keep serving the loaded version, retry next tick
+                self.log.exception("artifact reload failed")
+
+    def _plan(self, key: tuple, query: str) -> list:
+        # Per artifact version too: whether a name is routed to entity_lookup depends on the index
+        steps = self.plans.get(key)
+        if steps is None:
+            steps = agentic_workflow.plan(query, self.art_dir)
+        _lru_put(self.plans, key, steps, self.cache_size)
+        return steps
+
+    async def query(self, query: str) -> dict:
+        t0 = time.perf_counter()
+        version, store = self.version, self.store
+        key = (version, _norm(query))
+        self.stats["queries"] += 1
+        try:
+            if key in self.results:
+                self.results.move_to_end(key)
+                self.stats["cache_hits"] += 1
+                inc("agent_queries", source="cache")
+                return {**self.results[key], "query": query}
+            fut = self.inflight.get(key)
+            if fut is not None:
+                self.stats["coalesced"] += 1
+                inc("agent_queries", source="coalesced")
+                return {**await asyncio.shield(fut), "query": query}
+
+            fut = self.inflight[key] = asyncio.get_running_loop().create_future()
+            try:
+                steps = self._plan(key, query)
+                self.stats["executed"] += 1
+                inc("agent_queries", source="executed")
+                res = await asyncio.get_running_loop().run_in_executor(
+                    self.pool, functools.partial(agentic_workflow.run, query, self.art_dir, store, steps))
+            except Exception as e:
+                fut.set_exception(e)
+                fut.exception()  # retrieved here; waiters re-raise it
+                raise
+            finally:
+                del self.inflight[key]
+            fut.set_result(res)
+            if version == self.version:
+                _lru_put(self.results, key, res, self.cache_size)
+            return res
+        finally:
+            observe("agent_query_seconds", time.perf_counter() - t0)
+
+    def health(self) -> dict:
+        return {"version": self.version, "cached_results": len(self.results), "inflight": len(self.inflight),
+                **self.stats}
+
+    async def _route(self, method: str, target: str, body: bytes) -> tuple[int, dict]:
+        url = urllib.parse.urlsplit(target)
+        if url.path == "/health":
+            return 200, self.health()
+        if url.path != "/query":
+            return 404, {"error": f"no route {url.path}"}
+        if method == "POST":
+            payload = json.loads(body or b"{}")
+            q = payload.get("query") if isinstance(payload, dict) else None
+        else:
+            q = urllib.parse.parse_qs(url.query).get("q", [None])[0]
+        if not q or not isinstance(q, str):
+            return 400, {"error": "missing query (?q=... or POST {\"query\": ...})"}
+        try:
+            return 200, await self.query(q)
+        except Exception as e:
+            self.log.exception("query failed")
+            return 500, {"error": f"{type(e).__name__}: {e}"}
+
+    async def handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        # Minimal HTTP/1.1: one JSON request/response per connection
+        try:
+            head = await reader.readuntil(b"\r\n\r\n")
+            line, *lines = head.decode("latin-1").split("\r\n")
+            method, target, _ = line.split(" ", 2)
+            headers = {k.strip().lower(): v.strip() for k, _, v in (h.partition(":") for h in lines if h)}
+            body = await reader.readexactly(int(headers.get("content-length") or 0))
+            status, payload = await self._route(method, target, body)
+        except (asyncio.IncompleteReadError, asyncio.LimitOverrunError, ValueError) as e:
+            status, payload = 400, {"error": f"bad request: {e}"}
+        except Exception as e:
+            # Whatever went wrong, the client gets a response rather than a dropped connection
+            self.log.exception("request failed")
+            status, payload = 500, {"error": f"{type(e).__name__}: {e}"}
+        data = json.dumps(payload, default=str).encode("utf-8")
+        writer.write(f"HTTP/1.1 {status} {REASONS[status]}\r\nContent-Type: application/json\r\n"
+                     f"Content-Length: {len(data)}\r\nConnection: close\r\n\r\n".encode("latin-1") + data)
+        try:
+            await writer.drain()
+        finally:
+            writer.close()
+
+    async def close(self) -> None:
+        if self._watcher is not None:
+            self._watcher.cancel()
+        self.pool.shutdown(wait=False)
+
+async def serve(service: AgentService, host: str = "127.0.0.1", port: int = 8765,
+                socket_path: str | None = None) -> None:
+    # Same protocol over TCP or a unix socket (curl --unix-socket PATH http://x/query?q=...)
+    await service.start()
+    if socket_path:
+        server = await asyncio.start_unix_server(service.handle, path=socket_path)
+    else:
+        server = await asyncio.start_server(service.handle, host, port)
+    addrs = ", ".join(str(s.getsockname()) for s in server.sockets)
+    service.log.info(f"agent service listening on {addrs}")
+    try:
+        async with server:
+            await server.serve_forever()
+    finally:
+        await service.close()
@@ -1,45 +1,137 @@
 # Author: Kartheek Nagelli
 from __future__ import annotations
-import re, json, pathlib, pandas as pd
-
-def search_corpus_local(term: str, art_dir: pathlib.Path):
-    p_parq = art_dir / "corpus_clean.parquet"
-    p_csv = art_dir / "corpus_clean.csv"
-    df = pd.read_parquet(p_parq) if p_parq.exists() else pd.read_csv(p_csv)
-    mask = df["text_clean"].str.contains(term, case=False, regex=False) | df["filename"].str.contains(term, case=False, regex=False)
-    return df[mask].to_dict(orient="records")
-
-def summarize_local(doc_id: str, art_dir: pathlib.Path):
-    p_parq = art_dir / "summaries.parquet"
-    p_csv = art_dir / "summaries.csv"
-    s = pd.read_parquet(p_parq) if p_parq.exists() else pd.read_csv(p_csv)
-    row = s.loc[s["doc_id"] == doc_id]
-    return None if row.empty else row.iloc[0]["summary"]
-
-def plan(query: str) -> list:
+import functools, re, json, pathlib
+from entity_index import parse_query
+
+ART_DIR = pathlib.Path(__file__).resolve().parents[1] / "artifacts"
+DEMO_QUERY = "Find issues in transit report"
+INDEX_COLS = ("sent_offsets", "tok_offsets")  # preprocess's offset index, not useful in tool output
+
+@functools.lru_cache(maxsize=4)
+def _open_index(path: pathlib.Path, mtime: float):
+    from search_index import SearchIndex
+    return SearchIndex(path)
+
+def open_index(art_dir: pathlib.Path):
+    # Memoized per index build (meta.json mtime); None until the index stage has run
+    meta = art_dir / "search_index" / "meta.json"
+    return _open_index(meta.parent, meta.stat().st_mtime) if meta.exists() else None
+
+@functools.lru_cache(maxsize=4)
+def _open_vector_index(path: pathlib.Path, mtime: float, nprobe: int):
+    from vector_index import VectorIndex
+    return VectorIndex(path, nprobe)
+
+@functools.lru_cache(maxsize=1)
+def default_nprobe() -> int:
+    # Config vector_nprobe, read once per process rather than per query
+    from config import load_cfg
+    return int(load_cfg().get("vector_nprobe", 8))
+
+def open_vector_index(art_dir: pathlib.Path, nprobe: int | None = None):
+    # Like open_index, for the vectors stage's ANN index
+    meta = art_dir / "vector_index" / "meta.json"
+    if not meta.exists():
+        return None
+    return _open_vector_index(meta.parent, meta.stat().st_mtime, default_nprobe() if nprobe is None else nprobe)
+
+@functools.lru_cache(maxsize=4)
+def _open_entity_index(path: pathlib.Path):
+    from entity_index import EntityIndex
+    return EntityIndex(path)
+
+def open_entity_index(art_dir: pathlib.Path):
+    # Updated in place (SQLite, WAL), so one connection per path stays current
+    path = art_dir / "entity_index.sqlite"
+    return _open_entity_index(path) if path.exists() else None
+
+def _fuse(rankings: list[list[str]], k: int, c: int = 60) -> list[str]:
+    # Reciprocal rank fusion: keyword (BM25) and semantic (vector) hits, no score calibration needed
+    score: dict[str, float] = {}
+    for ranked in rankings:
+        for rank, doc_id in enumerate(ranked):
+            score[doc_id] = score.get(doc_id, 0.0) + 1.0 / (c + rank + 1)
+    return sorted(score, key=lambda d: -score[d])[:k]
+
+def _store(art_dir: pathlib.Path, store=None):
+    if store is None:
+        from doc_store import DocStore
+        store = DocStore(art_dir)
+    return store
+
+def search_corpus_local(query: str, art_dir: pathlib.Path, store=None, k: int = 10):
+    store = _store(art_dir, store)
+    rankings = [[doc_id for doc_id, _ in index.search(query, k * 2)]
+                for index in (open_index(art_dir), open_vector_index(art_dir)) if index is not None]
+    if rankings:
+        rows = [r for r in store.get_many("corpus_clean", _fuse(rankings, k)) if r is not None]
+        return [{k: v for k, v in r.items() if k not in INDEX_COLS} for r in rows]
+    # No index built yet: docs containing the most query terms (substring match), unranked otherwise
+    df = store.frame("corpus_clean")
+    hits = sum((df["text_clean"].str.contains(w, case=False, regex=False) |
+                df["filename"].str.contains(w, case=False, regex=False)).astype(int) for w in set(query.split()) or [""])
+    order = hits[hits > 0].sort_values(ascending=False, kind="stable").index
+    return df.loc[order].drop(columns=list(INDEX_COLS), errors="ignore").to_dict(orient="records")
+
+def entity_lookup_local(entity: str, art_dir: pathlib.Path, store=None, type: str | None = None,
+                        sentiment: str | None = None, k: int = 10) -> tuple[list, list]:
+    """(documents, related entities) for an entity, from the entity index; without one, a
+    corpus search for the entity's name (no sentiment filter, nothing related)."""
+    store = _store(art_dir, store)
+    index = open_entity_index(art_dir)
+    if index is None:
+        return search_corpus_local(entity, art_dir, store, k), []
+    hits = index.lookup(entity, type, sentiment, k)
+    rows = store.get_many("corpus_clean", [h["doc_id"] for h in hits])
+    docs = [{**{c: v for c, v in r.items() if c not in INDEX_COLS}, **h} for h, r in zip(hits, rows) if r is not None]
+    return docs, index.related(entity, type)
+
+def summarize_local(doc_id: str, art_dir: pathlib.Path, store=None):
+    row = _store(art_dir, store).get("summaries", doc_id)
+    return None if row is None else row["summary"]
+
+def _search_terms(query: str) -> str:
+    return " ".join(re.sub(r"[^a-z0-9 ]", " ", query.lower()).split())
+
+def plan(query: str, art_dir: pathlib.Path = ART_DIR) -> list:
     q = query.lower()
     steps = []
-    if any(k in q for k in ["find","show","which","where","sentiment","entity","issue"]):
-        steps.append({"tool":"search_corpus","args":{"term": re.sub(r"[^a-z0-9 ]","", q).split()[-1]}})
+    ent = parse_query(query)
+    if ent:
+        # A capitalised word is only an entity if the index knows it ("Where do I find ...")
+        index = open_entity_index(art_dir)
+        ent = ent if index is not None and index.known(ent["entity"], ent["type"]) else None
+    if any(k in q for k in ["find","show","which","where","sentiment","entity","issue","mention"]) and ent:
+        steps.append({"tool":"entity_lookup","args":ent})
+        steps.append({"tool":"summarize","args":{}})
+    elif any(k in q for k in ["find","show","which","where","sentiment","entity","issue"]):
+        steps.append({"tool":"search_corpus","args":{"query": _search_terms(query)}})
         steps.append({"tool":"summarize","args":{}})
     else:
         steps.append({"tool":"summarize","args":{}})
     return steps
 
-def run(query: str):
-    art = pathlib.Path(__file__).resolve().parents[1] / "artifacts"
-    steps = plan(query)
-    candidates = []
+def run(query: str, art: pathlib.Path = ART_DIR, store=None, steps: list | None = None):
+    # store (a doc_store.DocStore) may be handed over warm by the pipeline or agent_service;
+    # otherwise artifacts are read once. steps: a precomputed plan(query)
+    store = _store(art, store)
+    steps = plan(query, art) if steps is None else steps
+    candidates, extra = [], {}
 
     for step in steps:
         if step["tool"] == "search_corpus":
-            term = step["args"].get("term", "")
-            candidates = search_corpus_local(term, art)
+            args = step["args"]
+            candidates = search_corpus_local(args.get("query", args.get("term", "")), art, store)
+        elif step["tool"] == "entity_lookup":
+            candidates, extra["related"] = entity_lookup_local(store=store, art_dir=art, **step["args"])
+            if not candidates:  # no document matches the entity and its filters: plain search instead
+                candidates = search_corpus_local(_search_terms(query), art, store)
         elif step["tool"] == "summarize" and candidates:
-            for c in candidates:
-                c["summary"] = summarize_local(c["doc_id"], art)
-    return {"query": query, "plan": steps, "results": candidates[:3]}
+            rows = store.get_many("summaries", [c["doc_id"] for c in candidates])
+            for c, row in zip(candidates, rows):
+                c["summary"] = None if row is None else row["summary"]
+    return {"query": query, "plan": steps, "results": candidates[:3], **extra}
 
 if __name__ == "__main__":
-    out = run("Find issues in transit report")
+    out = run(DEMO_QUERY)
     print(json.dumps(out, indent=2))
@@ -1,27 +1,62 @@
 # Author: Kartheek Nagelli
 from __future__ import annotations
-import warnings
+import functools, warnings
+from preprocess import clean_text, sentences, text_offsets
 
-def summarize_textrank(text: str, max_sentences: int = 4) -> str:
+NER_DISABLE = ["tagger", "parser", "attribute_ruler", "lemmatizer"]
+
+def _sentences(text: str, sent_offsets=None) -> list:
+    if sent_offsets is None:
+        text = clean_text(text)
+        (sent_offsets,), _ = text_offsets([text])
+    return sentences(text, sent_offsets)
+
+def _naive_summary(text: str, max_sentences: int, sent_offsets=None) -> str:
+    return ' '.join(_sentences(text, sent_offsets)[:max_sentences])
+
+@functools.lru_cache(maxsize=None)
+def _textrank():
+    # Tokenizer (punkt data) and summarizer are built once per process
     try:
-        from sumy.parsers.plaintext import PlaintextParser
+        from sumy.models.dom import ObjectDocumentModel, Paragraph, Sentence
         from sumy.nlp.tokenizers import Tokenizer
         from sumy.summarizers.text_rank import TextRankSummarizer
     except Exception:
         warnings.warn("sumy not installed; falling back to naive summarizer")
-        sents = [s.strip() for s in text.split('.') if s.strip()]
-        return '. '.join(sents[:max_sentences]) + ('.' if sents else '')
-    parser = PlaintextParser.from_string(text, Tokenizer("english"))
-    summarizer = TextRankSummarizer()
-    sentences = summarizer(parser.document, max_sentences)
-    return ' '.join(str(s) for s in sentences)
+        return None
+    tokenizer = Tokenizer("english")
+    # Sentences come from preprocess's offset index; sumy only tokenises words
+    build = lambda sents: ObjectDocumentModel([Paragraph([Sentence(s, tokenizer) for s in sents])])
+    return build, TextRankSummarizer()
 
-def spacy_ner(text: str):
+@functools.lru_cache(maxsize=None)
+def _spacy(model: str = "en_core_web_sm"):
+    # Loaded once per process, with the components NER does not need switched off
     try:
         import spacy
-        nlp = spacy.load("en_core_web_sm")
+        return spacy.load(model, disable=NER_DISABLE)
     except Exception:
         warnings.warn("spaCy or model not installed; returning empty entities")
-        return []
-    doc = nlp(text)
-    return [{"text": ent.text, "label": ent.label_} for ent in doc.ents]
+        return None
+
+def summarize_textrank(text: str, max_sentences: int = 4, sent_offsets=None) -> str:
+    tr = _textrank()
+    if tr is None:
+        return _naive_summary(text, max_sentences, sent_offsets)
+    build, summarizer = tr
+    sentences = summarizer(build(_sentences(text, sent_offsets)), max_sentences)
+    return ' '.join(str(s) for s in sentences)
+
+def summarize_textrank_batch(texts: list, max_sentences: int = 4, sent_offsets: list | None = None) -> list:
+    offsets = [None] * len(texts) if sent_offsets is None else sent_offsets
+    return [summarize_textrank(t, max_sentences, o) for t, o in zip(texts, offsets)]
+
+def spacy_ner_batch(texts: list, batch_size: int = 64, n_process: int = 1) -> list:
+    nlp = _spacy()
+    if nlp is None:
+        return [[] for _ in texts]
+    return [[{"text": ent.text, "label": ent.label_} for ent in doc.ents]
+            for doc in nlp.pipe(texts, batch_size=batch_size, n_process=n_process)]
+
+def spacy_ner(text: str):
+    return spacy_ner_batch([text])[0]
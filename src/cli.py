@@ -1,23 +1,50 @@
 # Author: Kartheek Nagelli
 from __future__ import annotations
-import argparse, subprocess, sys, pathlib
+import argparse, contextlib, json, os, sys, pathlib
 
 ROOT = pathlib.Path(__file__).resolve().parents[0]
+if str(ROOT) not in sys.path:
+    sys.path.insert(0, str(ROOT))  # stages import siblings as top-level modules
 
-def run_step(path: pathlib.Path) -> int:
-    return subprocess.run([sys.executable, str(path)], check=True).returncode
+STAGES = ["ingest","preprocess","dedup","index","vectors","extract","entities","summarize","evaluate","agent"]
 
 def main():
     ap = argparse.ArgumentParser(description="NLP pipeline runner")
-    ap.add_argument("cmd", choices=["all","ingest","preprocess","extract","summarize","evaluate","agent"], help="stage to run")
+    ap.add_argument("cmd", choices=["all", *STAGES, "serve"], help="stage to run, or serve: long-lived agent query service")
+    ap.add_argument("--no-checkpoint", action="store_true", help="keep intermediate results in memory only")
+    ap.add_argument("--workers", type=int, default=4, help="max stages running concurrently")
+    ap.add_argument("--json-logs", action="store_true", help="structured JSON log lines with metric fields")
+    ap.add_argument("--profile", action="store_true",
+                    help="cProfile + sampled stacks + tracemalloc per stage into artifacts/profiles/ (stages run one at a time)")
+    ap.add_argument("--host", default="127.0.0.1", help="serve: bind address")
+    ap.add_argument("--port", type=int, default=None, help="serve: TCP port (default agent_service_port)")
+    ap.add_argument("--socket", default=None, help="serve: listen on this unix socket instead of TCP")
     args = ap.parse_args()
+    if args.json_logs:
+        os.environ["LOG_JSON"] = "1"
 
-    if args.cmd in ("all","ingest"): run_step(ROOT/"ingest.py")
-    if args.cmd in ("all","preprocess"): run_step(ROOT/"preprocess.py")
-    if args.cmd in ("all","extract"): run_step(ROOT/"extract_entities.py")
-    if args.cmd in ("all","summarize"): run_step(ROOT/"summarize.py")
-    if args.cmd in ("all","evaluate"): run_step(ROOT/"evaluate.py")
-    if args.cmd in ("all","agent"): run_step(ROOT/"agentic_workflow.py")
+    if args.cmd == "serve":
+        import asyncio
+        from config import load_cfg
+        from agent_service import AgentService, serve
+        cfg = load_cfg()
+        svc = AgentService(cache_size=cfg.get("agent_cache_size", 1024),
+                           reload_seconds=cfg.get("agent_reload_seconds", 2))
+        with contextlib.suppress(KeyboardInterrupt):
+            asyncio.run(serve(svc, args.host, args.port or cfg.get("agent_service_port", 8765), args.socket))
+        return
+
+    from pipeline import default_pipeline
+    p = default_pipeline(checkpoint=not args.no_checkpoint, max_workers=1 if args.profile else args.workers)
+    if args.profile:
+        from profiling import Profiler
+        p.cfg["heuristic_workers"] = 1  # keep extraction in-process so it shows up in the profile
+        p.profiler = Profiler(p.art_dir / "profiles")
+    results = p.run(STAGES if args.cmd == "all" else [args.cmd])
+    if args.profile:
+        print(p.profiler.report())
+    if "agent" in results:
+        print(json.dumps(results["agent"], indent=2, default=str))
 
 if __name__ == "__main__":
     main()
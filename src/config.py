@@ -1,16 +1,66 @@
 # Author: Kartheek Nagelli
 from __future__ import annotations
-import os, pathlib, yaml
+import copy, functools, os, pathlib, yaml
 
 CFG_PATH = pathlib.Path(__file__).resolve().parents[1] / "config.yaml"
+ENV_KEYS = ["project_id","location","gcs_bucket","gcs_prefix","bq_dataset","vertex_location"]
 
-def load_cfg() -> dict:
+# key -> (type, minimum[, maximum]); checked only when the key is present
+_NUMERIC = {
+    "api_max_concurrency": (int, 1), "api_rate_per_sec": (float, 0), "api_max_retries": (int, 0),
+    "llm_cache_max_mb": (float, 0), "llm_cache_ttl_days": (float, 0),
+    "sink_batch_rows": (int, 1), "sink_flush_seconds": (float, 0),
+    "heuristic_workers": (int, 0), "baseline_batch_size": (int, 1), "baseline_n_process": (int, 1),
+    "eval_workers": (int, 0), "eval_bootstrap": (int, 0), "ingest_batch_size": (int, 1),
+    "summary_long_chars": (int, 0), "summary_chunk_chars": (int, 1), "summary_chunk_overlap": (int, 0),
+    "vertex_pack_tokens": (int, 0), "vertex_pack_max_docs": (int, 1), "vertex_pack_chars_per_token": (float, 1),
+    "dedup_threshold": (float, 0, 1.0), "dedup_num_perm": (int, 1), "dedup_shingle_size": (int, 1),
+    "shards": (int, 0), "shard_workers": (int, 1), "shard_lease_seconds": (float, 1),
+    "vector_dim": (int, 1), "vector_nprobe": (int, 1), "vector_chunk_chars": (int, 1), "vector_chunk_overlap": (int, 0),
+    "agent_service_port": (int, 0), "agent_cache_size": (int, 1), "agent_reload_seconds": (float, 0),
+}
+_CHOICES = {"data_source": ("local", "bq_public"), "result_sink": ("auto", "bigquery", "sqlite", "none")}
+
+def validate_cfg(cfg: dict) -> dict:
+    errors = []
+    if not isinstance(cfg.get("local_mode"), bool):
+        errors.append(f"local_mode must be true/false, got {cfg.get('local_mode')!r}")
+    for k, (typ, lo, *hi) in _NUMERIC.items():
+        v = cfg.get(k)
+        if v is None:
+            continue
+        if isinstance(v, bool) or not isinstance(v, (int, float)) or (typ is int and not isinstance(v, int)):
+            errors.append(f"{k} must be {typ.__name__}, got {v!r}")
+        elif v < lo:
+            errors.append(f"{k} must be >= {lo}, got {v!r}")
+        elif hi and v > hi[0]:
+            errors.append(f"{k} must be <= {hi[0]}, got {v!r}")
+    for k, allowed in _CHOICES.items():
+        if k in cfg and cfg[k] not in allowed:
+            errors.append(f"{k} must be one of {', '.join(allowed)}, got {cfg[k]!r}")
+    if cfg.get("local_mode") is False:
+        errors += [f"{k} is required when local_mode is false" for k in ("project_id", "bq_dataset") if not cfg.get(k)]
+    if errors:
+        raise ValueError(f"invalid config {CFG_PATH.name}: " + "; ".join(errors))
+    return cfg
+
+@functools.lru_cache(maxsize=1)
+def _load() -> dict:
     with open(CFG_PATH, "r") as f:
         cfg = yaml.safe_load(f)
     if os.getenv("LOCAL_MODE") is not None:
         cfg["local_mode"] = os.getenv("LOCAL_MODE","true").lower() == "true"
-    for k in ["project_id","location","gcs_bucket","gcs_prefix","bq_dataset","vertex_location"]:
+    for k in ENV_KEYS:
         v = os.getenv(k.upper())
         if v:
             cfg[k] = v
-    return cfg
+    return validate_cfg(cfg)
+
+def load_cfg() -> dict:
+    # Parsed and validated once per process; callers get their own copy to adjust
+    return copy.deepcopy(_load())
+
+def reload_cfg() -> dict:
+    # After editing config.yaml or the env overrides in a long-running process
+    _load.cache_clear()
+    return load_cfg()
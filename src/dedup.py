@@ -0,0 +1,220 @@
+# Author: Kartheek Nagelli
+from __future__ import annotations
+import functools, pathlib, tempfile
+import numpy as np
+import pandas as pd
+from config import load_cfg
+from utils.data import ART_DIR, ParquetDataset, iter_batches, open_artifact, open_corpus, write_artifact
+from utils.metrics import inc, timed_batches
+from utils.result_store import stage_version
+from preprocess import text_offsets
+from logs import get_logger
+
+# MinHash over hashed word shingles, LSH banding to find candidate pairs, and a check of the
+# estimated Jaccard similarity before a document is marked as a duplicate of an earlier one.
+# All hashing is uint64 arithmetic that wraps mod 2**64 (numpy arrays never warn on overflow).
+P = np.uint64(0x100000001B3)   # odd, so invertible mod 2**64
+P_INV = np.uint64(pow(0x100000001B3, -1, 2**64))
+Q = np.uint64(0x9E3779B97F4A7C15)
+COLS = ["doc_id", "filename", "canonical_id", "similarity"]
+CORPUS_COLUMNS = ["doc_id", "filename", "text_clean", "tok_offsets"]
+
+def _mix(x: np.ndarray) -> np.ndarray:
+    # splitmix64 finalizer
+    x = x ^ (x >> np.uint64(30))
+    x = x * np.uint64(0xBF58476D1CE4E5B9)
+    x = x ^ (x >> np.uint64(27))
+    x = x * np.uint64(0x94D049BB133111EB)
+    return x ^ (x >> np.uint64(31))
+
+def shingle_hashes(texts: list[str], tok_offsets: list, k: int = 5) -> tuple[np.ndarray, np.ndarray]:
+    """uint64 hashes of every k-token shingle (case-folded) and the batch-local doc index of each,
+    sorted by doc. Documents with fewer than k tokens contribute their single tokens instead."""
+    if not texts:
+        return np.zeros(0, np.uint64), np.zeros(0, np.int64)
+    lens = np.fromiter(map(len, texts), dtype=np.int64, count=len(texts))
+    starts = np.r_[0, np.cumsum(lens + 1)[:-1]]
+    cp = np.frombuffer("\n".join(texts).encode("utf-32-le"), dtype=np.uint32).astype(np.uint64)
+    cp = np.where((cp | np.uint64(32)) - np.uint64(97) < np.uint64(26), cp | np.uint64(32), cp)
+    # Polynomial prefix hash: token [s, e) hashes to (H[e] - H[s]) * P**-s, independent of position
+    pw = np.cumprod(np.r_[np.uint64(1), np.full(len(cp), P, np.uint64)])
+    ipw = np.cumprod(np.r_[np.uint64(1), np.full(len(cp), P_INV, np.uint64)])
+    H = np.r_[np.uint64(0), np.cumsum(cp * pw[:-1])]
+    n_tok = np.fromiter((len(o) // 2 for o in tok_offsets), dtype=np.int64, count=len(texts))
+    doc = np.repeat(np.arange(len(texts)), n_tok)
+    if not len(doc):
+        return np.zeros(0, np.uint64), doc
+    spans = np.concatenate([np.asarray(o, np.int64) for o in tok_offsets]).reshape(-1, 2) + starts[doc][:, None]
+    th = _mix((H[spans[:, 1]] - H[spans[:, 0]]) * ipw[spans[:, 0]])
+
+    T = len(th)
+    if T >= k:
+        sh = th[: T - k + 1].copy()
+        for j in range(1, k):
+            sh = _mix(sh * Q + th[j: T - k + 1 + j])
+        full = doc[: T - k + 1] == doc[k - 1:]
+        sh, sh_doc = sh[full], doc[: T - k + 1][full]
+    else:
+        sh, sh_doc = np.zeros(0, np.uint64), np.zeros(0, np.int64)
+    short = n_tok[doc] < k
+    hashes, docs = np.r_[sh, th[short]], np.r_[sh_doc, doc[short]]
+    order = np.argsort(docs, kind="stable")
+    return hashes[order], docs[order]
+
+@functools.lru_cache(maxsize=8)
+def _perms(num_perm: int, seed: int) -> tuple[np.ndarray, np.ndarray]:
+    rng = np.random.default_rng(seed)
+    a = rng.integers(0, 2**63, num_perm, dtype=np.uint64) * np.uint64(2) + np.uint64(1)  # odd: a bijection
+    return a, rng.integers(0, 2**63, num_perm, dtype=np.uint64)
+
+def minhash(hashes: np.ndarray, docs: np.ndarray, n_docs: int, num_perm: int = 128, seed: int = 1,
+            block: int = 1 << 22) -> tuple[np.ndarray, np.ndarray]:
+    """(signatures uint32 [n_docs, num_perm], has_shingles bool [n_docs]) from shingle_hashes output."""
+    sig = np.zeros((n_docs, num_perm), dtype=np.uint32)
+    valid = np.zeros(n_docs, dtype=bool)
+    if not len(hashes):
+        return sig, valid
+    a, b = _perms(num_perm, seed)
+    seg = np.flatnonzero(np.r_[True, docs[1:] != docs[:-1]])
+    valid[docs[seg]] = True
+    step = max(1, block // len(hashes))  # bounds the [shingles, perms] intermediate
+    for p in range(0, num_perm, step):
+        vals = (hashes[:, None] * a[None, p:p + step] + b[None, p:p + step]) >> np.uint64(32)
+        sig[docs[seg], p:p + step] = np.minimum.reduceat(vals, seg, axis=0)
+    return sig, valid
+
+def lsh_params(threshold: float, num_perm: int) -> tuple[int, int]:
+    # (bands, rows) minimising the false positive + false negative probability mass around threshold
+    s = np.linspace(0, 1, 1001)
+    best, best_err = (1, num_perm), np.inf
+    for bands in range(1, num_perm + 1):
+        for rows in range(1, num_perm // bands + 1):
+            p = 1 - (1 - s ** rows) ** bands
+            err = p[s < threshold].sum() + (1 - p[s >= threshold]).sum()
+            if err < best_err:
+                best, best_err = (bands, rows), err
+    return best
+
+def band_keys(sig: np.ndarray, bands: int, rows: int) -> np.ndarray:
+    keys = np.zeros((len(sig), bands), dtype=np.uint64)
+    for j in range(rows):
+        keys = _mix(keys * Q + sig[:, j::rows][:, :bands].astype(np.uint64))
+    return keys
+
+def cluster(keys: np.ndarray, valid: np.ndarray, sig: np.ndarray, threshold: float,
+            chunk: int = 100_000) -> tuple[np.ndarray, np.ndarray]:
+    """canonical[i]: index of the earliest document i is a near-duplicate of (i itself when none),
+    plus the estimated Jaccard similarity to it. Candidates share an LSH bucket with the lowest
+    index in that bucket, so candidate pairs grow linearly with n rather than quadratically."""
+    n = len(keys)
+    ids = np.flatnonzero(valid)
+    pairs = []
+    for band in range(keys.shape[1]):
+        order = np.argsort(keys[ids, band], kind="stable")  # stable: ascending doc index inside a bucket
+        k, members = keys[ids[order], band], ids[order]
+        pos = np.arange(len(k))
+        head = np.maximum.accumulate(np.where(np.r_[True, k[1:] != k[:-1]], pos, 0))
+        dup = head != pos
+        pairs.append(members[head[dup]] * n + members[dup])
+    pairs = np.unique(np.concatenate(pairs)) if pairs else np.zeros(0, np.int64)
+    a, b = pairs // n, pairs % n
+    sim = np.zeros(len(pairs))
+    for i in range(0, len(pairs), chunk):
+        sim[i:i + chunk] = (sig[a[i:i + chunk]] == sig[b[i:i + chunk]]).mean(axis=1)
+    keep = sim >= threshold
+    a, b, sim = a[keep], b[keep], sim[keep]
+
+    canonical, best = np.arange(n), np.ones(n)
+    # np.unique sorted pairs by (a, b); process by b so each a is settled before it can lead
+    for i in np.lexsort((a, b)).tolist():
+        x, y = int(a[i]), int(b[i])
+        if canonical[y] == y and canonical[x] == x:
+            canonical[y], best[y] = x, sim[i]
+    return canonical, best
+
+def find_duplicates(cfg: dict, data: pd.DataFrame | ParquetDataset) -> pd.DataFrame:
+    """Near-duplicate documents (doc_id, filename, canonical_id, similarity): one row per
+    non-canonical member; extract/summarize compute only canonical docs and copy results."""
+    log = get_logger("dedup")
+    if not cfg.get("dedup", True):
+        return pd.DataFrame(columns=COLS)
+    threshold = float(cfg.get("dedup_threshold", 0.8))
+    num_perm, k = int(cfg.get("dedup_num_perm", 128)), int(cfg.get("dedup_shingle_size", 5))
+    bands, rows = lsh_params(threshold, num_perm)
+    doc_ids, filenames, keys, valid = [], [], [], []
+    with tempfile.TemporaryDirectory() as tmp:
+        # Signatures are spilled to disk and memory-mapped back for pair verification
+        sig_path = pathlib.Path(tmp) / "signatures.u32"
+        with sig_path.open("wb") as fh:
+            for batch in timed_batches(iter_batches(data, int(cfg.get("ingest_batch_size", 1000))), "dedup"):
+                texts = list(batch["text_clean"])
+                toks = list(batch["tok_offsets"]) if "tok_offsets" in batch else text_offsets(texts)[1]
+                sig, ok = minhash(*shingle_hashes(texts, toks, k), len(texts), num_perm)
+                fh.write(sig.tobytes())
+                keys.append(band_keys(sig, bands, rows))
+                valid.append(ok)
+                doc_ids += list(batch["doc_id"])
+                filenames += list(batch["filename"])
+        n = len(doc_ids)
+        if not n:
+            return pd.DataFrame(columns=COLS)
+        sig = np.memmap(sig_path, dtype=np.uint32, mode="r", shape=(n, num_perm))
+        canonical, sim = cluster(np.concatenate(keys), np.concatenate(valid), sig, threshold)
+        del sig
+
+    member = np.flatnonzero(canonical != np.arange(n))
+    doc_ids = np.asarray(doc_ids, dtype=object)
+    out = pd.DataFrame({"doc_id": doc_ids[member], "filename": np.asarray(filenames, dtype=object)[member],
+                        "canonical_id": doc_ids[canonical[member]], "similarity": sim[member]})
+    # Byte-identical docs share a doc_id; never mark a doc_id that is also someone's canonical
+    out = out[~out["doc_id"].isin(set(doc_ids[canonical == np.arange(n)]))].reset_index(drop=True)
+    inc("docs_duplicate", len(out), stage="dedup")
+    log.info(f"{len(out)} of {n} docs are near-duplicates of {out['canonical_id'].nunique()} canonical docs "
+             f"(Jaccard >= {threshold}, {bands} bands x {rows} rows)")
+    return out
+
+class Duplicates:
+    """Lookup over find_duplicates output for stages that compute canonical docs only."""
+
+    def __init__(self, df: pd.DataFrame | None = None):
+        df = pd.DataFrame(columns=COLS) if df is None else df
+        self.skip = set(df["doc_id"])
+        self.members: dict[str, list[tuple[str, str]]] = {}
+        for doc_id, filename, canon in zip(df["doc_id"], df["filename"], df["canonical_id"]):
+            self.members.setdefault(canon, []).append((doc_id, filename))
+
+    def __len__(self) -> int:
+        return len(self.skip)
+
+    def canonical(self, batch: pd.DataFrame) -> pd.DataFrame:
+        return batch[~batch["doc_id"].isin(self.skip)] if self.skip else batch
+
+    def expand(self, rows: list[dict]) -> list[dict]:
+        # Each canonical row followed by a copy per cluster member
+        if not self.members:
+            return rows
+        out = []
+        for r in rows:
+            out.append(r)
+            out += [{**r, "doc_id": d, "filename": f} for d, f in self.members.get(r["doc_id"], ())]
+        return out
+
+def duplicates_version(df: pd.DataFrame) -> str:
+    # Changes whenever cluster membership does: part of sharded extract/summarize run versions
+    return stage_version(*(f"{d}>{c}" for d, c in zip(df["doc_id"], df["canonical_id"])))
+
+def read_duplicates(art_dir: pathlib.Path = ART_DIR) -> pd.DataFrame:
+    # Corpora processed before the dedup stage existed have no artifact: nothing is a duplicate
+    art_dir = pathlib.Path(art_dir)
+    if not any((art_dir / f"duplicates.{ext}").exists() for ext in ("parquet", "csv")):
+        return pd.DataFrame(columns=COLS)
+    return open_artifact("duplicates", art_dir)
+
+def main():
+    cfg = load_cfg()
+    log = get_logger("dedup")
+    p = write_artifact(find_duplicates(cfg, open_corpus(CORPUS_COLUMNS)), "duplicates")
+    log.info(f"Saved artifacts/{p.name}")
+
+if __name__ == "__main__":
+    main()
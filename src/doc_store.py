@@ -0,0 +1,103 @@
+# Author: Kartheek Nagelli
+from __future__ import annotations
+import json, pathlib, threading, typing as t
+from collections import OrderedDict
+import pandas as pd
+from utils.data import ART_DIR, ParquetDataset
+
+class _Indexed:
+    # Whole table in memory behind a hash index on doc_id
+    def __init__(self, df: pd.DataFrame):
+        self.df = df.drop_duplicates("doc_id").reset_index(drop=True)
+        self.index = pd.Index(self.df["doc_id"])
+
+    def get_many(self, doc_ids: list) -> list:
+        pos = self.index.get_indexer(doc_ids)
+        hit = pos[pos >= 0]
+        rows = iter(self.df.iloc[hit].to_dict(orient="records"))
+        return [next(rows) if p >= 0 else None for p in pos]
+
+class _Lazy:
+    # Large parquet tables: fetch misses with a doc_id filter, keep at most cache_size rows
+    def __init__(self, path: pathlib.Path, cache_size: int):
+        self.path = path
+        self.cache_size = cache_size
+        self.lru: OrderedDict = OrderedDict()
+
+    def get_many(self, doc_ids: list) -> list:
+        misses = [i for i in dict.fromkeys(doc_ids) if i not in self.lru]
+        if misses:
+            fetched = pd.read_parquet(self.path, filters=[("doc_id", "in", misses)])
+            for rec in fetched.drop_duplicates("doc_id").to_dict(orient="records"):
+                self.lru[rec["doc_id"]] = rec
+        out = []
+        for i in doc_ids:
+            rec = self.lru.get(i)
+            if rec is not None:
+                self.lru.move_to_end(i)
+            out.append(rec)
+        while len(self.lru) > self.cache_size:
+            self.lru.popitem(last=False)
+        return out
+
+class DocStore:
+    """doc_id-keyed access to pipeline artifacts (corpus_clean, summaries, extractions).
+    Each table is loaded at most once; tables over max_rows_in_memory are read lazily through an LRU."""
+
+    def __init__(self, art_dir: pathlib.Path = ART_DIR, cache_size: int = 4096, max_rows_in_memory: int = 200_000):
+        self.art_dir = pathlib.Path(art_dir)
+        self.cache_size = cache_size
+        self.max_rows_in_memory = max_rows_in_memory
+        self.sources: dict[str, t.Any] = {}
+        self.tables: dict[str, t.Any] = {}
+        self.lock = threading.Lock()
+
+    @classmethod
+    def from_frames(cls, art_dir: pathlib.Path = ART_DIR, **frames) -> DocStore:
+        store = cls(art_dir)
+        store.sources.update({k: v for k, v in frames.items() if v is not None})
+        return store
+
+    def _open(self, name: str):
+        src = self.sources.get(name)
+        if isinstance(src, pd.DataFrame):
+            return _Indexed(src)
+        if isinstance(src, list):
+            return _Indexed(pd.DataFrame(src))
+        p_parq = src.path if isinstance(src, ParquetDataset) else self.art_dir / f"{name}.parquet"
+        if p_parq.exists():
+            import pyarrow.dataset as pds
+            if pds.dataset(p_parq).count_rows() > self.max_rows_in_memory:
+                return _Lazy(p_parq, self.cache_size)
+            return _Indexed(pd.read_parquet(p_parq))
+        p_jsonl = self.art_dir / f"{name}.jsonl"
+        if p_jsonl.exists():
+            return _Indexed(pd.read_json(p_jsonl, lines=True, dtype={"doc_id": str}))
+        p_json = self.art_dir / f"{name}.json"
+        if p_json.exists():
+            return _Indexed(pd.DataFrame(json.loads(p_json.read_text(encoding="utf-8"))))
+        return _Indexed(pd.read_csv(self.art_dir / f"{name}.csv"))
+
+    def _table(self, name: str):
+        with self.lock:
+            if name not in self.tables:
+                self.tables[name] = self._open(name)
+            return self.tables[name]
+
+    def warm(self, *names: str) -> DocStore:
+        # Load tables up front so the first query does not pay for parquet reads
+        for name in names:
+            self._table(name)
+        return self
+
+    def frame(self, name: str) -> pd.DataFrame:
+        table = self._table(name)
+        return table.df if isinstance(table, _Indexed) else pd.read_parquet(table.path)
+
+    def get_many(self, name: str, doc_ids: t.Iterable[str]) -> list[dict | None]:
+        table = self._table(name)
+        with self.lock:
+            return table.get_many(list(doc_ids))
+
+    def get(self, name: str, doc_id: str) -> dict | None:
+        return self.get_many(name, [doc_id])[0]
@@ -0,0 +1,231 @@
+# Author: Kartheek Nagelli
+from __future__ import annotations
+import functools, hashlib, itertools, json, pathlib, re, sqlite3, threading, typing as t
+from collections import Counter
+from logs import get_logger
+
+# Entity -> document postings over extraction rows (extractions.to_row), with per-document
+# sentiment and entity co-occurrence counts, in SQLite so it can be updated batch by batch
+# while extraction streams and queried concurrently (WAL) by the agent.
+DEFAULT_PATH = pathlib.Path(__file__).resolve().parents[1] / "artifacts" / "entity_index.sqlite"
+PAREN_RE = re.compile(r"^(?P<long>.*\S)\s*\((?P<short>[^()]+)\)$")  # "Federal Reserve (Fed)", "MTA (NYCT)"
+SUFFIXES = frozenset({"inc", "corp", "corporation", "co", "ltd", "llc", "plc"})
+TYPES = {"org": "ORGANIZATION", "orgs": "ORGANIZATION", "organization": "ORGANIZATION", "organisation": "ORGANIZATION",
+         "company": "ORGANIZATION", "companies": "ORGANIZATION", "date": "DATE", "percent": "PERCENT"}
+MAX_PAIRS_ENTITIES = 10  # co-occurrence counted among a document's most mentioned entities
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS docs (doc_id TEXT PRIMARY KEY, filename TEXT, sentiment TEXT, confidence REAL, fingerprint TEXT);
+CREATE TABLE IF NOT EXISTS entities (id INTEGER PRIMARY KEY, type TEXT, key TEXT, name TEXT, UNIQUE (type, key));
+CREATE TABLE IF NOT EXISTS postings (entity INTEGER, doc_id TEXT, count INTEGER, PRIMARY KEY (entity, doc_id)) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS postings_doc ON postings (doc_id);
+CREATE TABLE IF NOT EXISTS cooccur (a INTEGER, b INTEGER, n INTEGER, PRIMARY KEY (a, b)) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS cooccur_b ON cooccur (b);
+CREATE TABLE IF NOT EXISTS aliases (alias TEXT, key TEXT, PRIMARY KEY (alias, key)) WITHOUT ROWID;
+"""
+
+def normalize(text: str) -> str:
+    """Lookup key for an entity surface form: case-folded, punctuation and possessives dropped,
+    trailing company suffixes removed ("NVIDIA Corp.'s" -> "nvidia"), "12 %" -> "12%"."""
+    t_ = re.sub(r"\$\s+", "$", re.sub(r"\s+%", "%", text.casefold().replace("’", "'")))
+    words = re.sub(r"[^\w&$%.]+|\.(?!\d)", " ", re.sub(r"'s\b", "", t_)).split()
+    while len(words) > 1 and words[-1] in SUFFIXES:
+        words.pop()
+    return " ".join(words)
+
+@functools.lru_cache(maxsize=1 << 16)
+def surface_keys(text: str) -> tuple[str, str | None]:
+    # (key, alias key): "Federal Reserve (Fed)" indexes under "federal reserve" with alias "fed"
+    m = PAREN_RE.match(text.strip())
+    if m and normalize(m.group("long")) and normalize(m.group("short")):
+        return normalize(m.group("long")), normalize(m.group("short"))
+    return normalize(text), None
+
+def fingerprint(row: dict) -> str:
+    return hashlib.sha256(json.dumps([row.get("filename"), row.get("entities"), row.get("sentiment")],
+                                     sort_keys=True, default=str).encode("utf-8")).hexdigest()[:16]
+
+class EntityIndex:
+    """add() is incremental and idempotent per document: unchanged rows are skipped, changed
+    ones replace the document's postings and co-occurrences. sync() also drops documents that
+    are no longer in the extractions."""
+
+    def __init__(self, path: pathlib.Path = DEFAULT_PATH):
+        self.path = pathlib.Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.conn = sqlite3.connect(self.path, timeout=30, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")  # durable at checkpoints; the index can be rebuilt
+        self.conn.executescript(SCHEMA)
+        self.lock = threading.Lock()  # one connection shared by the agent service's threads
+
+    @staticmethod
+    def exists(path: pathlib.Path = DEFAULT_PATH) -> bool:
+        return pathlib.Path(path).exists()
+
+    def _entity_ids(self, keys: dict[tuple[str, str], str]) -> dict[tuple[str, str], int]:
+        self.conn.executemany("INSERT OR IGNORE INTO entities (type, key, name) VALUES (?,?,?)",
+                              [(ty, k, name) for (ty, k), name in keys.items()])
+        ids, todo = {}, list(keys)
+        for i in range(0, len(todo), 400):  # two bound parameters per key
+            chunk = todo[i:i + 400]
+            ids.update(((ty, k), e) for e, ty, k in self.conn.execute(
+                f"SELECT id, type, key FROM entities WHERE (type, key) IN (VALUES {','.join(['(?,?)'] * len(chunk))})",
+                [x for key in chunk for x in key]))
+        return ids
+
+    def _remove(self, doc_ids: list[str]) -> None:
+        for doc_id in doc_ids:
+            ents = [e for (e,) in self.conn.execute(
+                "SELECT entity FROM postings WHERE doc_id=? ORDER BY count DESC, entity LIMIT ?", (doc_id, MAX_PAIRS_ENTITIES))]
+            self.conn.executemany("UPDATE cooccur SET n = n - 1 WHERE a=? AND b=?", itertools.combinations(sorted(ents), 2))
+            self.conn.execute("DELETE FROM postings WHERE doc_id=?", (doc_id,))
+        self.conn.execute("DELETE FROM cooccur WHERE n <= 0")
+        self.conn.executemany("DELETE FROM docs WHERE doc_id=?", [(d,) for d in doc_ids])
+
+    def add(self, rows: t.Iterable[dict]) -> dict:
+        """Index extraction rows ({doc_id, filename, entities[{type,text}], sentiment{label,confidence}})."""
+        rows = list({str(r["doc_id"]): r for r in rows}.items())
+        stats = {"added": 0, "updated": 0, "unchanged": 0}
+        with self.lock, self.conn:
+            old = {}
+            for i in range(0, len(rows), 500):
+                chunk = [d for d, _ in rows[i:i + 500]]
+                old.update(self.conn.execute(f"SELECT doc_id, fingerprint FROM docs WHERE doc_id IN "
+                                             f"({','.join('?' * len(chunk))})", chunk))
+            todo = []
+            for doc_id, r in rows:
+                fp = fingerprint(r)
+                if old.get(doc_id) == fp:
+                    stats["unchanged"] += 1
+                    continue
+                stats["updated" if doc_id in old else "added"] += 1
+                todo.append((doc_id, r, fp))
+            self._remove([d for d, _, _ in todo if d in old])
+
+            # Mentions per (type, key); the first surface form seen names the entity
+            per_doc, names, aliases = [], {}, set()
+            for doc_id, r, _ in todo:
+                counts: dict[tuple[str, str], int] = {}
+                for e in r.get("entities") or ():
+                    ty = str(e.get("type") or "OTHER").upper()
+                    key, alias = surface_keys(str(e.get("text") or ""))
+                    if not key:
+                        continue
+                    counts[ty, key] = counts.get((ty, key), 0) + 1
+                    names.setdefault((ty, key), str(e["text"]).strip())
+                    if alias and alias != key:
+                        aliases.add((alias, key))
+                per_doc.append(counts)
+            ids = self._entity_ids(names)
+            self.conn.executemany("INSERT OR IGNORE INTO aliases VALUES (?,?)", sorted(aliases))
+            postings, pairs = [], Counter()
+            for (doc_id, _, _), counts in zip(todo, per_doc):
+                ranked = sorted(((ids[k], n) for k, n in counts.items()), key=lambda x: (-x[1], x[0]))
+                postings += [(e, doc_id, n) for e, n in ranked]
+                pairs.update(itertools.combinations(sorted(e for e, _ in ranked[:MAX_PAIRS_ENTITIES]), 2))
+            self.conn.executemany("INSERT INTO postings VALUES (?,?,?)", postings)
+            self.conn.executemany("INSERT INTO cooccur VALUES (?,?,?) ON CONFLICT (a, b) DO UPDATE SET n = n + excluded.n",
+                                  [(a, b, n) for (a, b), n in sorted(pairs.items())])
+            self.conn.executemany("INSERT OR REPLACE INTO docs VALUES (?,?,?,?,?)", [
+                (doc_id, r.get("filename"), (r.get("sentiment") or {}).get("label"),
+                 (r.get("sentiment") or {}).get("confidence"), fp) for doc_id, r, fp in todo])
+        return stats
+
+    def sync(self, batches: t.Iterable[list[dict]]) -> dict:
+        # Full pass over the current extractions: index changes, then drop documents not seen
+        stats, seen = {"added": 0, "updated": 0, "unchanged": 0}, set()
+        for rows in batches:
+            seen.update(str(r["doc_id"]) for r in rows)
+            for k, v in self.add(rows).items():
+                stats[k] += v
+        with self.lock, self.conn:
+            gone = [d for (d,) in self.conn.execute("SELECT doc_id FROM docs") if d not in seen]
+            self._remove(gone)
+        return {**stats, "removed": len(gone)}
+
+    def _resolve(self, entity: str, type_: str | None) -> list[int]:
+        # Entity ids for a query string: its key, plus the long/short forms it is an alias of/for
+        keys = {surface_keys(entity)[0]}
+        for (k,) in self.conn.execute("SELECT key FROM aliases WHERE alias IN (?) UNION SELECT alias FROM aliases "
+                                      "WHERE key IN (?)", (next(iter(keys)),) * 2):
+            keys.add(k)
+        keys = sorted(keys)
+        sql = f"SELECT id FROM entities WHERE key IN ({','.join('?' * len(keys))})"
+        return [i for (i,) in self.conn.execute(sql + (" AND type=?" if type_ else ""), [*keys, *([type_] if type_ else [])])]
+
+    def known(self, entity: str, type_: str | None = None) -> bool:
+        with self.lock:
+            return bool(self._resolve(entity, type_))
+
+    def lookup(self, entity: str, type_: str | None = None, sentiment: str | None = None, k: int = 50) -> list[dict]:
+        """Documents mentioning entity (any surface form), most mentions first; optionally only
+        documents whose overall sentiment label is `sentiment`."""
+        with self.lock:
+            ids = self._resolve(entity, type_)
+            if not ids:
+                return []
+            rows = self.conn.execute(
+                f"SELECT p.doc_id, d.filename, SUM(p.count) AS mentions, d.sentiment, d.confidence FROM postings p "
+                f"JOIN docs d ON d.doc_id = p.doc_id WHERE p.entity IN ({','.join('?' * len(ids))})"
+                + (" AND d.sentiment = ?" if sentiment else "") +
+                " GROUP BY p.doc_id ORDER BY mentions DESC, d.confidence DESC, p.doc_id LIMIT ?",
+                [*ids, *([sentiment] if sentiment else []), k]).fetchall()
+        return [{"doc_id": d, "filename": f, "mentions": n, "sentiment": s, "confidence": c} for d, f, n, s, c in rows]
+
+    def related(self, entity: str, type_: str | None = None, k: int = 10) -> list[dict]:
+        # Entities most often extracted from the same documents
+        with self.lock:
+            ids = self._resolve(entity, type_)
+            if not ids:
+                return []
+            q = ",".join("?" * len(ids))
+            rows = self.conn.execute(
+                f"SELECT e.name, e.type, SUM(c.n) AS n FROM (SELECT b AS other, n FROM cooccur WHERE a IN ({q}) "
+                f"UNION ALL SELECT a, n FROM cooccur WHERE b IN ({q})) c JOIN entities e ON e.id = c.other "
+                f"WHERE e.id NOT IN ({q}) GROUP BY e.id ORDER BY n DESC, e.name LIMIT ?", [*ids, *ids, *ids, k]).fetchall()
+        return [{"entity": name, "type": ty, "documents": n} for name, ty, n in rows]
+
+    def close(self) -> None:
+        self.conn.close()
+
+def parse_query(query: str) -> dict | None:
+    """{"entity", "type", "sentiment"} for questions like 'Which documents mention ORG Acme with
+    negative sentiment?': a quoted phrase, else the capitalised run after the first word. None
+    when no entity is named."""
+    words = re.findall(r"[\w&.'-]+", query.lower())
+    type_ = next((TYPES[w] for w in words if w in TYPES), None)
+    sentiment = next((w for w in words if w in ("positive", "negative", "neutral")), None)
+    quoted = re.search(r"[\"“]([^\"”]+)[\"”]", query)
+    if quoted:
+        entity = quoted.group(1)
+    else:
+        rest = re.sub(r"\b(?:ORGS?|ORGANI[SZ]ATION|DATE|PERCENT)\b", " ", query.split(None, 1)[1] if " " in query.strip() else "")
+        runs = re.findall(r"(?:\b[A-Z$][\w&.'-]*(?:\s+\([A-Z][\w.]*\))?\s*)+", rest)
+        entity = max((r.strip(" .,;:?!") for r in runs), key=len, default="")
+    return {"entity": entity, "type": type_, "sentiment": sentiment} if entity.strip() else None
+
+def extraction_batches(ext, batch_size: int = 1000) -> t.Iterator[list[dict]]:
+    # The extract stage's output: the streamed artifact's path, or in-memory records/rows
+    from extractions import iter_extractions, to_row
+    if isinstance(ext, pathlib.Path):
+        yield from iter_extractions(ext.parent, ["doc_id", "filename", "entities", "sentiment"], batch_size)
+        return
+    for i in range(0, len(ext), batch_size):
+        yield [r if "entities" in r else to_row(r) for r in ext[i:i + batch_size]]
+
+def build_entity_index(path: pathlib.Path, batches: t.Iterable[list[dict]]) -> pathlib.Path:
+    idx = EntityIndex(path)
+    try:
+        stats = idx.sync(batches)
+    finally:
+        idx.close()
+    get_logger("entity_index").info(f"Entity index {pathlib.Path(path).name}: {stats}")
+    return pathlib.Path(path)
+
+def main():
+    from extractions import iter_extractions
+    build_entity_index(DEFAULT_PATH, iter_extractions(columns=["doc_id", "filename", "entities", "sentiment"]))
+
+if __name__ == "__main__":
+    main()
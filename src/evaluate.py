@@ -2,30 +2,38 @@
 from __future__ import annotations
 import pathlib, pandas as pd
 from config import load_cfg
+from utils.data import ART_DIR, read_artifact, write_artifact
+from rouge import evaluate_systems
 from logs import get_logger
 
-try:
-    from rouge_score import rouge_scorer
-except Exception:
-    rouge_scorer = None
+def _systems(cfg: dict, sums: pd.DataFrame, art: pathlib.Path) -> dict:
+    # The pipeline's own summaries plus any baseline summaries written by evaluate_baselines
+    systems = {"heuristic" if cfg.get("local_mode") else "vertex": sums[["doc_id", "summary"]]}
+    if (art / "baselines_eval.parquet").exists() or (art / "baselines_eval.csv").exists():
+        base = read_artifact("baselines_eval", art)
+        systems["textrank"] = base[["doc_id", "textrank_summary"]].rename(columns={"textrank_summary": "summary"})
+    return systems
 
-def main():
-    cfg = load_cfg()
+def evaluate_summaries(cfg: dict, sums: pd.DataFrame, art: pathlib.Path = ART_DIR) -> dict:
     log = get_logger("evaluate")
-    art = pathlib.Path(__file__).resolve().parents[1] / "artifacts"
-    p_parq = art / "summaries.parquet"
-    p_csv = art / "summaries.csv"
-    sums = pd.read_parquet(p_parq) if p_parq.exists() else pd.read_csv(p_csv)
-    sums["len_chars"] = sums["summary"].str.len()
-    log.info("Summary length stats:\n" + str(sums["len_chars"].describe()))
+    stats = sums["summary"].str.len().describe()
+    log.info("Summary length stats:\n" + str(stats))
 
+    report = pd.DataFrame()
     ref_path = art / "references.parquet"
-    if ref_path.exists() and rouge_scorer is not None:
-        refs = pd.read_parquet(ref_path)
-        df = sums.merge(refs, on="doc_id", how="inner")
-        scorer = rouge_scorer.RougeScorer(["rouge1","rougeL"], use_stemmer=True)
-        scores = [scorer.score(r["reference"], r["summary"]) for _, r in df.iterrows()]
-        log.info("Sample ROUGE: " + str(scores[:3]))
+    if ref_path.exists():
+        per_doc, report = evaluate_systems(_systems(cfg, sums, art), pd.read_parquet(ref_path),
+                                           workers=int(cfg.get("eval_workers") or 0) or None,
+                                           n_boot=int(cfg.get("eval_bootstrap", 1000)))
+        write_artifact(per_doc, "rouge_scores", art)
+        write_artifact(report, "rouge_report", art)
+        log.info(f"ROUGE F1 over {per_doc['doc_id'].nunique()} referenced docs:\n"
+                 + report[["system", "metric", "n", "mean", "ci_low", "ci_high"]].round(4).to_string(index=False))
+    return {"len_chars": stats.to_dict(), "rouge": report.to_dict(orient="records")}
+
+def main():
+    cfg = load_cfg()
+    evaluate_summaries(cfg, read_artifact("summaries"))
 
 if __name__ == "__main__":
     main()
@@ -1,14 +1,23 @@
 # Author: Kartheek Nagelli
 from __future__ import annotations
-import json, pathlib, pandas as pd
+import json, os, pathlib, numpy as np, pandas as pd
 import re
+from concurrent.futures import ProcessPoolExecutor
+from itertools import compress, takewhile
 from config import load_cfg
-from utils.gcp import get_language_client, init_vertex
+from utils.gcp import ApiExecutor, get_generative_model, get_language_client, sdk_available
+from utils.data import ART_DIR, ParquetDataset, iter_batches, open_corpus
+from preprocess import clean_text, sentences, text_offsets
+from utils.metrics import timed_batches
+from utils.llm_cache import LLMCache, cached_generate
+from utils.result_store import ResultStore, cached_map, content_hash, stage_version
+from utils.packing import JSON_OUTPUT, pack_documents, pack_kwargs, packed_map
+from utils.sinks import result_sink
+from utils.shards import run_sharded
+from extractions import ExtractionWriter, iter_extractions, schema, to_row
+from entity_index import DEFAULT_PATH, EntityIndex, build_entity_index
+from dedup import Duplicates, duplicates_version, read_duplicates
 from logs import get_logger
-try:
-    from vertexai.generative_models import GenerativeModel
-except Exception:
-    GenerativeModel = None
 
 PROMPT_TEMPLATE = """
 You are a precise information extraction assistant. Given a document, extract:
@@ -21,69 +30,115 @@ Return STRICT JSON with fields: entities{{type, text}}, metrics{{name, value}},
 Document:\n```{doc}```
 """
 
+PACK_TEMPLATE = """
+You are a precise information extraction assistant. For EACH document below (each wrapped in
+<doc id="..."> tags) extract:
+- entities (person, org, location, date, money/percent if stated),
+- key metrics (accuracy, uptime, latency if present),
+- overall sentiment (positive/neutral/negative) with confidence 0-1,
+- core issues/risks in a bullet list.
+
+Return STRICT JSON: an array with one object per document, with fields
+doc_id, entities{{type, text}}, metrics{{name, value}}, sentiment{{label, confidence}}, issues[].
+Documents:\n{docs}
+"""
+
 def extract_with_nl_api(client, text: str) -> dict:
+    # One annotateText round trip returns both entities and document sentiment
     doc = {"content": text, "type_": 1}
-    ent_resp = client.analyze_entities(request={"document": doc})
-    sent_resp = client.analyze_sentiment(request={"document": doc})
+    resp = client.annotate_text(request={"document": doc, "features": {
+        "extract_entities": True, "extract_document_sentiment": True}})
     ents = []
     keep = {"PERSON","ORGANIZATION","LOCATION","DATE","PRICE","PERCENT"}
-    for e in ent_resp.entities:
+    for e in resp.entities:
         t = e.type_.name
         if t in keep:
             ents.append({"type": t, "text": e.name})
-    sent = sent_resp.document_sentiment
+    sent = resp.document_sentiment
     return {
         "entities": ents,
         "sentiment": {"label": "positive" if sent.score>0.25 else "negative" if sent.score<-0.25 else "neutral", "confidence": min(1.0, abs(sent.score))}
     }
 
-def extract_with_vertex(text: str) -> dict:
-    cfg = load_cfg()
-    init_vertex(cfg)
-    model = GenerativeModel(cfg.get("vertex_model_extraction","gemini-1.5-pro"))
-    out = model.generate_content(PROMPT_TEMPLATE.format(doc=text)).text
+def extract_with_vertex(text: str, model=None, cache: LLMCache | None = None, model_name: str = "gemini-1.5-pro") -> dict:
+    if model is None:
+        cfg = load_cfg()
+        model_name = cfg.get("vertex_model_extraction","gemini-1.5-pro")
+        model = get_generative_model(cfg, model_name)
+    out = cached_generate(cache, model_name, PROMPT_TEMPLATE, text,
+                          lambda: model.generate_content(PROMPT_TEMPLATE.format(doc=text)).text)
     try:
         return json.loads(out)
     except Exception:
         return {"raw": out}
 
+def extract_with_vertex_packed(texts: list[str], model, cache: LLMCache | None = None,
+                               model_name: str = "gemini-1.5-pro") -> str:
+    block = pack_documents(texts)
+    return cached_generate(cache, model_name, PACK_TEMPLATE, block, lambda: model.generate_content(
+        PACK_TEMPLATE.format(docs=block), generation_config=JSON_OUTPUT).text)
+
+def _packed_extraction(item: dict) -> dict | None:
+    if not isinstance(item.get("entities"), list) or not isinstance(item.get("sentiment"), dict):
+        return None
+    return {k: v for k, v in item.items() if k != "doc_id"}
 
-def heuristic_extract(text: str) -> dict:
+# Heuristic (local mode) extraction: every pattern is compiled once at import and the three entity
+# patterns share one alternation, so each document is scanned for entities in a single pass.
+ORG_PAT = r'\b([A-Z][A-Za-z]+(?:\s+[A-Z][A-Za-z]+)+|\b[A-Z]{2,}\b|\b[A-Z]{2,}\s*\([A-Z]{2,}\))'
+MONTHS = ("January","February","March","April","May","June","July","August","September","October","November","December")
+DATE_PAT = r'\b(' + "|".join(MONTHS) + r')\b|\bQ[1-4]\b'
+PCT_PAT = r'\b\d+(?:\.\d+)?\s*%|\$\s*\d+(?:\.\d+)?\b'
+# Every alternative starts at a word boundary or "$"; the leading gate rejects mid-word positions early
+ENTITY_RE = re.compile(f"(?:\\b|(?=\\$))(?:(?P<org>{ORG_PAT})|(?P<date>(?i:{DATE_PAT}))|(?P<pct>{PCT_PAT}))")
+DATE_RE = re.compile(DATE_PAT, re.I)
+MONTH_WORDS = frozenset(m.lower() for m in MONTHS)
+POS_WORDS = frozenset({"improved","expanded","positive","higher","better","reliable","support"})
+NEG_WORDS = frozenset({"concern","limitations","risk","crowding","cost","issue"})
+ISSUE_WORDS = frozenset({"concern","issue","risk","limitation","requested","cost"})
+
+def _is_word(ch: str) -> bool:
+    return ch.isalnum() or ch == "_"
+
+def heuristic_extract(text: str, sent_offsets=None, tok_offsets=None) -> dict:
     # Simple keyword/regex-driven IE to work offline in local mode
-    ents = []
-    # Organizations / acronyms / capitalized sequences
-    for m in re.finditer(r'\b([A-Z][A-Za-z]+(?:\s+[A-Z][A-Za-z]+)+|\b[A-Z]{2,}\b|\b[A-Z]{2,}\s*\([A-Z]{2,}\))', text):
-        t = m.group(0).strip()
-        # Trim trailing punctuation
-        t = t.strip(".,;:()")
-        if len(t.split()) <= 6 and t.lower() not in {"the","and"}:
-            ents.append({"type": "ORGANIZATION", "text": t})
-    # Dates / months / quarters
-    for m in re.finditer(r'\b(January|February|March|April|May|June|July|August|September|October|November|December)\b|\bQ[1-4]\b', text, flags=re.I):
-        ents.append({"type": "DATE", "text": m.group(0)})
-    # Percentages / money
-    for m in re.finditer(r'\b\d+(?:\.\d+)?\s*%|\$\s*\d+(?:\.\d+)?\b', text):
-        ents.append({"type": "PERCENT", "text": m.group(0)})
-    # Deduplicate by (type,text)
-    seen = set()
-    dedup = []
-    for e in ents:
-        key = (e["type"], e["text"])
-        if key not in seen:
-            seen.add(key)
-            dedup.append(e)
-    # Sentiment (very rough)
-    pos_words = {"improved","expanded","positive","higher","better","reliable","support"}
-    neg_words = {"concern","limitations","risk","crowding","cost","issue"}
-    tokens = re.findall(r'[a-zA-Z]+', text.lower())
-    pos = sum(t in pos_words for t in tokens)
-    neg = sum(t in neg_words for t in tokens)
+    orgs, dates, pcts = [], [], []
+    for m in ENTITY_RE.finditer(text):
+        if m.lastgroup == "org":
+            # Trim trailing punctuation
+            t = m.group(0).strip().strip(".,;:()")
+            if len(t.split()) <= 6 and t.lower() not in {"the","and"}:
+                orgs.append(t)
+            # A capitalised sequence may contain a month name ("In August Analysts")
+            if not MONTH_WORDS.isdisjoint(t.lower().split()):
+                dates.extend(d.group(0) for d in takewhile(lambda d: d.start() < m.end(), DATE_RE.finditer(text, m.start())))
+        elif m.lastgroup == "date":
+            dates.append(m.group(0))
+        else:
+            pcts.append(m.group(0))
+    # Deduplicate by (type,text), keeping ORGANIZATION, DATE, PERCENT order
+    dedup = list(dict.fromkeys([("ORGANIZATION", t) for t in orgs] + [("DATE", t) for t in dates]
+                               + [("PERCENT", t) for t in pcts]))
+    dedup = [{"type": ty, "text": t} for ty, t in dedup]
+    # Sentences and tokens are sliced from preprocess's offset index rather than re-scanned
+    if sent_offsets is None or tok_offsets is None:
+        text = clean_text(text)
+        (sent_offsets,), (tok_offsets,) = text_offsets([text])
+    # Lowered per token: text.lower() can change length ("İ" -> "i̇") and shift later offsets
+    tk = tok_offsets.tolist()
+    tokens = list(map(str.lower, map(text.__getitem__, map(slice, tk[::2], tk[1::2]))))
+    # Tokens are [A-Za-z]+ runs; an issue word must also stand alone as under r"\b(...)\b", so not
+    # "risk_free" or "cost2" (re's \w is str.isalnum() plus "_")
+    spans = (tk[2 * i:2 * i + 2] for i in compress(range(len(tokens)), map(ISSUE_WORDS.__contains__, tokens)))
+    hit = [s for s, e in spans if not (s and _is_word(text[s - 1])) and not (e < len(text) and _is_word(text[e]))]
+    sents = np.searchsorted(sent_offsets, hit, side="right") - 1 if hit else ()
+    all_sents = sentences(text, sent_offsets) if hit else []
+    issues = [all_sents[i] for i in dict.fromkeys(map(int, sents))]
+    pos = sum(map(POS_WORDS.__contains__, tokens))
+    neg = sum(map(NEG_WORDS.__contains__, tokens))
     score = (pos - neg) / max(1, (pos + neg))
     label = "positive" if score > 0.25 else "negative" if score < -0.25 else "neutral"
     conf = min(1.0, abs(score)) if (pos + neg) else 0.3
-    # Issues/risk sentences
-    sents = re.split(r'(?<=[.!?])\s+', text.strip())
-    issues = [s for s in sents if re.search(r'\b(concern|issue|risk|limitation|requested|cost)\b', s, flags=re.I)]
     return {
         "entities": dedup[:20],
         "metrics": [{"name": "percent", "value": m["text"]} for m in dedup if m["type"] == "PERCENT"][:5],
@@ -91,32 +146,139 @@ def heuristic_extract(text: str) -> dict:
         "issues": issues[:5]
     }
 
+def heuristic_extract_many(texts: list, workers: int | None = None, pool=None,
+                           sent_offsets: list | None = None, tok_offsets: list | None = None) -> list:
+    # Output order always matches input order; small inputs skip the process pool entirely
+    workers = workers or os.cpu_count() or 1
+    if sent_offsets is None or tok_offsets is None:
+        sent_offsets = tok_offsets = [None] * len(texts)
+    if pool is None and (workers <= 1 or len(texts) < 64):
+        return list(map(heuristic_extract, texts, sent_offsets, tok_offsets))
+    chunksize = max(1, len(texts) // (workers * 4))
+    if pool is not None:
+        return list(pool.map(heuristic_extract, texts, sent_offsets, tok_offsets, chunksize=chunksize))
+    with ProcessPoolExecutor(max_workers=workers) as ex:
+        return list(ex.map(heuristic_extract, texts, sent_offsets, tok_offsets, chunksize=chunksize))
 
-def main():
-    cfg = load_cfg()
-    log = get_logger("extract")
-    art = pathlib.Path(__file__).resolve().parents[1] / "artifacts"
-    p_parq = art / "corpus_clean.parquet"
-    p_csv = art / "corpus_clean.csv"
-    df = pd.read_parquet(p_parq) if p_parq.exists() else pd.read_csv(p_csv)
 
+def extract_backend(cfg: dict, nl=None) -> str | None:
+    if nl:
+        return "nl_api"
+    if cfg.get("local_mode"):
+        return "heuristic"
+    if sdk_available("vertexai"):
+        return "vertex_extraction"
+    return None
+
+def extract_version(cfg: dict, backend: str | None) -> str:
+    if backend == "vertex_extraction":
+        packed = (PACK_TEMPLATE,) if pack_kwargs(cfg, PACK_TEMPLATE) else ()
+        return stage_version(backend, cfg.get("vertex_model_extraction","gemini-1.5-pro"), PROMPT_TEMPLATE, *packed)
+    return stage_version(backend)
+
+def extract_corpus(cfg: dict, df: pd.DataFrame | ParquetDataset, writer: ExtractionWriter | None = None,
+                   dups: pd.DataFrame | None = None):
+    # With a writer, each batch goes straight to disk and the artifact path is returned;
+    # otherwise the records are returned as a list. dups (dedup.find_duplicates): only
+    # canonical docs are extracted, their records are copied to the cluster members
+    log = get_logger("extract")
+    dups = Duplicates(dups)
     results = []
+    n_docs = 0
     nl = get_language_client(cfg) if cfg.get("use_nl_api", True) and not cfg.get("local_mode") else None
+    backend = extract_backend(cfg, nl)
+    if backend == "nl_api":
+        fn = lambda text: extract_with_nl_api(nl, text)
+    elif backend == "vertex_extraction":
+        model_name = cfg.get("vertex_model_extraction","gemini-1.5-pro")
+        model = get_generative_model(cfg, model_name)
+        llm_cache = LLMCache.from_cfg(cfg)
+        fn = lambda text: extract_with_vertex(text, model, llm_cache, model_name)
+        pack = pack_kwargs(cfg, PACK_TEMPLATE)
+    # Heuristic extraction is cheaper than a store lookup; only API backends are cached
+    api = backend in ("nl_api", "vertex_extraction")
+    store = ResultStore.from_cfg(cfg) if api else None
+    ex = ApiExecutor.from_cfg(cfg, name=backend) if api else None
+    if backend == "vertex_extraction" and pack:
+        compute = lambda xs: packed_map(ex, xs, fn, lambda ys: extract_with_vertex_packed(
+            ys, model, llm_cache, model_name), _packed_extraction, **pack)
+    else:
+        compute = lambda xs: ex.map(fn, xs, keys=[content_hash(x) for x in xs])
+    version = extract_version(cfg, backend)
+    n_computed = 0
+    workers = int(cfg.get("heuristic_workers") or os.cpu_count() or 1)
+    pool = None
+    sink = result_sink(cfg, "bq_table_ie")  # uploads in the background while later batches compute
 
-    for _, row in df.iterrows():
-        text = row["text_clean"]
-        rec = {"doc_id": row["doc_id"], "filename": row["filename"]}
-        if nl:
-            rec["nl_api"] = extract_with_nl_api(nl, text)
-        elif cfg.get("local_mode"):
-            rec["heuristic"] = heuristic_extract(text)
-        elif GenerativeModel is not None:
-            rec["vertex_extraction"] = extract_with_vertex(text)
-        results.append(rec)
-
-    out = pathlib.DataFrame(results) if False else None  # keep variable for readability
-    (art / "extractions.json").write_text(json.dumps(results, indent=2), encoding="utf-8")
-    log.info(f"Wrote {len(results)} extractions to artifacts/extractions.json")
+    for batch in timed_batches(iter_batches(df, int(cfg.get("ingest_batch_size", 1000))), "extract"):
+        batch = dups.canonical(batch)
+        texts = list(batch["text_clean"])
+        if backend is None:
+            out = [None] * len(batch)
+        elif backend == "heuristic":
+            if pool is None and workers > 1 and len(texts) >= 64:
+                pool = ProcessPoolExecutor(max_workers=workers)  # one pool for all batches
+            index = (list(batch["sent_offsets"]), list(batch["tok_offsets"])) if "tok_offsets" in batch else (None, None)
+            out = heuristic_extract_many(texts, workers, pool, *index)
+        else:
+            out, n = cached_map(store, "extract", version, texts, compute)
+            n_computed += n
+        errors = {f["key"]: f["error"] for f in ex.failures} if ex else {}
+        start, recs = len(results), []
+        for doc_id, filename, text, res in zip(batch["doc_id"], batch["filename"], texts, out):
+            rec = {"doc_id": doc_id, "filename": filename}
+            if backend is not None:
+                rec[backend] = res
+            if res is None and api:
+                rec["error"] = errors.get(content_hash(text), "no result")
+            recs.append(rec)
+        results += dups.expand(recs)
+        n_docs += len(batch)
+        if sink is not None:
+            sink.write(to_row(r) for r in results[start:] if "error" not in r)
+        if writer is not None:
+            writer.write(results)
+            results = []
+    if pool is not None:
+        pool.shutdown()
+    if len(dups):
+        log.info(f"Extraction: {len(dups)} near-duplicate docs copied from their canonical doc")
+    if sink is not None:
+        sink.close()
+        log.info(f"Upserted {sink.n_rows} extractions into {sink.table} ({sink.failed} rows failed)")
+    if api:
+        log.info(f"Extraction ({backend}): computed {n_computed}, reused {n_docs - n_computed} from result store; "
+                 f"{ex.stats['calls']} API calls, {ex.stats['retries']} retries, {ex.stats['failed']} failed docs")
+        if store is not None:
+            store.close()
+    if backend == "vertex_extraction" and llm_cache is not None:
+        log.info(f"LLM cache (extract): {llm_cache.stats()}")
+    return results if writer is None else writer.close()
+
+CORPUS_COLUMNS = ["doc_id", "filename", "text_clean", "sent_offsets", "tok_offsets"]
+
+def _shard_job(cfg: dict, art_dir: pathlib.Path = ART_DIR):
+    import pyarrow as pa
+    dups = read_duplicates(art_dir)
+    # Heuristic process pools are split between the shard workers running on this machine
+    per_cpu = int(cfg.get("heuristic_workers") or os.cpu_count() or 1)
+    cfg = {**cfg, "heuristic_workers": max(1, per_cpu // int(cfg.get("shard_workers", 1)))}
+    return lambda df: pa.Table.from_pylist([to_row(r) for r in extract_corpus(cfg, df, None, dups)], schema=schema())
+
+def main():
+    cfg = load_cfg()
+    log = get_logger("extract")
+    data, dups = open_corpus(CORPUS_COLUMNS), read_duplicates()
+    if int(cfg.get("shards", 0)) > 0:
+        out, _ = run_sharded(cfg, "extract", data, _shard_job, ART_DIR / "extractions.parquet",
+                             duplicates_version(dups), log=log)
+        build_entity_index(DEFAULT_PATH, iter_extractions(columns=["doc_id", "filename", "entities", "sentiment"]))
+        log.info(f"Wrote {len(out)} extractions -> artifacts/{out.path.name}/ ({len(out.parts())} shards)")
+        return
+    # The entity index is updated batch by batch; entity_index.py also drops docs no longer extracted
+    writer = ExtractionWriter(index=EntityIndex())
+    path = extract_corpus(cfg, data, writer, dups)
+    log.info(f"Wrote {writer.n_rows} extractions -> artifacts/{path.name}")
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,156 @@
+# Author: Kartheek Nagelli
+from __future__ import annotations
+import json, pathlib, typing as t
+from utils.data import ART_DIR, _clear
+
+# One row per document; backend results are normalised into typed nested columns:
+#   doc_id, filename, backend, entities[{type,text}], metrics[{name,value}],
+#   sentiment{label,confidence}, issues[], raw (unparsed model output), error
+def schema():
+    import pyarrow as pa
+    return pa.schema([
+        ("doc_id", pa.string()), ("filename", pa.string()), ("backend", pa.string()),
+        ("entities", pa.list_(pa.struct([("type", pa.string()), ("text", pa.string())]))),
+        ("metrics", pa.list_(pa.struct([("name", pa.string()), ("value", pa.string())]))),
+        ("sentiment", pa.struct([("label", pa.string()), ("confidence", pa.float64())])),
+        ("issues", pa.list_(pa.string())), ("raw", pa.string()), ("error", pa.string()),
+    ])
+
+def _items(x) -> list:
+    return x if isinstance(x, list) else [x] if isinstance(x, dict) else []
+
+def to_row(rec: dict) -> dict:
+    # rec is an extract_corpus record: {doc_id, filename, <backend>: result, [error]}
+    backend = next((k for k in rec if k not in ("doc_id", "filename", "error")), None)
+    res = rec.get(backend) or {}
+    if not isinstance(res, dict):
+        res = {"raw": res}
+    sent = res.get("sentiment") if isinstance(res.get("sentiment"), dict) else None
+    raw = res.get("raw")
+    return {
+        "doc_id": str(rec["doc_id"]), "filename": rec.get("filename"), "backend": backend,
+        "entities": [{"type": str(e.get("type", "")), "text": str(e.get("text", ""))} for e in _items(res.get("entities"))],
+        "metrics": [{"name": str(m.get("name", "")), "value": str(m.get("value", ""))} for m in _items(res.get("metrics"))],
+        "sentiment": None if sent is None else {"label": sent.get("label"),
+                                                "confidence": float(sent["confidence"]) if sent.get("confidence") is not None else None},
+        "issues": [str(i) for i in res.get("issues") or []],
+        "raw": raw if raw is None or isinstance(raw, str) else json.dumps(raw),
+        "error": rec.get("error"),
+    }
+
+class ExtractionWriter:
+    """Writes extraction records batch by batch: a part-NNNNN.parquet dataset at
+    artifacts/extractions.parquet/, or artifacts/extractions.jsonl when pyarrow is missing.
+    index (an entity_index.EntityIndex) is updated with every batch and closed with the writer."""
+
+    def __init__(self, art_dir: pathlib.Path = ART_DIR, index=None):
+        art_dir = pathlib.Path(art_dir)
+        self.index = index
+        art_dir.mkdir(parents=True, exist_ok=True)
+        try:
+            import pyarrow  # noqa: F401
+            self.path = art_dir / "extractions.parquet"
+        except ImportError:
+            self.path = art_dir / "extractions.jsonl"
+        for stale in ("extractions.parquet", "extractions.jsonl"):
+            _clear(art_dir / stale)
+        self.n_parts = self.n_rows = 0
+        if self.path.suffix == ".parquet":
+            self.path.mkdir()
+        else:
+            self._fh = self.path.open("w", encoding="utf-8")
+
+    def write(self, records: list) -> None:
+        if not records:
+            return
+        rows = [to_row(r) for r in records]
+        if self.path.suffix == ".parquet":
+            import pyarrow as pa, pyarrow.parquet as pq
+            pq.write_table(pa.Table.from_pylist(rows, schema=schema()), self.path / f"part-{self.n_parts:05d}.parquet")
+        else:
+            self._fh.writelines(json.dumps(r) + "\n" for r in rows)
+        if self.index is not None:
+            self.index.add(rows)
+        self.n_parts += 1
+        self.n_rows += len(rows)
+
+    def close(self) -> pathlib.Path:
+        if self.path.suffix == ".jsonl":
+            self._fh.close()
+        if self.index is not None:
+            self.index.close()
+        return self.path
+
+def _get(row: dict, col: str):
+    for part in col.split("."):
+        row = row.get(part) if isinstance(row, dict) else None
+    return row
+
+# Nulls never match, as with the pyarrow filter expressions
+_OPS = {"=": lambda a, b: a == b, "==": lambda a, b: a == b, "!=": lambda a, b: a != b,
+        "<": lambda a, b: a < b, "<=": lambda a, b: a <= b, ">": lambda a, b: a > b, ">=": lambda a, b: a >= b,
+        "in": lambda a, b: a in b, "not in": lambda a, b: a not in b}
+
+def _match(row: dict, filters) -> bool:
+    for col, op, val in filters or ():
+        a = _get(row, col)
+        if a is None or not _OPS[op](a, val):
+            return False
+    return True
+
+def _expr(filters: list):
+    import pyarrow.dataset as pds
+    expr = None
+    for col, op, val in filters:
+        f = pds.field(*col.split("."))
+        e = f.isin(val) if op == "in" else ~f.isin(val) if op == "not in" else {
+            "=": f == val, "==": f == val, "!=": f != val, "<": f < val, "<=": f <= val, ">": f > val, ">=": f >= val}[op]
+        expr = e if expr is None else expr & e
+    return expr
+
+def _select(rows: t.Iterable[dict], columns: list[str] | None, filters: list[tuple] | None) -> list[dict]:
+    return [row if columns is None else {c: row.get(c) for c in columns} for row in rows if _match(row, filters)]
+
+def read_extractions(art_dir: pathlib.Path = ART_DIR, columns: list[str] | None = None,
+                     filters: list[tuple] | None = None) -> list[dict]:
+    """Extraction rows, optionally projected to `columns` and filtered by AND-ed
+    (column, op, value) tuples; nested fields are dotted, e.g. ("sentiment.label", "=", "negative")."""
+    art_dir = pathlib.Path(art_dir)
+    p_parq, p_jsonl = art_dir / "extractions.parquet", art_dir / "extractions.jsonl"
+    if p_parq.exists():
+        import pyarrow.dataset as pds
+        if not any(p_parq.glob("part-*.parquet")):
+            return []
+        ds = pds.dataset(p_parq, format="parquet")
+        return ds.to_table(columns=columns, filter=_expr(filters) if filters else None).to_pylist()
+    if p_jsonl.exists():
+        with p_jsonl.open(encoding="utf-8") as fh:
+            return _select((json.loads(line) for line in fh), columns, filters)
+    # Legacy single-blob artifact
+    return _select((to_row(r) for r in json.loads((art_dir / "extractions.json").read_text(encoding="utf-8"))),
+                   columns, filters)
+
+def iter_extractions(art_dir: pathlib.Path = ART_DIR, columns: list[str] | None = None,
+                     batch_size: int = 1000) -> t.Iterator[list[dict]]:
+    # read_extractions in batches of rows, streamed from the parquet dataset when there is one
+    p_parq = pathlib.Path(art_dir) / "extractions.parquet"
+    if p_parq.exists():
+        import pyarrow.dataset as pds
+        if any(p_parq.glob("part-*.parquet")):
+            for b in pds.dataset(p_parq, format="parquet").to_batches(columns=columns, batch_size=batch_size):
+                yield b.to_pylist()
+        return
+    rows = read_extractions(art_dir, columns)
+    for i in range(0, len(rows), batch_size):
+        yield rows[i:i + batch_size]
+
+def write_extractions(records: t.Iterable[dict], art_dir: pathlib.Path = ART_DIR, batch_size: int = 1000) -> pathlib.Path:
+    writer = ExtractionWriter(art_dir)
+    batch = []
+    for rec in records:
+        batch.append(rec)
+        if len(batch) >= batch_size:
+            writer.write(batch)
+            batch = []
+    writer.write(batch)
+    return writer.close()
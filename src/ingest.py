@@ -1,20 +1,27 @@
 # Author: Kartheek Nagelli
 from __future__ import annotations
-import pathlib, hashlib
+import hashlib, pathlib, typing as t
 import pandas as pd
 from config import load_cfg
 from utils.gcp import get_bq_client
-from utils.data import list_local_docs, ensure_gcs_bucket
+from utils.data import (ART_DIR, DatasetWriter, ParquetDataset, ensure_gcs_bucket,
+                        compact_frame, iter_local_docs, list_local_docs, write_artifact)
+from utils.metrics import inc, timed_batches
 from logs import get_logger
 
 def _hash(s: str) -> str:
     return hashlib.sha256(s.encode("utf-8")).hexdigest()[:16]
 
+def _doc_row(p: pathlib.Path) -> dict:
+    # doc_id is derived from name and content, not mtime, so touching or re-copying a file keeps
+    # its identity; identical files under different names stay separate docs (dedup pairs them)
+    text = p.read_text(encoding="utf-8")
+    return {"doc_id": _hash(p.name + "\0" + text), "filename": p.name, "text": text}
+
 def build_local_corpus_df():
     rows = []
     for p in list_local_docs():
-        text = p.read_text(encoding="utf-8")
-        rows.append({"doc_id": _hash(p.name + str(p.stat().st_mtime)), "filename": p.name, "text": text})
+        rows.append(_doc_row(p))
     return pd.DataFrame(rows)
 
 def build_bq_public_df(cfg):
@@ -23,9 +30,66 @@ def build_bq_public_df(cfg):
     df = job.result().to_dataframe()
     return df[["doc_id","filename","text"]]
 
-def main():
-    cfg = load_cfg()
+def iter_local_batches(batch_size: int) -> t.Iterator[pd.DataFrame]:
+    rows = []
+    for p in iter_local_docs():
+        rows.append(_doc_row(p))
+        if len(rows) >= batch_size:
+            yield pd.DataFrame(rows)
+            rows = []
+    if rows:
+        yield pd.DataFrame(rows)
+
+def iter_bq_batches(cfg: dict, batch_size: int) -> t.Iterator[pd.DataFrame]:
+    # Result pages are fetched lazily, page_size rows at a time
+    bq = get_bq_client(cfg)
+    rows = bq.query(cfg.get("bq_public_query")).result(page_size=batch_size)
+    for df in rows.to_dataframe_iterable():
+        yield df[["doc_id","filename","text"]]
+
+def _corpus_table(cfg: dict):
+    ensure_gcs_bucket(cfg)
+    bq = get_bq_client(cfg)
+    dataset_ref = bq.dataset(cfg["bq_dataset"])
+    try:
+        bq.get_dataset(dataset_ref)
+    except Exception:
+        bq.create_dataset(dataset_ref, exists_ok=True)
+    return bq, f"{bq.project}.{cfg['bq_dataset']}.{cfg['bq_table_corpus']}"
+
+def load_to_bq(df: pd.DataFrame, cfg: dict, log) -> None:
+    bq, table_id = _corpus_table(cfg)
+    bq.load_table_from_dataframe(df, table_id).result()
+    log.info(f"Loaded corpus into BigQuery: {table_id}")
+
+def ingest_stream(cfg: dict, art: pathlib.Path = ART_DIR) -> ParquetDataset:
+    log = get_logger("ingest")
+    batch_size = int(cfg.get("ingest_batch_size", 1000))
+    if cfg.get("data_source","local") == "bq_public" and not cfg.get("local_mode"):
+        batches, source = iter_bq_batches(cfg, batch_size), "BigQuery public dataset (BBC)"
+    else:
+        batches, source = iter_local_batches(batch_size), "local"
+
+    bq = None
+    if not cfg.get("local_mode"):
+        from google.cloud import bigquery
+        bq, table_id = _corpus_table(cfg)
+        job_cfg = bigquery.LoadJobConfig(write_disposition="WRITE_TRUNCATE")
+    writer = DatasetWriter(art / "corpus.parquet")
+    for df in timed_batches(batches, "ingest"):
+        writer.write(df)
+        if bq is not None:
+            bq.load_table_from_dataframe(df, table_id, job_config=job_cfg).result()
+            job_cfg = bigquery.LoadJobConfig(write_disposition="WRITE_APPEND")
+    log.info(f"Streamed {writer.n_rows} {source} docs in {writer.n_parts} batches -> artifacts/corpus.parquet/")
+    if bq is not None:
+        log.info(f"Loaded corpus into BigQuery: {table_id}")
+    return writer.close()
+
+def ingest_corpus(cfg: dict, art: pathlib.Path = ART_DIR) -> pd.DataFrame | ParquetDataset:
     log = get_logger("ingest")
+    if cfg.get("streaming_ingest"):
+        return ingest_stream(cfg, art)
     source = cfg.get("data_source","local")
 
     if source == "bq_public" and not cfg.get("local_mode"):
@@ -34,27 +98,19 @@ def main():
     else:
         df = build_local_corpus_df()
         log.info(f"Loaded {len(df)} local docs")
+    inc("docs_processed", len(df), stage="ingest")
 
     if not cfg.get("local_mode"):
-        ensure_gcs_bucket(cfg)
-        bq = get_bq_client(cfg)
-        dataset_ref = bq.dataset(cfg["bq_dataset"])
-        try:
-            bq.get_dataset(dataset_ref)
-        except Exception:
-            bq.create_dataset(dataset_ref, exists_ok=True)
-        table_id = f"{bq.project}.{cfg['bq_dataset']}.{cfg['bq_table_corpus']}"
-        bq.load_table_from_dataframe(df, table_id).result()
-        log.info(f"Loaded corpus into BigQuery: {table_id}")
-    else:
-        out = pathlib.Path(__file__).resolve().parents[1] / "artifacts"
-        out.mkdir(exist_ok=True)
-        try:
-            df.to_parquet(out / "corpus.parquet")
-            log.info("Saved local artifacts/corpus.parquet")
-        except Exception:
-            df.to_csv(out / "corpus.csv", index=False)
-            log.info("Parquet not available; saved artifacts/corpus.csv")
+        load_to_bq(df, cfg, log)
+    return compact_frame(df)
+
+def main():
+    cfg = load_cfg()
+    log = get_logger("ingest")
+    df = ingest_corpus(cfg)
+    if cfg.get("local_mode") and not cfg.get("streaming_ingest"):
+        p = write_artifact(df, "corpus")
+        log.info(f"Saved local artifacts/{p.name}")
 
 if __name__ == "__main__":
     main()
@@ -2,6 +2,9 @@
 from __future__ import annotations
 import json, logging, os, sys, time
 
+# Anything passed via `extra=` (stage, seconds, docs, ...) becomes a top-level JSON field
+_RESERVED = set(vars(logging.LogRecord("", 0, "", 0, "", (), None))) | {"message", "asctime"}
+
 class JsonFormatter(logging.Formatter):
     def format(self, record: logging.LogRecord) -> str:
         base = {
@@ -11,15 +14,17 @@ class JsonFormatter(logging.Formatter):
             "logger": record.name,
             "module": record.module,
         }
+        base.update({k: v for k, v in vars(record).items() if k not in _RESERVED})
         if record.exc_info:
             base["exc_info"] = self.formatException(record.exc_info)
-        return json.dumps(base)
+        return json.dumps(base, default=str)
 
 def get_logger(name: str, json_logs: bool = False) -> logging.Logger:
     logger = logging.getLogger(name)
     if logger.handlers:
         return logger
     handler = logging.StreamHandler(sys.stdout)
+    json_logs = json_logs or os.getenv("LOG_JSON", "").lower() in ("1", "true")
     handler.setFormatter(JsonFormatter() if json_logs else logging.Formatter("%(asctime)s %(levelname)s %(name)s: %(message)s"))
     logger.addHandler(handler)
     level = os.getenv("LOG_LEVEL","INFO").upper()
@@ -1,22 +1,16 @@
 # Author: Kartheek Nagelli
 from __future__ import annotations
-import subprocess, sys, pathlib
+import json, sys, pathlib
 
 ROOT = pathlib.Path(__file__).resolve().parents[0]
-
-def run_step(name, path):
-    print(f"\n=== {name} ===")
-    r = subprocess.run([sys.executable, str(path)], check=True)
-    return r.returncode
+if str(ROOT) not in sys.path:
+    sys.path.insert(0, str(ROOT))
 
 def main():
-    run_step("Ingest", ROOT/"ingest.py")
-    run_step("Preprocess", ROOT/"preprocess.py")
-    run_step("Extract Entities", ROOT/"extract_entities.py")
-    run_step("Summarize", ROOT/"summarize.py")
-    run_step("Evaluate", ROOT/"evaluate.py")
+    from pipeline import default_pipeline
+    results = default_pipeline().run()
     print("\nAgentic demo (local):")
-    subprocess.run([sys.executable, str(ROOT/"agentic_workflow.py")], check=True)
+    print(json.dumps(results["agent"], indent=2, default=str))
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,165 @@
+# Author: Kartheek Nagelli
+from __future__ import annotations
+import contextlib, pathlib
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from dataclasses import dataclass
+from typing import Any, Callable
+from config import load_cfg
+from utils.data import ART_DIR, BASE, open_artifact, open_corpus, publish_version, write_artifact
+from utils import metrics
+from logs import get_logger
+
+@dataclass
+class Stage:
+    name: str
+    fn: Callable[..., Any]           # fn(cfg, *inputs) -> output
+    inputs: tuple[str, ...] = ()
+    output: str | None = None
+    save: Callable[[Any, pathlib.Path], Any] | None = None
+    load: Callable[[pathlib.Path], Any] | None = None
+
+class Pipeline:
+    """In-process stage DAG: outputs are handed to dependants in memory, independent
+    stages run concurrently, and disk artifacts are written only as checkpoints."""
+
+    def __init__(self, cfg: dict | None = None, art_dir: pathlib.Path = ART_DIR,
+                 checkpoint: bool = True, max_workers: int = 4):
+        self.cfg = load_cfg() if cfg is None else cfg
+        self.art_dir = art_dir
+        self.checkpoint = checkpoint
+        self.max_workers = max_workers
+        self.stages: dict[str, Stage] = {}
+        self.profiler = None  # profiling.Profiler; wraps every stage when set
+        self.log = get_logger("pipeline")
+
+    def add(self, st: Stage) -> Stage:
+        st.output = st.output or st.name
+        self.stages[st.name] = st
+        return st
+
+    def stage(self, name: str, inputs: tuple[str, ...] = (), output: str | None = None, save=None, load=None):
+        def deco(fn):
+            self.add(Stage(name, fn, tuple(inputs), output, save, load))
+            return fn
+        return deco
+
+    def _load(self, artifact: str) -> Any:
+        for st in self.stages.values():
+            if st.output == artifact and st.load is not None:
+                return st.load(self.art_dir)
+        return open_artifact(artifact, self.art_dir)
+
+    def _run_stage(self, st: Stage, args: list) -> Any:
+        self.log.info(f"stage {st.name} started", extra={"stage": st.name})
+        prof = self.profiler.stage(st.name) if self.profiler is not None else contextlib.nullcontext()
+        with metrics.span("stage", stage=st.name) as sp, prof:
+            out = st.fn(self.cfg, *args)
+            if self.checkpoint and st.save is not None:
+                st.save(out, self.art_dir)
+        self.log.info(f"stage {st.name} finished in {sp.seconds:.2f}s",
+                      extra={"stage": st.name, "seconds": round(sp.seconds, 4)})
+        return out
+
+    def _report_metrics(self) -> None:
+        rss = metrics.peak_rss_bytes()
+        metrics.set_gauge("peak_rss_bytes", rss)
+        self.log.info(f"run finished, peak RSS {rss / 2**20:.0f} MiB", extra={"metrics": metrics.REGISTRY.snapshot()})
+        if self.cfg.get("metrics_textfile"):
+            path = pathlib.Path(self.cfg["metrics_textfile"])
+            path = metrics.REGISTRY.write_textfile(path if path.is_absolute() else BASE / path)
+            self.log.info(f"metrics -> {path}")
+
+    def run(self, names: list[str] | None = None) -> dict[str, Any]:
+        selected = [n for n in self.stages if names is None or n in names]
+        unknown = set(names or ()) - set(self.stages)
+        if unknown:
+            raise KeyError(f"unknown stages: {sorted(unknown)}")
+        produced = {self.stages[n].output for n in selected}
+        results: dict[str, Any] = {}
+        # Inputs not produced in this run come from on-disk checkpoints of an earlier run
+        for n in selected:
+            for inp in self.stages[n].inputs:
+                if inp not in produced and inp not in results:
+                    results[inp] = self._load(inp)
+
+        pending = {n: {i for i in self.stages[n].inputs if i in produced} for n in selected}
+        # Checkpointed intermediates are dropped from memory once their last consumer has run;
+        # outputs nothing in this run reads (agent, summaries, ...) are what run() returns
+        consumers = {o: {n for n in selected if o in self.stages[n].inputs} for o in produced}
+        saved = {self.stages[n].output for n in selected if self.checkpoint and self.stages[n].save is not None}
+        with ThreadPoolExecutor(max_workers=self.max_workers) as ex:
+            running = {}
+            while pending or running:
+                for n in [n for n, deps in pending.items() if deps <= results.keys()]:
+                    del pending[n]
+                    st = self.stages[n]
+                    running[ex.submit(self._run_stage, st, [results[i] for i in st.inputs])] = n
+                if not running:
+                    raise RuntimeError(f"unresolvable stage inputs: {sorted(pending)}")
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+                for fut in done:
+                    st = self.stages[running.pop(fut)]
+                    results[st.output] = fut.result()
+                    for inp in st.inputs:
+                        consumers.get(inp, set()).discard(st.name)
+                        if inp in saved and not consumers[inp]:
+                            del results[inp]
+        if self.checkpoint:
+            publish_version(self.art_dir, selected)
+        self._report_metrics()
+        return results
+
+def default_pipeline(cfg: dict | None = None, art_dir: pathlib.Path = ART_DIR,
+                     checkpoint: bool = True, max_workers: int = 4) -> Pipeline:
+    from doc_store import DocStore
+    from utils import shards
+    import ingest, preprocess, dedup, search_index, vector_index, entity_index, extract_entities, extractions, summarize, evaluate, agentic_workflow
+    p = Pipeline(cfg, art_dir, checkpoint, max_workers)
+    p.add(Stage("ingest", lambda cfg: ingest.ingest_corpus(cfg, p.art_dir), (), "corpus",
+                save=lambda df, art: write_artifact(df, "corpus", art),
+                load=lambda art: open_corpus(["doc_id", "filename", "text"], "corpus", art)))
+    p.add(Stage("preprocess", preprocess.preprocess_corpus, ("corpus",), "corpus_clean",
+                save=lambda df, art: write_artifact(df, "corpus_clean", art), load=lambda art: open_corpus(art_dir=art)))
+    p.add(Stage("index", lambda cfg, corpus: search_index.build_index(
+                corpus, p.art_dir / "search_index", int(cfg.get("ingest_batch_size", 1000))),
+                ("corpus_clean",), "search_index",
+                load=lambda art: art / "search_index"))
+    p.add(Stage("vectors", lambda cfg, corpus: vector_index.build_vector_index(
+                corpus, p.art_dir / "vector_index", int(cfg.get("ingest_batch_size", 1000)),
+                int(cfg.get("vector_dim", 128)), chunk_chars=int(cfg.get("vector_chunk_chars", 1000)),
+                overlap=int(cfg.get("vector_chunk_overlap", 150))),
+                ("corpus_clean",), "vector_index",
+                load=lambda art: art / "vector_index"))
+    # Near-duplicate clusters: extract/summarize compute canonical docs only and copy to members
+    p.add(Stage("dedup", dedup.find_duplicates, ("corpus_clean",), "duplicates",
+                save=lambda df, art: write_artifact(df, "duplicates", art), load=dedup.read_duplicates))
+    # shards > 0: extract and summarize run as shard queues under artifacts/shards/ (see
+    # utils.shards), which needs the checkpointed artifacts; more machines can join the run
+    sharded = lambda cfg: p.checkpoint and int(cfg.get("shards", 0)) > 0
+
+    def run_sharded(cfg, name, mod, corpus, dups, dest):
+        ds, _ = shards.run_sharded(cfg, name, corpus, mod._shard_job, p.art_dir / dest, dedup.duplicates_version(dups),
+                                   p.art_dir, get_logger(name), job_args=(p.art_dir,))
+        return ds
+
+    # Extractions stream to artifacts/extractions.parquet/ batch by batch when checkpointing;
+    # sharded, the entities stage then builds the entity index from the merged shards
+    p.add(Stage("extract", lambda cfg, corpus, dups: run_sharded(
+                cfg, "extract", extract_entities, corpus, dups, "extractions.parquet").path if sharded(cfg) else
+                extract_entities.extract_corpus(cfg, corpus, extractions.ExtractionWriter(p.art_dir, entity_index.EntityIndex(
+                    p.art_dir / "entity_index.sqlite")) if p.checkpoint else None, dups),
+                ("corpus_clean", "duplicates"), "extractions", load=extractions.read_extractions))
+    # Entity postings are already updated per extraction batch; this pass catches up and prunes
+    p.add(Stage("entities", lambda cfg, ext: entity_index.build_entity_index(
+                p.art_dir / "entity_index.sqlite", entity_index.extraction_batches(ext)),
+                ("extractions",), "entity_index", load=lambda art: art / "entity_index.sqlite"))
+    p.add(Stage("summarize", lambda cfg, corpus, dups: run_sharded(
+                cfg, "summarize", summarize, corpus, dups, "summaries.parquet").to_pandas() if sharded(cfg) else
+                summarize.summarize_corpus(cfg, corpus, dups), ("corpus_clean", "duplicates"), "summaries",
+                save=lambda df, art: None if sharded(p.cfg) else write_artifact(df, "summaries", art)))
+    p.add(Stage("evaluate", lambda cfg, sums: evaluate.evaluate_summaries(cfg, sums, p.art_dir),
+                ("summaries",), "evaluation"))
+    p.add(Stage("agent", lambda cfg, corpus, sums, *_indexes: agentic_workflow.run(
+                agentic_workflow.DEMO_QUERY, p.art_dir, DocStore.from_frames(p.art_dir, corpus_clean=corpus, summaries=sums)),
+                ("corpus_clean", "summaries", "search_index", "vector_index", "entity_index"), "agent"))
+    return p
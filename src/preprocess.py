@@ -1,39 +1,139 @@
 # Author: Kartheek Nagelli
 from __future__ import annotations
-import re, pandas as pd, pathlib
+import re, numpy as np, pandas as pd
 from config import load_cfg
+from utils.data import DatasetWriter, ParquetDataset, compact_frame, open_corpus, write_artifact
+from utils.metrics import inc, timed_batches
 from logs import get_logger
 
 CLEAN_RE = re.compile(r"\s+", re.MULTILINE)
 
+# Python's \s for str patterns, spelled out for RE2 (Arrow compute)
+WS_RUN_RE2 = r"[\t-\r\x1c-\x20\x85\p{Z}]+"
+PUNCT_END = np.array([ord("."), ord("!"), ord("?")], dtype=np.uint32)
+
 def clean_text(s: str) -> str:
     s = s.strip()
     s = CLEAN_RE.sub(" ", s)
     return s
 
+def clean_series(texts: pd.Series) -> pd.Series:
+    # clean_text over a whole column in Arrow compute instead of a per-row Python call
+    try:
+        import pyarrow as pa, pyarrow.compute as pc
+    except ImportError:
+        return texts.map(clean_text)
+    arr = pc.replace_substring_regex(pc.utf8_trim_whitespace(pa.array(texts, type=pa.large_string())), WS_RUN_RE2, " ")
+    # Kept in Arrow memory (string[pyarrow]): no Python str object per document
+    return pd.Series(pd.arrays.ArrowStringArray(arr.cast(pa.string())), index=texts.index)
+
+def text_offsets(texts: list[str]) -> tuple[list[np.ndarray], list[np.ndarray]]:
+    """Sentence and token index for cleaned texts, computed over the whole batch at once.
+    Per doc: sent_offsets (int32 sentence start offsets; a sentence ends one char before the
+    next start, the last at len(text)) and tok_offsets (int32 [start, end, start, end, ...]
+    of [A-Za-z]+ / [0-9]+ runs). Sentences break after ./!/? followed by a space, as in
+    clean text every whitespace run is one space."""
+    if not texts:
+        return [], []
+    lens = np.fromiter(map(len, texts), dtype=np.int64, count=len(texts))
+    starts = np.r_[0, np.cumsum(lens + 1)[:-1]]
+    # "\n" never occurs in cleaned text, so no token or sentence crosses a document boundary
+    cp = np.frombuffer("\n".join(texts).encode("utf-32-le"), dtype=np.uint32)
+    lower = cp | 32
+    cls = np.zeros(len(cp) + 2, dtype=np.uint8)  # 0 = other, 1 = letter, 2 = digit; zero-padded
+    cls[1:-1] = ((lower >= 97) & (lower <= 122)) | (((cp >= 48) & (cp <= 57)) << 1)
+    chg = np.flatnonzero(cls[1:] != cls[:-1])  # class changes, in padded coordinates minus one
+    toks = np.empty(0, np.int64)
+    if len(chg):
+        tok_s, tok_e = chg[cls[chg + 1] != 0], chg[cls[chg] != 0]
+        toks = np.column_stack([tok_s, tok_e]).ravel()
+    punct = (cp[:-1] == 46) | (cp[:-1] == 33) | (cp[:-1] == 63)
+    brk = np.flatnonzero(punct[:-1] & (cp[1:-1] == 32)) + 2 if len(cp) > 2 else np.empty(0, np.int64)
+    sent_s = np.sort(np.r_[starts, brk])
+
+    def split(pos: np.ndarray, width: int) -> list[np.ndarray]:
+        doc = np.searchsorted(starts, pos[::width], side="right") - 1
+        rel = (pos - np.repeat(starts[doc], width)).astype(np.int32)
+        cuts = np.r_[0, np.searchsorted(doc, np.arange(1, len(texts))) * width, len(rel)].tolist()
+        return [rel[a:b] for a, b in zip(cuts[:-1], cuts[1:])]
+
+    return split(sent_s, 1), split(toks, 2)
+
+def sentences(text: str, sent_offsets) -> list[str]:
+    ends = [int(x) - 1 for x in sent_offsets[1:]] + [len(text)]
+    return [text[s:e] for s, e in zip(map(int, sent_offsets), ends)]
+
+def chunk_spans(sent_offsets, n_chars: int, size: int, overlap: int = 0) -> list[tuple[int, int]]:
+    """Sentence-aligned (start, end) windows of at most ~size chars; each window after the first
+    starts at the first sentence beginning within `overlap` chars of the previous window's end.
+    A single sentence longer than 2*size is cut into fixed windows."""
+    starts = np.asarray(sent_offsets, dtype=np.int64)
+    if not len(starts):
+        return [(0, n_chars)]
+    bounds = np.r_[starts, n_chars + 1]  # sentence i is text[bounds[i]:bounds[i + 1] - 1]
+    spans, i = [], 0
+    while True:
+        j = max(i, int(np.searchsorted(bounds, bounds[i] + size + 1, side="right")) - 2)
+        s, e = int(bounds[i]), int(bounds[j + 1]) - 1
+        if e - s > 2 * size:
+            step = max(1, size - overlap)
+            spans += [(a, min(a + size, e)) for a in range(s, e - overlap, step)]
+        else:
+            spans.append((s, e))
+        if j + 1 >= len(starts):
+            return spans
+        i = max(i + 1, int(np.searchsorted(starts, e - overlap, side="left")))
+
+def add_text_index(df: pd.DataFrame, chunk: int = 1000) -> pd.DataFrame:
+    df["text_clean"] = clean_series(df["text"])
+    texts, sent, tok = df["text_clean"].tolist(), [], []
+    for i in range(0, len(texts), chunk):  # bounds the code-point buffers to one chunk of docs
+        s, t = text_offsets(texts[i:i + chunk])
+        sent += s
+        tok += t
+    df["sent_offsets"], df["tok_offsets"] = sent, tok
+    return df
+
 def basic_eda(df: pd.DataFrame) -> pd.DataFrame:
+    return length_eda(df["text"].str.len())
+
+def length_eda(lengths: pd.Series) -> pd.DataFrame:
     return pd.DataFrame({
-        "n_docs": [len(df)],
-        "avg_len": [df["text"].str.len().mean()],
-        "median_len": [df["text"].str.len().median()],
+        "n_docs": [len(lengths)],
+        "avg_len": [lengths.mean()],
+        "median_len": [lengths.median()],
     })
 
-def main():
-    cfg = load_cfg()
+def preprocess_dataset(cfg: dict, ds: ParquetDataset) -> ParquetDataset:
+    # Batch-by-batch variant for streamed corpora; only per-doc lengths are kept for the EDA
     log = get_logger("preprocess")
-    art = pathlib.Path(__file__).resolve().parents[1] / "artifacts"
-    p_parq = art / "corpus.parquet"
-    p_csv = art / "corpus.csv"
-    df = pd.read_parquet(p_parq) if p_parq.exists() else pd.read_csv(p_csv)
-    df["text_clean"] = df["text"].map(clean_text)
+    writer = DatasetWriter(ds.path.parent / "corpus_clean.parquet")
+    lengths = []
+    src = ParquetDataset(ds.path, ["doc_id", "filename", "text"], compact=True)
+    for batch in timed_batches(src.batches(int(cfg.get("ingest_batch_size", 1000))), "preprocess"):
+        add_text_index(batch)
+        lengths.append(batch["text"].str.len().astype("int64"))
+        writer.write(batch.drop(columns="text"))
+    log.info("\n" + length_eda(pd.concat(lengths) if lengths else pd.Series([], dtype="int64")).to_string(index=False))
+    return ParquetDataset(writer.close().path, compact=True)
+
+def preprocess_corpus(cfg: dict, df: pd.DataFrame | ParquetDataset) -> pd.DataFrame | ParquetDataset:
+    if isinstance(df, ParquetDataset):
+        return preprocess_dataset(cfg, df)
+    log = get_logger("preprocess")
+    df = add_text_index(df.copy())
+    inc("docs_processed", len(df), stage="preprocess")
     eda = basic_eda(df)
     log.info("\n" + eda.to_string(index=False))
-    try:
-        df.to_parquet(art / "corpus_clean.parquet")
-        log.info("Saved artifacts/corpus_clean.parquet")
-    except Exception:
-        df.to_csv(art / "corpus_clean.csv", index=False)
-        log.info("Parquet not available; saved artifacts/corpus_clean.csv")
+    # Raw text stays in the corpus artifact; corpus_clean carries only what later stages read
+    return compact_frame(df.drop(columns="text"))
+
+def main():
+    cfg = load_cfg()
+    log = get_logger("preprocess")
+    df = preprocess_corpus(cfg, open_corpus(["doc_id", "filename", "text"], name="corpus"))
+    p = write_artifact(df, "corpus_clean")
+    log.info(f"Saved artifacts/{p.name}")
 
 if __name__ == "__main__":
     main()
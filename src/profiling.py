@@ -0,0 +1,84 @@
+# Author: Kartheek Nagelli
+from __future__ import annotations
+import contextlib, cProfile, pathlib, pstats, sys, threading, tracemalloc
+from collections import Counter
+from utils.data import ART_DIR
+
+def _frame_name(f) -> str:
+    code = f.f_code
+    return f"{pathlib.Path(code.co_filename).stem}:{code.co_name}:{code.co_firstlineno}"
+
+class StackSampler:
+    """Samples one thread's Python stack every `interval` seconds into collapsed-stack
+    counts ("root;...;leaf N"), the input format of flamegraph.pl / speedscope."""
+
+    def __init__(self, thread_id: int, interval: float = 0.005):
+        self.thread_id, self.interval = thread_id, interval
+        self.counts: Counter = Counter()
+        self._stop = threading.Event()
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            f = sys._current_frames().get(self.thread_id)
+            stack = []
+            while f is not None:
+                stack.append(_frame_name(f))
+                f = f.f_back
+            if stack:
+                self.counts[";".join(reversed(stack))] += 1
+
+    def __enter__(self):
+        self._t = threading.Thread(target=self._run, daemon=True)
+        self._t.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._t.join()
+
+    def write(self, path: pathlib.Path) -> None:
+        path.write_text("".join(f"{s} {n}\n" for s, n in self.counts.most_common()))
+
+class Profiler:
+    """Per-stage cProfile, sampled collapsed stacks and tracemalloc top allocations,
+    written to out_dir as <stage>.pstats / <stage>.collapsed / <stage>.alloc.txt."""
+
+    def __init__(self, out_dir: pathlib.Path = ART_DIR / "profiles", top: int = 15):
+        self.out_dir = pathlib.Path(out_dir)
+        self.top = top
+        self.stats: dict[str, pstats.Stats] = {}
+
+    @contextlib.contextmanager
+    def stage(self, name: str):
+        self.out_dir.mkdir(parents=True, exist_ok=True)
+        prof = cProfile.Profile()
+        started_tm = not tracemalloc.is_tracing()
+        if started_tm:
+            tracemalloc.start(10)
+        base = tracemalloc.take_snapshot()
+        with StackSampler(threading.get_ident()) as sampler:
+            prof.enable()
+            try:
+                yield
+            finally:
+                prof.disable()
+                snap = tracemalloc.take_snapshot()
+                if started_tm:
+                    tracemalloc.stop()
+        prof.dump_stats(self.out_dir / f"{name}.pstats")
+        sampler.write(self.out_dir / f"{name}.collapsed")
+        allocs = snap.compare_to(base, "lineno")[: self.top]
+        (self.out_dir / f"{name}.alloc.txt").write_text("\n".join(str(a) for a in allocs) + "\n")
+        self.stats[name] = pstats.Stats(prof)
+
+    def report(self, n: int = 8) -> str:
+        # Hottest functions by self time, per stage
+        lines = []
+        for name, st in self.stats.items():
+            rows = sorted(st.stats.items(), key=lambda kv: -kv[1][2])[:n]
+            lines.append(f"== {name}: {st.total_tt:.3f}s total")
+            for (fname, line, func), (_, ncalls, tottime, cumtime, _) in rows:
+                lines.append(f"  {tottime:8.3f}s self {cumtime:8.3f}s cum {ncalls:>9} calls  "
+                             f"{pathlib.Path(fname).name}:{line}({func})")
+        lines.append(f"profiles -> {self.out_dir}")
+        return "\n".join(lines)
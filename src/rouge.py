@@ -0,0 +1,130 @@
+# Author: Kartheek Nagelli
+from __future__ import annotations
+import functools, os, re
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+import pandas as pd
+
+TOKEN_RE = re.compile(r"[a-z0-9]+")
+METRICS = ("rouge1", "rouge2", "rougeL")
+
+@functools.lru_cache(maxsize=1)
+def _stemmer():
+    # Same Porter variant as rouge_score, so scores match RougeScorer(use_stemmer=True)
+    try:
+        from nltk.stem import porter
+        return porter.PorterStemmer("ORIGINAL_ALGORITHM").stem
+    except Exception:
+        from search_index import _stem
+        return _stem
+
+@functools.lru_cache(maxsize=200_000)
+def _stem(tok: str) -> str:
+    return _stemmer()(tok) if len(tok) > 3 else tok
+
+class Vocab:
+    """Token -> int id; every text is tokenised and stemmed once into an id array."""
+
+    def __init__(self):
+        self.ids: dict[str, int] = {}
+
+    def encode(self, text) -> np.ndarray:
+        if not isinstance(text, str):
+            return np.zeros(0, np.int64)
+        ids = self.ids
+        return np.array([ids.setdefault(_stem(t), len(ids)) for t in TOKEN_RE.findall(text.lower())], dtype=np.int64)
+
+def _prf(overlap: float, n_pred: int, n_ref: int) -> tuple[float, float, float]:
+    p = overlap / n_pred if n_pred else 0.0
+    r = overlap / n_ref if n_ref else 0.0
+    return p, r, (2 * p * r / (p + r) if p + r else 0.0)
+
+def _ngram_overlap(pred: np.ndarray, ref: np.ndarray, n: int, base: int) -> int:
+    if len(pred) < n or len(ref) < n:
+        return 0
+    # n-grams packed into one int64 key each (base = vocab size), then multiset intersection
+    kp, kr = pred[: len(pred) - n + 1].copy(), ref[: len(ref) - n + 1].copy()
+    for j in range(1, n):
+        kp = kp * base + pred[j: len(pred) - n + 1 + j]
+        kr = kr * base + ref[j: len(ref) - n + 1 + j]
+    up, cp = np.unique(kp, return_counts=True)
+    ur, cr = np.unique(kr, return_counts=True)
+    _, ip, ir = np.intersect1d(up, ur, assume_unique=True, return_indices=True)
+    return int(np.minimum(cp[ip], cr[ir]).sum())
+
+def _lcs(a: np.ndarray, b: np.ndarray) -> int:
+    # Bit-parallel LCS length (Hyyrö): one big-int update per token of b
+    if not len(a) or not len(b):
+        return 0
+    masks: dict[int, int] = {}
+    for i, x in enumerate(a.tolist()):
+        masks[x] = masks.get(x, 0) | (1 << i)
+    full = (1 << len(a)) - 1
+    s = full
+    for y in b.tolist():
+        u = s & masks.get(y, 0)
+        s = ((s + u) | (s - u)) & full
+    return len(a) - bin(s).count("1")
+
+def score_pair(pred: np.ndarray, ref: np.ndarray, base: int) -> list[float]:
+    out = []
+    for n in (1, 2):
+        out += _prf(_ngram_overlap(pred, ref, n, base), max(len(pred) - n + 1, 0), max(len(ref) - n + 1, 0))
+    out += _prf(_lcs(ref, pred), len(pred), len(ref))
+    return out
+
+def _score_chunk(args) -> list:
+    preds, refs, base = args
+    return [score_pair(p, r, base) for p, r in zip(preds, refs)]
+
+def score_arrays(preds: list, refs: list, base: int, workers: int = 1, chunk: int = 2000) -> np.ndarray:
+    jobs = [(preds[i:i + chunk], refs[i:i + chunk], base) for i in range(0, len(preds), chunk)]
+    if workers > 1 and len(jobs) > 1:
+        with ProcessPoolExecutor(max_workers=workers) as ex:
+            rows = [r for part in ex.map(_score_chunk, jobs) for r in part]
+    else:
+        rows = [r for job in jobs for r in _score_chunk(job)]
+    return np.array(rows, dtype=np.float64).reshape(-1, 9)
+
+def bootstrap_ci(x: np.ndarray, n_boot: int = 1000, alpha: float = 0.05, seed: int = 0,
+                 block: int = 100) -> tuple[float, float]:
+    # Percentile bootstrap of the mean; resamples are drawn `block` at a time to bound memory
+    if len(x) == 0:
+        return float("nan"), float("nan")
+    rng = np.random.default_rng(seed)
+    means = np.concatenate([x[rng.integers(0, len(x), (min(block, n_boot - i), len(x)))].mean(axis=1)
+                            for i in range(0, n_boot, block)])
+    lo, hi = np.quantile(means, [alpha / 2, 1 - alpha / 2])
+    return float(lo), float(hi)
+
+def evaluate_systems(systems: dict[str, pd.DataFrame], refs: pd.DataFrame, workers: int | None = None,
+                     n_boot: int = 1000, seed: int = 0) -> tuple[pd.DataFrame, pd.DataFrame]:
+    """systems: name -> DataFrame(doc_id, summary); refs: DataFrame(doc_id, reference).
+    Returns (per-document scores, per-system aggregate report)."""
+    workers = workers or os.cpu_count() or 1
+    vocab = Vocab()
+    refs = refs.drop_duplicates("doc_id")
+    ref_ids = dict(zip(refs["doc_id"], map(vocab.encode, refs["reference"])))
+    encoded = {}
+    for name, df in systems.items():
+        df = df[df["doc_id"].isin(ref_ids.keys())].drop_duplicates("doc_id")
+        encoded[name] = (df["doc_id"].tolist(), [vocab.encode(s) for s in df["summary"]])
+    base = max(len(vocab.ids), 1)
+
+    cols = [f"{m}_{k}" for m in METRICS for k in ("precision", "recall", "fmeasure")]
+    frames = []
+    for name, (ids, preds) in encoded.items():
+        scores = score_arrays(preds, [ref_ids[i] for i in ids], base, workers)
+        frames.append(pd.DataFrame(scores, columns=cols).assign(system=name, doc_id=ids))
+    per_doc = pd.concat(frames, ignore_index=True) if frames else pd.DataFrame(columns=["system", "doc_id", *cols])
+    per_doc = per_doc[["system", "doc_id", *cols]]
+
+    report = []
+    for name, g in per_doc.groupby("system", sort=False):
+        for m in METRICS:
+            x = g[f"{m}_fmeasure"].to_numpy()
+            lo, hi = bootstrap_ci(x, n_boot, seed=seed)
+            p10, p50, p90 = np.percentile(x, [10, 50, 90]) if len(x) else (np.nan,) * 3
+            report.append({"system": name, "metric": m, "n": len(x), "mean": float(x.mean()) if len(x) else np.nan,
+                           "p10": p10, "p50": p50, "p90": p90, "ci_low": lo, "ci_high": hi})
+    return per_doc, pd.DataFrame(report)
@@ -0,0 +1,170 @@
+# Author: Kartheek Nagelli
+from __future__ import annotations
+import hashlib, json, math, os, pathlib, re, shutil
+from collections import Counter
+import numpy as np
+import pandas as pd
+from utils.data import ART_DIR, ParquetDataset, iter_batches
+from utils.metrics import timed_batches
+
+TOKEN_RE = re.compile(r"[a-z0-9]+")
+K1, B = 1.2, 0.75
+
+def _stem(tok: str) -> str:
+    # Light suffix stripping so "report" also finds "reported"/"reports"
+    for suf in ("ing", "ed", "es", "s"):
+        if tok.endswith(suf) and len(tok) - len(suf) >= 3:
+            return tok[: -len(suf)]
+    return tok
+
+def tokenize(text: str) -> list[str]:
+    return [_stem(t) for t in TOKEN_RE.findall(text.lower())]
+
+def term_hash(term: str) -> int:
+    return int.from_bytes(hashlib.blake2b(term.encode("utf-8"), digest_size=8).digest(), "little")
+
+def varbyte_encode(vals: np.ndarray) -> np.ndarray:
+    v = vals.astype(np.uint64)
+    nb = np.ones(len(v), dtype=np.int64)
+    for k in range(1, 5):
+        nb += v >= (1 << (7 * k))
+    start = np.cumsum(nb) - nb
+    out = np.zeros(int(nb.sum()), dtype=np.uint8)
+    for k in range(5):
+        sel = nb > k
+        byte = (v[sel] >> np.uint64(7 * k)) & np.uint64(0x7F)
+        more = (nb[sel] - 1 > k).astype(np.uint64) << np.uint64(7)
+        out[start[sel] + k] = (byte | more).astype(np.uint8)
+    return out
+
+def varbyte_decode(buf: np.ndarray) -> np.ndarray:
+    if len(buf) == 0:
+        return np.zeros(0, dtype=np.int64)
+    ends = (buf & 0x80) == 0
+    grp = np.cumsum(ends) - ends
+    first = np.flatnonzero(np.r_[True, ends[:-1]])
+    pos = np.arange(len(buf)) - first[grp]
+    parts = (buf & 0x7F).astype(np.float64) * np.exp2(7 * pos)
+    return np.bincount(grp, weights=parts).astype(np.int64)
+
+def build_index(data: pd.DataFrame | ParquetDataset, out_dir: pathlib.Path = ART_DIR / "search_index",
+                batch_size: int = 1000) -> pathlib.Path:
+    hashes, docs, tfs, doc_len, doc_ids = [], [], [], [], []
+    vocab: dict[str, int] = {}
+    n = 0
+    for batch in timed_batches(iter_batches(data, batch_size), "index"):
+        h_b, d_b, tf_b = [], [], []
+        for doc_id, filename, text in zip(batch["doc_id"], batch["filename"], batch["text_clean"]):
+            toks = tokenize(f"{filename} {text}")
+            for term, tf in Counter(toks).items():
+                h = vocab.get(term)
+                if h is None:
+                    h = vocab[term] = term_hash(term)
+                h_b.append(h); d_b.append(n); tf_b.append(tf)
+            doc_len.append(len(toks)); doc_ids.append(str(doc_id))
+            n += 1
+        hashes.append(np.array(h_b, dtype=np.uint64))
+        docs.append(np.array(d_b, dtype=np.uint32))
+        tfs.append(np.array(tf_b, dtype=np.uint32))
+
+    h = np.concatenate(hashes) if hashes else np.zeros(0, np.uint64)
+    d = np.concatenate(docs) if docs else np.zeros(0, np.uint32)
+    tf = np.concatenate(tfs) if tfs else np.zeros(0, np.uint32)
+    order = np.lexsort((d, h))
+    h, d, tf = h[order], d[order], tf[order]
+    dl = np.array(doc_len, dtype=np.uint32)
+    avgdl = float(dl.mean()) if n else 0.0
+
+    uniq, starts, df = np.unique(h, return_index=True, return_counts=True)
+    post_off = np.r_[starts, len(h)].astype(np.uint64)
+    # Doc ids are gap-encoded within each posting list and varbyte-compressed
+    gaps = d.astype(np.int64) - np.r_[0, d[:-1]].astype(np.int64)
+    gaps[starts] = d[starts]
+    nbytes = np.ones(len(gaps), dtype=np.int64)
+    for k in range(1, 5):
+        nbytes += gaps >= (1 << (7 * k))
+    doc_off = np.r_[0, np.cumsum(nbytes)][post_off.astype(np.int64)].astype(np.uint64)
+    # Per-term score upper bounds drive MaxScore early termination at query time
+    idf = np.log1p((n - df + 0.5) / (df + 0.5)) if n else np.zeros(0)
+    norm = K1 * (1 - B + B * dl[d] / max(avgdl, 1e-9))
+    contrib = tf * (K1 + 1) / (tf + norm)
+    ub = np.maximum.reduceat(contrib, starts) * idf if len(h) else np.zeros(0)
+
+    tmp = out_dir.with_name(out_dir.name + ".tmp")
+    shutil.rmtree(tmp, ignore_errors=True)
+    tmp.mkdir(parents=True)
+    np.save(tmp / "term_hash.npy", uniq)
+    np.save(tmp / "term_df.npy", df.astype(np.uint32))
+    np.save(tmp / "term_ub.npy", ub)
+    np.save(tmp / "term_post_off.npy", post_off)
+    np.save(tmp / "term_doc_off.npy", doc_off)
+    varbyte_encode(gaps).tofile(tmp / "post_docs.bin")
+    np.save(tmp / "post_tf.npy", np.minimum(tf, 65535).astype(np.uint16))
+    np.save(tmp / "doc_len.npy", dl)
+    np.save(tmp / "doc_ids.npy", np.array(doc_ids, dtype="S"))
+    (tmp / "meta.json").write_text(json.dumps({"n_docs": n, "avgdl": avgdl, "k1": K1, "b": B}))
+    shutil.rmtree(out_dir, ignore_errors=True)
+    os.replace(tmp, out_dir)
+    return out_dir
+
+class SearchIndex:
+    """Memory-mapped BM25 index written by build_index."""
+
+    def __init__(self, path: pathlib.Path = ART_DIR / "search_index"):
+        self.path = pathlib.Path(path)
+        meta = json.loads((self.path / "meta.json").read_text())
+        self.n_docs, self.avgdl, self.k1, self.b = meta["n_docs"], meta["avgdl"], meta["k1"], meta["b"]
+        load = lambda name: np.load(self.path / name, mmap_mode="r")
+        self.term_hash, self.term_df, self.term_ub = load("term_hash.npy"), load("term_df.npy"), load("term_ub.npy")
+        self.post_off, self.doc_off = load("term_post_off.npy"), load("term_doc_off.npy")
+        self.post_tf, self.doc_len, self.doc_ids = load("post_tf.npy"), load("doc_len.npy"), load("doc_ids.npy")
+        size = (self.path / "post_docs.bin").stat().st_size
+        self.post_docs = np.memmap(self.path / "post_docs.bin", dtype=np.uint8, mode="r") if size else np.zeros(0, np.uint8)
+
+    @staticmethod
+    def exists(path: pathlib.Path = ART_DIR / "search_index") -> bool:
+        return (pathlib.Path(path) / "meta.json").exists()
+
+    def _term(self, term: str) -> int | None:
+        h = np.uint64(term_hash(term))
+        i = int(np.searchsorted(self.term_hash, h))
+        return i if i < len(self.term_hash) and self.term_hash[i] == h else None
+
+    def _postings(self, i: int) -> tuple[np.ndarray, np.ndarray]:
+        buf = np.asarray(self.post_docs[int(self.doc_off[i]):int(self.doc_off[i + 1])])
+        docs = np.cumsum(varbyte_decode(buf))
+        return docs, np.asarray(self.post_tf[int(self.post_off[i]):int(self.post_off[i + 1])], dtype=np.float32)
+
+    def _scores(self, i: int, docs: np.ndarray, tf: np.ndarray) -> np.ndarray:
+        df = float(self.term_df[i])
+        idf = math.log1p((self.n_docs - df + 0.5) / (df + 0.5))
+        norm = self.k1 * (1 - self.b + self.b * self.doc_len[docs] / max(self.avgdl, 1e-9))
+        return idf * tf * (self.k1 + 1) / (tf + norm)
+
+    def search(self, query: str, k: int = 10) -> list[tuple[str, float]]:
+        terms = [i for i in {self._term(t) for t in tokenize(query)} if i is not None]
+        if not terms:
+            return []
+        terms.sort(key=lambda i: -float(self.term_ub[i]))
+        ubs = np.array([float(self.term_ub[i]) for i in terms])
+        rest_ub = np.r_[np.cumsum(ubs[::-1])[::-1][1:], 0.0]  # bound of terms after each one
+
+        docs_acc, scores = np.zeros(0, np.int64), np.zeros(0)
+        for j, i in enumerate(terms):
+            docs, tf = self._postings(i)
+            s = self._scores(i, docs, tf)
+            theta = np.partition(scores, -k)[-k] if len(scores) >= k else 0.0
+            if len(scores) >= k and theta >= ubs[j] + rest_ub[j]:
+                # MaxScore: unseen docs can no longer reach the top-k, only rescore live candidates
+                live = scores + ubs[j] + rest_ub[j] > theta
+                docs_acc, scores = docs_acc[live], scores[live]
+                if not len(docs_acc):
+                    break
+                pos = np.minimum(np.searchsorted(docs, docs_acc), len(docs) - 1)
+                hit = docs[pos] == docs_acc
+                scores[hit] += s[pos[hit]]
+                continue
+            u, inv = np.unique(np.concatenate([docs_acc, docs]), return_inverse=True)
+            docs_acc, scores = u, np.bincount(inv, weights=np.concatenate([scores, s]), minlength=len(u))
+        top = np.lexsort((docs_acc, -scores))[:k]
+        return [(self.doc_ids[docs_acc[x]].decode(), float(scores[x])) for x in top]
@@ -1,56 +1,226 @@
 # Author: Kartheek Nagelli
 from __future__ import annotations
-import pathlib, pandas as pd
+import pathlib
+import numpy as np
+import pandas as pd
 from config import load_cfg
-from utils.gcp import init_vertex
+from utils.gcp import ApiExecutor, get_generative_model, sdk_available
+from utils.data import ART_DIR, ParquetDataset, iter_batches, open_corpus, write_artifact
+from utils.metrics import timed_batches
+from utils.llm_cache import LLMCache, cached_generate
+from utils.result_store import ResultStore, cached_map, stage_version
+from utils.packing import JSON_OUTPUT, pack_documents, pack_kwargs, packed_map
+from utils.sinks import result_sink
+from utils.shards import run_sharded
+from preprocess import chunk_spans, clean_text, text_offsets
+from dedup import Duplicates, duplicates_version, read_duplicates
 from logs import get_logger
-try:
-    from vertexai.generative_models import GenerativeModel
-except Exception:
-    GenerativeModel = None
 
 SYS_PROMPT = """
 Summarize the following document in 3-5 concise sentences. Write for a business stakeholder.
 Capture key facts (who/what/when/results) and any noted risks/limitations.
 """
 
-def vertex_summarize(text: str, model_name: str) -> str:
-    model = GenerativeModel(model_name)
-    resp = model.generate_content(f"{SYS_PROMPT}\n\nDocument:\n{text}")
-    return resp.text.strip()
+# Hierarchical mode for long documents: chunks are summarized on their own (map), then the
+# chunk summaries are combined into the final summary (reduce)
+CHUNK_PROMPT = """
+The following is one part of a longer document. Summarize this part in 3-5 concise sentences.
+Keep key facts (who/what/when/results, figures) and any risks/limitations it mentions.
+"""
 
-def heuristic_summarize(text: str) -> str:
-    sents = [s.strip() for s in text.split('.') if s.strip()]
-    return '. '.join(sents[:4]) + ('.' if sents else '')
+REDUCE_PROMPT = """
+The following are summaries of consecutive parts of one long document. Combine them into one
+summary of the whole document in 3-5 concise sentences. Write for a business stakeholder.
+Capture key facts (who/what/when/results) and any noted risks/limitations.
+"""
 
-def main():
-    cfg = load_cfg()
-    art = pathlib.Path(__file__).resolve().parents[1] / "artifacts"
-    p_parq = art / "corpus_clean.parquet"
-    p_csv = art / "corpus_clean.csv"
-    df = pd.read_parquet(p_parq) if p_parq.exists() else pd.read_csv(p_csv)
+PACK_PROMPT = SYS_PROMPT + """
+You are given several documents, each wrapped in <doc id="..."> tags. Summarize each one on its own.
+Return STRICT JSON: an array with one object per document, {"doc_id": "<id>", "summary": "<summary>"}, and nothing else.
+"""
+
+def vertex_summarize_packed(texts: list[str], model_name: str, model=None, cache: LLMCache | None = None) -> str:
+    block = pack_documents(texts)
+    def generate() -> str:
+        m = model or get_generative_model(load_cfg(), model_name)
+        return m.generate_content(f"{PACK_PROMPT}\nDocuments:\n{block}", generation_config=JSON_OUTPUT).text
+    return cached_generate(cache, model_name, PACK_PROMPT, block, generate)
+
+def _packed_summary(item: dict) -> str | None:
+    s = item.get("summary")
+    return s.strip() if isinstance(s, str) and s.strip() else None
+
+def vertex_summarize(text: str, model_name: str, model=None, cache: LLMCache | None = None,
+                     prompt: str = SYS_PROMPT) -> str:
+    def generate() -> str:
+        m = model or get_generative_model(load_cfg(), model_name)
+        return m.generate_content(f"{prompt}\n\nDocument:\n{text}").text.strip()
+    return cached_generate(cache, model_name, prompt, text, generate)
+
+def _groups(parts: list[str], size: int) -> list[str]:
+    out, cur = [], ""
+    for p in parts:
+        if cur and len(cur) + 1 + len(p) > size:
+            out.append(cur)
+            cur = ""
+        cur = f"{cur}\n{p}" if cur else p
+    return out + [cur]
+
+def hierarchical_summarize(texts: list[str], summarize_chunks, reduce, chunk_chars: int = 8000,
+                           overlap: int = 600, max_levels: int = 3) -> list[str | None]:
+    """Map-reduce summaries: every doc's chunks go to summarize_chunks(list) -> list together, so
+    they run concurrently; chunk summaries that still exceed chunk_chars are regrouped and
+    summarized again, then reduce(list) -> list writes the final summaries. A doc with any
+    failed chunk gets None (its finished chunks are cached by summarize_chunks)."""
+    (offsets, _) = text_offsets(texts)
+    parts: list = [[t[s:e] for s, e in chunk_spans(o, len(t), chunk_chars, overlap)] for t, o in zip(texts, offsets)]
+    live = list(range(len(texts)))
+    for _ in range(max_levels):
+        sums = iter(summarize_chunks([p for i in live for p in parts[i]]))
+        nxt = []
+        for i in live:
+            got = [next(sums) for _ in parts[i]]
+            if any(x is None for x in got):
+                parts[i] = None
+            elif sum(map(len, got)) + len(got) - 1 <= chunk_chars:
+                parts[i] = "\n".join(got)
+            else:
+                parts[i] = _groups(got, chunk_chars)
+                nxt.append(i)
+        live = nxt
+        if not live:
+            break
+    for i in live:
+        parts[i] = "\n".join(parts[i])
+    ready = [i for i, p in enumerate(parts) if p is not None]
+    out: list = [None] * len(texts)
+    for i, x in zip(ready, reduce([parts[i] for i in ready])):
+        out[i] = x
+    return out
 
+def hierarchy_kwargs(cfg: dict) -> dict | None:
+    # None when hierarchical mode is off (summary_long_chars: 0)
+    long_chars = int(cfg.get("summary_long_chars", 0) or 0)
+    if long_chars <= 0:
+        return None
+    return {"long_chars": long_chars, "chunk_chars": int(cfg.get("summary_chunk_chars", 8000)),
+            "overlap": int(cfg.get("summary_chunk_overlap", 600))}
+
+def heuristic_summarize(text: str, sent_offsets=None, max_sentences: int = 4, long_chars: int = 0,
+                        chunk_chars: int = 8000) -> str:
+    # Lead-k: sentences are separated by one space in clean text, so the summary is a prefix
+    if sent_offsets is None:
+        text = clean_text(text)
+        (sent_offsets,), _ = text_offsets([text])
+    if long_chars and len(text) > long_chars:
+        # Long docs: lead sentence of each chunk, evenly spread over the document
+        spans = chunk_spans(sent_offsets, len(text), chunk_chars)
+        pick = np.unique(np.linspace(0, len(spans) - 1, min(max_sentences, len(spans))).round().astype(int))
+        ends = {int(a): int(b) - 1 for a, b in zip(sent_offsets, list(sent_offsets[1:]) + [len(text) + 1])}
+        # A window cut out of an over-long sentence does not start a sentence: it is its own lead
+        out = " ".join(text[s:min(ends.get(s, e), e)] for s, e in (spans[k] for k in pick))
+        return out if len(out) < len(text) else text
+    return text if len(sent_offsets) <= max_sentences else text[:int(sent_offsets[max_sentences]) - 1]
+
+def summary_version(cfg: dict) -> str:
+    packed = (PACK_PROMPT,) if pack_kwargs(cfg, PACK_PROMPT) else ()
+    hier = hierarchy_kwargs(cfg)
+    hier = (CHUNK_PROMPT, REDUCE_PROMPT, *sorted(hier.items())) if hier else ()
+    return stage_version("vertex", cfg.get("vertex_model_summary", "gemini-1.5-flash"), SYS_PROMPT, *packed, *hier)
+
+def _split_long(short_fn, long_fn, long_chars: int):
+    # compute_many that sends docs over long_chars to long_fn and the rest to short_fn
+    def compute(xs: list[str]) -> list:
+        long_i = [i for i, x in enumerate(xs) if len(x) > long_chars]
+        short_i = [i for i, x in enumerate(xs) if len(x) <= long_chars]
+        out: list = [None] * len(xs)
+        for idx, fn in ((short_i, short_fn), (long_i, long_fn)):
+            if idx:
+                for i, v in zip(idx, fn([xs[i] for i in idx])):
+                    out[i] = v
+        return out
+    return compute
+
+def summarize_corpus(cfg: dict, df: pd.DataFrame | ParquetDataset, dups: pd.DataFrame | None = None) -> pd.DataFrame:
+    # dups (dedup.find_duplicates): near-duplicates get their canonical doc's summary
+    log = get_logger("summarize")
+    dups = Duplicates(dups)
     summaries = []
-    for _, row in df.iterrows():
-        if cfg.get("local_mode") or GenerativeModel is None:
-            summ = heuristic_summarize(row["text_clean"])
+    use_vertex = not cfg.get("local_mode") and sdk_available("vertexai")
+    store = ResultStore.from_cfg(cfg) if use_vertex else None
+    sink = result_sink(cfg, "bq_table_summaries")
+    n_computed = 0
+    if use_vertex:
+        model_name = cfg.get("vertex_model_summary", "gemini-1.5-flash")
+        model = get_generative_model(cfg, model_name)
+        llm_cache = LLMCache.from_cfg(cfg)
+        ex = ApiExecutor.from_cfg(cfg, name="vertex_summary")
+        single = lambda x: vertex_summarize(x, model_name, model, llm_cache)
+        pack = pack_kwargs(cfg, PACK_PROMPT)
+        if pack:
+            compute = lambda xs: packed_map(ex, xs, single, lambda ys: vertex_summarize_packed(
+                ys, model_name, model, llm_cache), _packed_summary, **pack)
+        else:
+            compute = lambda xs: ex.map(single, xs)
+        hier = hierarchy_kwargs(cfg)
+        if hier:
+            # Chunk summaries live in the result store too, so a partly failed doc resumes
+            chunk_version = stage_version("vertex_chunk", model_name, CHUNK_PROMPT)
+            summarize_chunks = lambda xs: cached_map(store, "summarize_chunk", chunk_version, xs, lambda ys: ex.map(
+                lambda y: vertex_summarize(y, model_name, model, llm_cache, CHUNK_PROMPT), ys))[0]
+            reduce = lambda xs: ex.map(lambda x: vertex_summarize(x, model_name, model, llm_cache, REDUCE_PROMPT), xs)
+            compute = _split_long(compute, lambda xs: hierarchical_summarize(
+                xs, summarize_chunks, reduce, hier["chunk_chars"], hier["overlap"]), hier["long_chars"])
+
+    for batch in timed_batches(iter_batches(df, int(cfg.get("ingest_batch_size", 1000))), "summarize"):
+        batch = dups.canonical(batch)
+        texts = list(batch["text_clean"])
+        if use_vertex:
+            out, n = cached_map(store, "summarize", summary_version(cfg), texts, compute)
+            n_computed += n
         else:
-            init_vertex(cfg)
-            summ = vertex_summarize(row["text_clean"], cfg.get("vertex_model_summary", "gemini-1.5-flash"))
-        summaries.append({"doc_id": row["doc_id"], "filename": row["filename"], "summary": summ})
-
-    try:
-        out = pd.DataFrame(summaries)
-        out.to_parquet(art/"summaries.parquet")
-        from logs import get_logger
-        log = get_logger("summarize")
-        log.info(f"Wrote {len(out)} summaries -> artifacts/summaries.parquet")
-    except Exception:
-        out = pd.DataFrame(summaries)
-        out.to_csv(art/"summaries.csv", index=False)
-        from logs import get_logger
-        log = get_logger("summarize")
-        log.info(f"Parquet not available; wrote {len(out)} summaries -> artifacts/summaries.csv")
+            offsets = batch["sent_offsets"] if "sent_offsets" in batch else [None] * len(texts)
+            hier = hierarchy_kwargs(cfg) or {"long_chars": 0, "chunk_chars": 0}
+            out = [heuristic_summarize(x, o, long_chars=hier["long_chars"], chunk_chars=hier["chunk_chars"])
+                   for x, o in zip(texts, offsets)]
+        rows = dups.expand([{"doc_id": doc_id, "filename": filename, "summary": summ}
+                            for doc_id, filename, summ in zip(batch["doc_id"], batch["filename"], out)])
+        summaries.extend(rows)
+        if sink is not None:
+            sink.write(r for r in rows if r["summary"] is not None)
+    if use_vertex:
+        log.info(f"Summaries: computed {n_computed}, reused {len(summaries) - len(dups) - n_computed} from result store, "
+                 f"copied {len(dups)} to near-duplicates; "
+                 f"{ex.stats['calls']} API calls, {ex.stats['retries']} retries, {ex.stats['failed']} failed docs")
+        for f in ex.failures[:5]:
+            log.warning(f"summary failed: {f['error']}")
+        if llm_cache is not None:
+            log.info(f"LLM cache (summarize): {llm_cache.stats()}")
+    if store is not None:
+        store.close()
+    if sink is not None:
+        sink.close()
+        log.info(f"Upserted {sink.n_rows} summaries into {sink.table} ({sink.failed} rows failed)")
+    return pd.DataFrame(summaries, columns=["doc_id","filename","summary"])
+
+CORPUS_COLUMNS = ["doc_id", "filename", "text_clean", "sent_offsets"]
+
+def _shard_job(cfg: dict, art_dir: pathlib.Path = ART_DIR):
+    dups = read_duplicates(art_dir)
+    return lambda df: summarize_corpus(cfg, df, dups)
+
+def main():
+    cfg = load_cfg()
+    log = get_logger("summarize")
+    data, dups = open_corpus(CORPUS_COLUMNS), read_duplicates()
+    if int(cfg.get("shards", 0)) > 0:
+        out, _ = run_sharded(cfg, "summarize", data, _shard_job, ART_DIR / "summaries.parquet",
+                             duplicates_version(dups), log=log)
+        log.info(f"Wrote {len(out)} summaries -> artifacts/{out.path.name}/ ({len(out.parts())} shards)")
+        return
+    out = summarize_corpus(cfg, data, dups)
+    p = write_artifact(out, "summaries")
+    log.info(f"Wrote {len(out)} summaries -> artifacts/{p.name}")
 
 if __name__ == "__main__":
     main()
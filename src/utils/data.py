@@ -1,14 +1,164 @@
 # Author: Kartheek Nagelli
 from __future__ import annotations
-import pathlib, typing as t
-from .gcp import load_cfg, get_gcs_client
+import json, os, pathlib, shutil, time, typing as t, uuid
+import pandas as pd
+from .gcp import get_gcs_client
 
 BASE = pathlib.Path(__file__).resolve().parents[2]
 LOCAL_DOCS = BASE / "data" / "sample_docs"
+ART_DIR = BASE / "artifacts"
 
 def list_local_docs() -> t.List[pathlib.Path]:
     return sorted(LOCAL_DOCS.glob("*.txt"))
 
+def iter_local_docs(root: pathlib.Path = LOCAL_DOCS) -> t.Iterator[pathlib.Path]:
+    # Lazy directory walk: no full listing/sort, so memory does not grow with the number of files
+    with os.scandir(root) as it:
+        for entry in it:
+            if entry.name.endswith(".txt") and entry.is_file():
+                yield pathlib.Path(entry.path)
+
+# Corpus tables are held compactly: strings as Arrow arrays ("string[pyarrow]") instead of one
+# Python object per value, and the low-cardinality filename dictionary-encoded (pandas category)
+STRING_DTYPE = "string[pyarrow]"
+DICT_COLUMNS = ("filename",)
+
+def _arrow_strings(typ):
+    # pyarrow to_pandas types_mapper: string columns stay in Arrow memory
+    import pyarrow as pa
+    return pd.StringDtype("pyarrow") if pa.types.is_string(typ) or pa.types.is_large_string(typ) else None
+
+def _dict_columns(names: t.List[str], columns: t.Optional[t.List[str]]) -> t.List[str]:
+    return [c for c in DICT_COLUMNS if c in names and (columns is None or c in columns)]
+
+def compact_frame(df: pd.DataFrame) -> pd.DataFrame:
+    """In-memory frame -> the compact corpus representation (in place); non-string columns
+    such as the offset arrays are left as they are."""
+    for c in df.columns:
+        col = df[c]
+        if c in DICT_COLUMNS:
+            if not isinstance(col.dtype, pd.CategoricalDtype):
+                df[c] = col.astype("category")
+        elif col.dtype == object or (isinstance(col.dtype, pd.StringDtype) and col.dtype.storage != "pyarrow"):
+            if pd.api.types.infer_dtype(col, skipna=True) in ("string", "empty"):
+                df[c] = col.astype(STRING_DTYPE)
+    return df
+
+def read_compact(path: pathlib.Path, columns: t.Optional[t.List[str]] = None) -> pd.DataFrame:
+    import pyarrow.parquet as pq
+    dict_cols = [c for c in DICT_COLUMNS if columns is None or c in columns]  # absent ones are ignored here
+    table = pq.read_table(path, columns=columns, read_dictionary=dict_cols)
+    return table.to_pandas(types_mapper=_arrow_strings)
+
+class ParquetDataset:
+    """Directory of part-NNNNN.parquet files, written and read one batch at a time.
+    The directory keeps the artifact's .parquet name, so pd.read_parquet(path) still works.
+    columns: default projection for reads; compact: read into the compact corpus dtypes."""
+
+    def __init__(self, path: pathlib.Path, columns: t.Optional[t.List[str]] = None, compact: bool = False):
+        self.path = pathlib.Path(path)
+        self.columns = columns
+        self.compact = compact
+
+    def parts(self) -> t.List[pathlib.Path]:
+        return sorted(self.path.glob("part-*.parquet"))
+
+    def batches(self, batch_size: int = 1000, columns: t.Optional[t.List[str]] = None) -> t.Iterator[pd.DataFrame]:
+        import pyarrow.parquet as pq
+        columns = columns or self.columns
+        for part in self.parts():
+            f = pq.ParquetFile(part, read_dictionary=_dict_columns(pq.read_schema(part).names, columns) if self.compact else None)
+            for rb in f.iter_batches(batch_size=batch_size, columns=columns):
+                yield rb.to_pandas(types_mapper=_arrow_strings) if self.compact else rb.to_pandas()
+
+    def to_pandas(self, columns: t.Optional[t.List[str]] = None) -> pd.DataFrame:
+        columns = columns or self.columns
+        return read_compact(self.path, columns) if self.compact else pd.read_parquet(self.path, columns=columns)
+
+    def __len__(self) -> int:
+        import pyarrow.parquet as pq
+        return sum(pq.ParquetFile(p).metadata.num_rows for p in self.parts())
+
+class DatasetWriter:
+    def __init__(self, path: pathlib.Path):
+        self.path = pathlib.Path(path)
+        _clear(self.path)
+        self.path.mkdir(parents=True)
+        self.n_parts = 0
+        self.n_rows = 0
+
+    def write(self, df: pd.DataFrame) -> None:
+        if df.empty:
+            return
+        df.to_parquet(self.path / f"part-{self.n_parts:05d}.parquet", index=False)
+        self.n_parts += 1
+        self.n_rows += len(df)
+
+    def close(self) -> ParquetDataset:
+        return ParquetDataset(self.path)
+
+def _clear(p: pathlib.Path) -> None:
+    if p.is_dir():
+        shutil.rmtree(p)
+    elif p.exists():
+        p.unlink()
+
+def iter_batches(data: t.Union[pd.DataFrame, ParquetDataset], batch_size: int = 1000) -> t.Iterator[pd.DataFrame]:
+    if isinstance(data, ParquetDataset):
+        yield from data.batches(batch_size)
+        return
+    for start in range(0, len(data), batch_size):
+        yield data.iloc[start:start + batch_size]
+
+def read_artifact(name: str, art_dir: pathlib.Path = ART_DIR, columns: t.Optional[t.List[str]] = None,
+                  compact: bool = False) -> pd.DataFrame:
+    p_parq = art_dir / f"{name}.parquet"
+    if p_parq.exists():
+        return read_compact(p_parq, columns) if compact else pd.read_parquet(p_parq, columns=columns)
+    df = pd.read_csv(art_dir / f"{name}.csv", usecols=columns)
+    return compact_frame(df) if compact else df
+
+def open_artifact(name: str, art_dir: pathlib.Path = ART_DIR, columns: t.Optional[t.List[str]] = None,
+                  compact: bool = False) -> t.Union[pd.DataFrame, ParquetDataset]:
+    # Streamed artifacts stay on disk and are consumed batch by batch
+    p = art_dir / f"{name}.parquet"
+    return ParquetDataset(p, columns, compact) if p.is_dir() else read_artifact(name, art_dir, columns, compact)
+
+def open_corpus(columns: t.Optional[t.List[str]] = None, name: str = "corpus_clean",
+                art_dir: pathlib.Path = ART_DIR) -> t.Union[pd.DataFrame, ParquetDataset]:
+    # What a stage reads the corpus through: only the columns it uses, in the compact dtypes
+    return open_artifact(name, art_dir, columns, compact=True)
+
+def write_artifact(df: pd.DataFrame, name: str, art_dir: pathlib.Path = ART_DIR) -> pathlib.Path:
+    # Parquet when pyarrow is available, CSV otherwise; returns the path actually written
+    if isinstance(df, ParquetDataset):
+        return df.path  # streamed datasets are already on disk
+    art_dir.mkdir(parents=True, exist_ok=True)
+    _clear(art_dir / f"{name}.parquet")
+    try:
+        df.to_parquet(art_dir / f"{name}.parquet")
+        return art_dir / f"{name}.parquet"
+    except Exception:
+        df.to_csv(art_dir / f"{name}.csv", index=False)
+        return art_dir / f"{name}.csv"
+
+PUBLISHED = "published.json"
+
+def publish_version(art_dir: pathlib.Path = ART_DIR, stages: t.Iterable[str] = ()) -> str:
+    # Written last, after every artifact of a run, so readers (agent_service) reload a complete set
+    version = uuid.uuid4().hex
+    path = pathlib.Path(art_dir) / PUBLISHED
+    tmp = path.with_name(path.name + ".tmp")
+    tmp.write_text(json.dumps({"version": version, "published_at": time.time(), "stages": list(stages)}))
+    os.replace(tmp, path)
+    return version
+
+def published_version(art_dir: pathlib.Path = ART_DIR) -> str | None:
+    try:
+        return json.loads((pathlib.Path(art_dir) / PUBLISHED).read_text())["version"]
+    except (OSError, ValueError, KeyError):
+        return None
+
 def ensure_gcs_bucket(cfg: dict):
     if cfg.get("local_mode"):
         return
@@ -1,45 +1,154 @@
 # Author: Kartheek Nagelli
 from __future__ import annotations
-import pathlib, yaml
-try:
-    from google.cloud import storage
-    from google.cloud import bigquery
-    from google.cloud import language_v1 as language
-    import vertexai
-    from vertexai.generative_models import GenerativeModel, Part
-except Exception:
-    storage = bigquery = language = vertexai = GenerativeModel = Part = None
-
-CFG_PATH = pathlib.Path(__file__).resolve().parents[2] / "config.yaml"
-
-def load_cfg() -> dict:
-    with open(CFG_PATH, "r") as f:
-        return yaml.safe_load(f)
+import importlib, importlib.util, random, threading, time
+from concurrent.futures import ThreadPoolExecutor
+from config import load_cfg  # noqa: F401  (re-exported: one config loader for every module)
+from .metrics import inc, observe
+
+# Cloud SDKs are imported on first client use, not at module import: local-mode stages
+# and the CLI never pay for google.cloud / vertexai
+def sdk_available(module: str) -> bool:
+    # Checks the top-level package only, so nothing is imported
+    try:
+        return importlib.util.find_spec(module.split(".")[0]) is not None
+    except (ImportError, ValueError):
+        return False
+
+def _sdk(module: str, package: str):
+    try:
+        return importlib.import_module(module)
+    except Exception as e:
+        raise RuntimeError(f"{package} not installed") from e
+
+_CLIENTS: dict = {}
+_CLIENTS_LOCK = threading.Lock()
+
+def _shared(key: tuple, factory):
+    # One client per backend/config for the whole process; SDK clients are thread-safe
+    with _CLIENTS_LOCK:
+        if key not in _CLIENTS:
+            _CLIENTS[key] = factory()
+        return _CLIENTS[key]
 
 def init_vertex(cfg: dict):
     if cfg.get("local_mode"):
         return None
-    if vertexai is None:
-        raise RuntimeError("vertexai SDK not installed")
-    vertexai.init(project=cfg["project_id"], location=cfg["vertex_location"])
+    vertexai = _sdk("vertexai", "vertexai SDK")
+    _shared(("vertex_init", cfg["project_id"], cfg["vertex_location"]),
+            lambda: vertexai.init(project=cfg["project_id"], location=cfg["vertex_location"]) or True)
+
+def get_generative_model(cfg: dict, model_name: str):
+    gm = _sdk("vertexai.generative_models", "vertexai SDK")
+    init_vertex(cfg)
+    return _shared(("vertex_model", cfg.get("project_id"), cfg.get("vertex_location"), model_name),
+                   lambda: gm.GenerativeModel(model_name))
 
 def get_gcs_client(cfg: dict):
     if cfg.get("local_mode"):
         return None
-    if storage is None:
-        raise RuntimeError("google-cloud-storage not installed")
+    storage = _sdk("google.cloud.storage", "google-cloud-storage")
     return storage.Client(project=cfg["project_id"])
 
 def get_bq_client(cfg: dict):
     if cfg.get("local_mode"):
         return None
-    if bigquery is None:
-        raise RuntimeError("google-cloud-bigquery not installed")
+    bigquery = _sdk("google.cloud.bigquery", "google-cloud-bigquery")
     return bigquery.Client(project=cfg["project_id"])
 
 def get_language_client(cfg: dict):
     if cfg.get("local_mode"):
         return None
-    if language is None:
-        raise RuntimeError("google-cloud-language not installed")
-    return language.LanguageServiceClient()
+    language = _sdk("google.cloud.language_v1", "google-cloud-language")
+    return _shared(("language",), language.LanguageServiceClient)
+
+RETRYABLE = {"ResourceExhausted", "TooManyRequests", "ServiceUnavailable", "DeadlineExceeded",
+             "InternalServerError", "Aborted", "TimeoutError", "ConnectionError"}
+
+def is_retryable(exc: BaseException) -> bool:
+    # Matched by class name so google.api_core stays optional (and fakes can raise look-alikes)
+    return any(c.__name__ in RETRYABLE for c in type(exc).__mro__)
+
+class TokenBucket:
+    def __init__(self, rate: float, capacity: float | None = None, clock=time.monotonic, sleep=time.sleep):
+        self.rate = float(rate)
+        self.capacity = float(capacity if capacity is not None else max(1.0, rate))
+        self.tokens = self.capacity
+        self.clock, self.sleep = clock, sleep
+        self.updated = clock()
+        self.lock = threading.Lock()
+
+    def acquire(self, n: float = 1.0) -> None:
+        if self.rate <= 0:
+            return
+        while True:
+            with self.lock:
+                now = self.clock()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= n:
+                    self.tokens -= n
+                    return
+                wait = (n - self.tokens) / self.rate
+            self.sleep(wait)
+
+class ApiExecutor:
+    """Runs one API call per item on a bounded thread pool behind a token-bucket rate limit,
+    retrying retryable errors with jittered exponential backoff. Items that still fail are
+    returned as None and listed in `failures` instead of aborting the run."""
+
+    def __init__(self, max_concurrency: int = 8, rate_per_sec: float = 10.0, max_retries: int = 5,
+                 base_delay: float = 0.5, max_delay: float = 30.0, sleep=time.sleep, clock=time.monotonic,
+                 name: str = "api"):
+        self.name = name  # `api` label on the call/retry/latency metrics
+        self.max_concurrency = max(1, int(max_concurrency))
+        self.bucket = TokenBucket(rate_per_sec, clock=clock, sleep=sleep)
+        self.max_retries, self.base_delay, self.max_delay = max_retries, base_delay, max_delay
+        self.sleep = sleep
+        self.failures: list[dict] = []
+        self.stats = {"calls": 0, "retries": 0, "failed": 0}
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_cfg(cls, cfg: dict, name: str = "api") -> ApiExecutor:
+        return cls(max_concurrency=cfg.get("api_max_concurrency", 8), rate_per_sec=cfg.get("api_rate_per_sec", 10),
+                   max_retries=cfg.get("api_max_retries", 5), name=name)
+
+    def _call(self, fn, item):
+        for attempt in range(self.max_retries + 1):
+            self.bucket.acquire()
+            with self._lock:
+                self.stats["calls"] += 1
+            inc("api_calls", api=self.name)
+            t0 = time.perf_counter()
+            try:
+                return fn(item)
+            except Exception as e:
+                if attempt >= self.max_retries or not is_retryable(e):
+                    raise
+                with self._lock:
+                    self.stats["retries"] += 1
+                inc("api_retries", api=self.name)
+                self.sleep(random.uniform(0, min(self.max_delay, self.base_delay * 2 ** attempt)))
+            finally:
+                observe("api_latency_seconds", time.perf_counter() - t0, api=self.name)
+
+    def map(self, fn, items: list, keys: list | None = None, record_failures: bool = True) -> list:
+        # record_failures=False: items that fail are None but not counted as failed docs (the
+        # caller retries them another way, e.g. packed requests falling back to single ones)
+        keys = list(range(len(items))) if keys is None else keys
+        with ThreadPoolExecutor(max_workers=self.max_concurrency) as ex:
+            futures = [ex.submit(self._call, fn, x) for x in items]
+        out = []
+        for key, fut in zip(keys, futures):
+            try:
+                out.append(fut.result())
+            except Exception as e:
+                if not record_failures:
+                    out.append(None)
+                    continue
+                with self._lock:
+                    self.stats["failed"] += 1
+                    self.failures.append({"key": key, "error": f"{type(e).__name__}: {e}"})
+                inc("api_failures", api=self.name)
+                out.append(None)
+        return out
@@ -0,0 +1,109 @@
+# Author: Kartheek Nagelli
+from __future__ import annotations
+import hashlib, pathlib, sqlite3, threading, time, typing as t
+from .metrics import inc
+
+BASE = pathlib.Path(__file__).resolve().parents[2]
+DEFAULT_PATH = BASE / "artifacts" / "llm_cache.sqlite"
+
+def cache_key(model_name: str, template: str, text: str) -> str:
+    return hashlib.sha256("\x1f".join([model_name, template, text]).encode("utf-8")).hexdigest()
+
+class LLMCache:
+    """Disk-backed LLM response cache (SQLite, WAL) with TTL expiry and LRU eviction by total size.
+    Every thread gets its own connection; other processes may share the same file."""
+
+    def __init__(self, path: pathlib.Path = DEFAULT_PATH, max_bytes: int = 512 * 2**20,
+                 ttl_seconds: float | None = 30 * 86400, evict_every: int = 64, clock=time.time):
+        self.path = pathlib.Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.max_bytes, self.ttl, self.evict_every, self.clock = max_bytes, ttl_seconds, evict_every, clock
+        self.hits = self.misses = self.evictions = 0
+        self._puts = 0
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        with self._conn() as c:
+            c.execute("CREATE TABLE IF NOT EXISTS cache (key TEXT PRIMARY KEY, value TEXT, "
+                      "created REAL, accessed REAL, size INTEGER)")
+            c.execute("CREATE INDEX IF NOT EXISTS cache_accessed ON cache (accessed)")
+
+    @classmethod
+    def from_cfg(cls, cfg: dict) -> LLMCache | None:
+        if not cfg.get("llm_cache", True):
+            return None
+        path = pathlib.Path(cfg.get("llm_cache_path") or DEFAULT_PATH)
+        ttl_days = cfg.get("llm_cache_ttl_days", 30)
+        return cls(path if path.is_absolute() else BASE / path,
+                   max_bytes=int(float(cfg.get("llm_cache_max_mb", 512)) * 2**20),
+                   ttl_seconds=float(ttl_days) * 86400 if ttl_days else None)
+
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = self._local.conn = sqlite3.connect(self.path, timeout=30)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+        return conn
+
+    def get(self, key: str) -> str | None:
+        now = self.clock()
+        with self._conn() as c:
+            row = c.execute("SELECT value, created FROM cache WHERE key=?", (key,)).fetchone()
+            if row is not None and self.ttl is not None and now - row[1] > self.ttl:
+                c.execute("DELETE FROM cache WHERE key=?", (key,))
+                row = None
+            if row is not None:
+                c.execute("UPDATE cache SET accessed=? WHERE key=?", (now, key))
+        with self._lock:
+            if row is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+        inc("cache_misses" if row is None else "cache_hits", cache="llm")
+        return None if row is None else row[0]
+
+    def put(self, key: str, value: str) -> None:
+        now = self.clock()
+        with self._conn() as c:
+            c.execute("INSERT OR REPLACE INTO cache VALUES (?,?,?,?,?)", (key, value, now, now, len(value.encode("utf-8"))))
+        with self._lock:
+            self._puts += 1
+            due = self._puts % self.evict_every == 0
+        if due:
+            self.evict()
+
+    def evict(self) -> int:
+        # Drop expired rows, then least-recently-used rows until the cache is back under 90% of max_bytes
+        with self._conn() as c:
+            c.execute("BEGIN IMMEDIATE")
+            n = 0
+            if self.ttl is not None:
+                n += c.execute("DELETE FROM cache WHERE created < ?", (self.clock() - self.ttl,)).rowcount
+            total = c.execute("SELECT COALESCE(SUM(size), 0) FROM cache").fetchone()[0]
+            if total > self.max_bytes:
+                drop, freed = [], 0
+                for key, size in c.execute("SELECT key, size FROM cache ORDER BY accessed"):
+                    if total - freed <= 0.9 * self.max_bytes:
+                        break
+                    drop.append((key,))
+                    freed += size
+                c.executemany("DELETE FROM cache WHERE key=?", drop)
+                n += len(drop)
+        with self._lock:
+            self.evictions += n
+        inc("cache_evictions", n, cache="llm")
+        return n
+
+    def stats(self) -> dict:
+        return {"hits": self.hits, "misses": self.misses, "evictions": self.evictions}
+
+def cached_generate(cache: LLMCache | None, model_name: str, template: str, text: str,
+                    generate: t.Callable[[], str]) -> str:
+    if cache is None:
+        return generate()
+    key = cache_key(model_name, template, text)
+    out = cache.get(key)
+    if out is None:
+        out = generate()
+        cache.put(key, out)
+    return out
@@ -0,0 +1,118 @@
+# Author: Kartheek Nagelli
+from __future__ import annotations
+import contextlib, os, pathlib, resource, sys, threading, time, typing as t
+
+PREFIX = "nlp_pipeline_"
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 300.0)
+
+def _key(name: str, labels: dict) -> tuple:
+    return name, tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+def _escape(v: str) -> str:
+    # Exposition format: backslash, double quote and newline are escaped in label values
+    return v.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+def _labels(pairs: tuple, extra: str = "") -> str:
+    body = ",".join([f'{k}="{_escape(v)}"' for k, v in pairs] + ([extra] if extra else []))
+    return "{" + body + "}" if body else ""
+
+def peak_rss_bytes() -> int:
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return rss if sys.platform == "darwin" else rss * 1024  # bytes on macOS, KiB on Linux
+
+class Span:
+    seconds: float = 0.0
+
+class Registry:
+    """Process-wide counters, gauges and latency histograms, dumped in the Prometheus
+    text format at the end of a run. Thread-safe; labels are plain keyword arguments."""
+
+    def __init__(self, buckets: t.Sequence[float] = BUCKETS):
+        self.buckets = tuple(buckets)
+        self.counters: dict = {}
+        self.gauges: dict = {}
+        self.hists: dict = {}  # key -> [per-bucket counts..., +Inf count, sum]
+        self.lock = threading.Lock()
+
+    def inc(self, name: str, n: float = 1, **labels) -> None:
+        k = _key(name, labels)
+        with self.lock:
+            self.counters[k] = self.counters.get(k, 0) + n
+
+    def set(self, name: str, value: float, **labels) -> None:
+        with self.lock:
+            self.gauges[_key(name, labels)] = value
+
+    def observe(self, name: str, value: float, **labels) -> None:
+        k = _key(name, labels)
+        i = next((j for j, b in enumerate(self.buckets) if value <= b), len(self.buckets))
+        with self.lock:
+            h = self.hists.setdefault(k, [0] * (len(self.buckets) + 1) + [0.0])
+            h[i] += 1
+            h[-1] += value
+
+    @contextlib.contextmanager
+    def span(self, name: str, **labels) -> t.Iterator[Span]:
+        # Times the block into the `<name>_seconds` histogram; sp.seconds is set on exit
+        sp = Span()
+        t0 = time.perf_counter()
+        try:
+            yield sp
+        finally:
+            sp.seconds = time.perf_counter() - t0
+            self.observe(f"{name}_seconds", sp.seconds, **labels)
+
+    def snapshot(self) -> dict:
+        with self.lock:
+            fmt = lambda k: k[0] + _labels(k[1])
+            return {"counters": {fmt(k): v for k, v in self.counters.items()},
+                    "gauges": {fmt(k): v for k, v in self.gauges.items()},
+                    "histograms": {fmt(k): {"count": sum(h[:-1]), "sum": round(h[-1], 6)} for k, h in self.hists.items()}}
+
+    def to_prometheus(self) -> str:
+        lines = []
+        with self.lock:
+            typed = set()
+            for kind, series, suffix in (("counter", self.counters, "_total"), ("gauge", self.gauges, "")):
+                for (name, pairs), v in sorted(series.items()):
+                    metric = PREFIX + name + suffix
+                    if metric not in typed:
+                        typed.add(metric)
+                        lines.append(f"# TYPE {metric} {kind}")
+                    lines.append(f"{metric}{_labels(pairs)} {v}")
+            for (name, pairs), h in sorted(self.hists.items()):
+                metric = PREFIX + name
+                if metric not in typed:
+                    typed.add(metric)
+                    lines.append(f"# TYPE {metric} histogram")
+                cum = 0
+                for b, c in zip((*self.buckets, "+Inf"), h[:-1]):
+                    cum += c
+                    le = 'le="%s"' % b
+                    lines.append(f"{metric}_bucket{_labels(pairs, le)} {cum}")
+                lines.append(f"{metric}_sum{_labels(pairs)} {h[-1]}")
+                lines.append(f"{metric}_count{_labels(pairs)} {cum}")
+        return "\n".join(lines) + "\n"
+
+    def write_textfile(self, path: pathlib.Path) -> pathlib.Path:
+        # Atomic replace so a node_exporter textfile collector never reads a partial file
+        path = pathlib.Path(path)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = path.with_name(path.name + ".tmp")
+        tmp.write_text(self.to_prometheus())
+        os.replace(tmp, path)
+        return path
+
+    def reset(self) -> None:
+        with self.lock:
+            self.counters.clear(); self.gauges.clear(); self.hists.clear()
+
+REGISTRY = Registry()
+inc, set_gauge, observe, span = REGISTRY.inc, REGISTRY.set, REGISTRY.observe, REGISTRY.span
+
+def timed_batches(batches: t.Iterable, stage: str) -> t.Iterator:
+    # Wraps a batch iterator: each batch's processing time and doc count are recorded for `stage`
+    for batch in batches:
+        with span("batch", stage=stage):
+            yield batch
+        inc("docs_processed", len(batch), stage=stage)
@@ -0,0 +1,99 @@
+# Author: Kartheek Nagelli
+from __future__ import annotations
+import json, re, typing as t
+from .gcp import ApiExecutor
+from .metrics import inc
+from .result_store import content_hash
+
+FENCE_RE = re.compile(r"^\s*```(?:json)?\s*|\s*```\s*$")
+DOC_ID_RE = re.compile(r"d(\d+)$")
+DOC_TAG_TOKENS = 8  # <doc id="dN"> ... </doc> per packed document
+JSON_OUTPUT = {"response_mime_type": "application/json"}
+
+def estimate_tokens(text: str, chars_per_token: float = 4.0) -> int:
+    # Rough count for budgeting; a count_tokens call per document would cost a round trip itself
+    return int(len(text) / chars_per_token) + 1
+
+def pack_kwargs(cfg: dict, prompt: str) -> dict | None:
+    # packed_map settings from config; None when packing is off (vertex_pack_tokens: 0)
+    budget = int(cfg.get("vertex_pack_tokens", 0) or 0)
+    if budget <= 0:
+        return None
+    cpt = float(cfg.get("vertex_pack_chars_per_token", 4.0))
+    return {"budget": budget, "overhead": estimate_tokens(prompt, cpt), "chars_per_token": cpt,
+            "max_docs": int(cfg.get("vertex_pack_max_docs", 16))}
+
+def plan_packs(texts: t.Sequence[str], budget: int, overhead: int = 0, max_docs: int = 16,
+               chars_per_token: float = 4.0) -> list[list[int]]:
+    """Greedy, in input order: consecutive docs share a request while the prompt stays within
+    budget tokens and max_docs documents. A doc over budget on its own is a pack of one."""
+    packs, cur, used = [], [], overhead
+    for i, x in enumerate(texts):
+        n = estimate_tokens(x, chars_per_token) + DOC_TAG_TOKENS
+        if cur and (used + n > budget or len(cur) >= max_docs):
+            packs.append(cur)
+            cur, used = [], overhead
+        cur.append(i)
+        used += n
+    if cur:
+        packs.append(cur)
+    return packs
+
+def pack_documents(texts: t.Sequence[str]) -> str:
+    return "\n".join(f'<doc id="d{i}">\n{x}\n</doc>' for i, x in enumerate(texts))
+
+def split_response(raw: str, n: int, validate: t.Callable[[dict], t.Any]) -> list:
+    """Per-document results from a packed response: a JSON array of objects keyed by doc_id
+    ("d0".."d{n-1}"). Missing, duplicated or invalid items come back as None."""
+    out: list = [None] * n
+    try:
+        items = json.loads(FENCE_RE.sub("", raw))
+    except (TypeError, ValueError):
+        return out
+    if isinstance(items, dict):
+        items = next((v for v in items.values() if isinstance(v, list)), [])
+    seen = set()
+    for item in items if isinstance(items, list) else []:
+        m = DOC_ID_RE.match(str(item.get("doc_id", ""))) if isinstance(item, dict) else None
+        i = int(m.group(1)) if m else -1
+        if not 0 <= i < n:
+            continue
+        if i in seen:
+            out[i] = None  # the model answered twice for one doc: trust neither
+            continue
+        seen.add(i)
+        try:
+            out[i] = validate(item)
+        except Exception:
+            out[i] = None
+    return out
+
+def packed_map(ex: ApiExecutor, texts: list[str], call_single: t.Callable[[str], t.Any],
+               call_packed: t.Callable[[list[str]], str], validate: t.Callable[[dict], t.Any],
+               budget: int, overhead: int = 0, max_docs: int = 16, chars_per_token: float = 4.0) -> list:
+    """Like ex.map(call_single, texts), but packs of short docs go out as one call_packed request
+    whose response is split with validate. Docs a packed response fails to answer (or the whole
+    pack, if the request fails) are retried one per request. Only those single requests land in
+    ex.failures (keyed by content hash); failed pack requests are the pack_failures metric."""
+    packs = plan_packs(texts, budget, overhead, max_docs, chars_per_token)
+    multi = [p for p in packs if len(p) > 1]
+    todo = [p[0] for p in packs if len(p) == 1]
+    out: list = [None] * len(texts)
+    raws = ex.map(lambda p: call_packed([texts[i] for i in p]), multi, record_failures=False)
+    for p, raw in zip(multi, raws):
+        vals = split_response(raw, len(p), validate) if raw is not None else [None] * len(p)
+        for i, v in zip(p, vals):
+            if v is None:
+                todo.append(i)
+            else:
+                out[i] = v
+    n_fallback = len(todo) - (len(packs) - len(multi))
+    inc("packed_requests", len(multi), api=ex.name)
+    inc("pack_failures", sum(raw is None for raw in raws), api=ex.name)
+    inc("packed_docs", sum(map(len, multi)) - n_fallback, api=ex.name)
+    inc("pack_fallback_docs", n_fallback, api=ex.name)
+    todo.sort()
+    singles = [texts[i] for i in todo]
+    for i, v in zip(todo, ex.map(call_single, singles, keys=[content_hash(x) for x in singles])):
+        out[i] = v
+    return out
@@ -0,0 +1,72 @@
+# Author: Kartheek Nagelli
+from __future__ import annotations
+import hashlib, json, pathlib, sqlite3, time, typing as t
+from .metrics import inc
+
+BASE = pathlib.Path(__file__).resolve().parents[2]
+DEFAULT_PATH = BASE / "artifacts" / "result_store.sqlite"
+
+def content_hash(text: str) -> str:
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+def stage_version(*parts: t.Any) -> str:
+    # Anything that changes a stage's output (backend, model, prompt) goes into its version
+    return hashlib.sha256("\x1f".join(str(p) for p in parts).encode("utf-8")).hexdigest()[:16]
+
+class ResultStore:
+    """Per-stage results keyed by (stage, version, content hash), persisted in SQLite.
+    Reruns look up unchanged documents here instead of calling the backend again."""
+
+    def __init__(self, path: pathlib.Path = DEFAULT_PATH):
+        self.path = pathlib.Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.conn = sqlite3.connect(self.path, timeout=30, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS results (stage TEXT, version TEXT, content_hash TEXT, "
+            "result TEXT, created_at REAL, PRIMARY KEY (stage, version, content_hash))")
+        self.conn.commit()
+
+    @classmethod
+    def from_cfg(cls, cfg: dict) -> ResultStore | None:
+        if not cfg.get("result_store", True):
+            return None
+        path = pathlib.Path(cfg.get("result_store_path") or DEFAULT_PATH)
+        return cls(path if path.is_absolute() else BASE / path)
+
+    def get_many(self, stage: str, version: str, keys: t.Iterable[str]) -> dict:
+        keys = list(dict.fromkeys(keys))
+        found = {}
+        for i in range(0, len(keys), 500):  # stay under SQLite's bound-parameter limit
+            chunk = keys[i:i + 500]
+            rows = self.conn.execute(
+                f"SELECT content_hash, result FROM results WHERE stage=? AND version=? "
+                f"AND content_hash IN ({','.join('?' * len(chunk))})", [stage, version, *chunk])
+            found.update((k, json.loads(v)) for k, v in rows)
+        return found
+
+    def put_many(self, stage: str, version: str, items: dict) -> None:
+        now = time.time()
+        with self.conn:
+            self.conn.executemany(
+                "INSERT OR REPLACE INTO results VALUES (?,?,?,?,?)",
+                [(stage, version, k, json.dumps(v), now) for k, v in items.items()])
+
+    def close(self) -> None:
+        self.conn.close()
+
+def cached_map(store: ResultStore | None, stage: str, version: str, texts: t.Sequence[str],
+               compute_many: t.Callable[[t.List[str]], t.List[t.Any]]) -> t.Tuple[t.List[t.Any], int]:
+    """Results for texts in order; only texts missing from the store are passed to compute_many.
+    None results (failed calls) are not stored, so they are retried next run.
+    Returns (results, number computed)."""
+    keys = [content_hash(x) for x in texts]
+    cached = store.get_many(stage, version, keys) if store is not None else {}
+    todo = {k: x for k, x in zip(keys, texts) if k not in cached}
+    if store is not None:
+        inc("cache_hits", len(keys) - len(todo), cache="result_store", stage=stage)
+        inc("cache_misses", len(todo), cache="result_store", stage=stage)
+    fresh = dict(zip(todo, compute_many(list(todo.values())))) if todo else {}
+    if store is not None and fresh:
+        store.put_many(stage, version, {k: v for k, v in fresh.items() if v is not None})
+    return [cached[k] if k in cached else fresh[k] for k in keys], len(fresh)
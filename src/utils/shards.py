@@ -0,0 +1,256 @@
+# Author: Kartheek Nagelli
+from __future__ import annotations
+import hashlib, json, multiprocessing, os, pathlib, shutil, socket, threading, time, typing as t, uuid
+import pandas as pd
+from .data import ART_DIR, ParquetDataset, _clear, iter_batches
+from .metrics import inc
+from .result_store import stage_version
+
+# A stage run split into shards by doc_id hash, claimed through lease files on a filesystem all
+# workers share (one machine or several). Layout under artifacts/shards/<stage>/:
+#   plan.json                      n_shards, non-empty shards, version; a different version starts over
+#   input/shard-NNNNN/part-*.parquet
+#   leases/shard-NNNNN.lease       O_EXCL-created; mtime is the heartbeat, stale ones are reclaimed
+#   out/shard-NNNNN.parquet        atomically renamed into place: present means done
+#   out/shard-NNNNN.json           optional per-shard metadata, committed before the parquet
+RUNTIME_KEYS = ("shard_workers", "shard_lease_seconds")  # changing these must not restart a run
+Job = t.Callable[..., t.Callable[[pd.DataFrame], t.Any]]  # job(cfg, *job_args) -> compute
+
+def shard_of(doc_ids: t.Iterable, n_shards: int) -> list[int]:
+    return [int.from_bytes(hashlib.blake2b(str(d).encode("utf-8"), digest_size=8).digest(), "little") % n_shards
+            for d in doc_ids]
+
+def _fingerprint(data: pd.DataFrame | ParquetDataset) -> str:
+    if isinstance(data, ParquetDataset):
+        return stage_version(*((p.name, p.stat().st_size, p.stat().st_mtime_ns) for p in data.parts()))
+    return stage_version(len(data), hashlib.sha256("\n".join(map(str, data["doc_id"])).encode("utf-8")).hexdigest())
+
+def _create(path: pathlib.Path, text: str) -> bool:
+    try:
+        fd = os.open(path, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+    except FileExistsError:
+        return False
+    with os.fdopen(fd, "w") as fh:
+        fh.write(text)
+    return True
+
+class ShardQueue:
+    """File-lease work queue over the shards of one stage run. A lease whose file has not been
+    touched for lease_seconds belongs to a dead worker and is taken over; lease clocks are
+    file mtimes, so workers on different hosts need roughly synchronised clocks."""
+
+    def __init__(self, root: pathlib.Path, lease_seconds: float = 600.0, owner: str | None = None):
+        self.root = pathlib.Path(root)
+        self.lease_seconds = lease_seconds
+        self.owner = owner or f"{socket.gethostname()}-{os.getpid()}-{uuid.uuid4().hex[:8]}"
+
+    @property
+    def plan(self) -> dict:
+        return json.loads((self.root / "plan.json").read_text())
+
+    def _path(self, kind: str, shard: int, suffix: str = "") -> pathlib.Path:
+        return self.root / kind / f"shard-{shard:05d}{suffix}"
+
+    def prepare(self, data: pd.DataFrame | ParquetDataset, n_shards: int, version: str,
+                batch_size: int = 1000) -> bool:
+        """Split data into shard inputs once per version; True if this call did the split. Other
+        workers wait for plan.json; an interrupted split is redone after the lease timeout."""
+        version = stage_version(version, n_shards, _fingerprint(data))
+        lock = self.root.with_name(self.root.name + ".prepare")
+        while True:
+            try:
+                if self.plan["version"] == version:
+                    return False
+            except (OSError, ValueError, KeyError):
+                pass
+            self.root.parent.mkdir(parents=True, exist_ok=True)
+            if _create(lock, self.owner):
+                break
+            try:
+                if time.time() - lock.stat().st_mtime > self.lease_seconds:
+                    lock.unlink()
+            except FileNotFoundError:
+                pass
+            time.sleep(0.2)
+        try:
+            _clear(self.root)
+            for kind in ("input", "leases", "out"):
+                (self.root / kind).mkdir(parents=True)
+            used = set()
+            for b, batch in enumerate(iter_batches(data, batch_size)):
+                shards = pd.Series(shard_of(batch["doc_id"], n_shards), index=batch.index)
+                for s, part in batch.groupby(shards, sort=True):
+                    d = self._path("input", int(s))
+                    d.mkdir(exist_ok=True)
+                    part.to_parquet(d / f"part-{b:05d}.parquet", index=False)
+                    used.add(int(s))
+                os.utime(lock)  # still splitting: not a stale lock
+            tmp = self.root / f"plan.json.{self.owner}"
+            tmp.write_text(json.dumps({"version": version, "n_shards": n_shards, "shards": sorted(used),
+                                       "created_at": time.time()}))
+            os.replace(tmp, self.root / "plan.json")
+        finally:
+            lock.unlink(missing_ok=True)
+        return True
+
+    def input(self, shard: int) -> pd.DataFrame:
+        return ParquetDataset(self._path("input", shard)).to_pandas()
+
+    def done(self) -> list[int]:
+        return [s for s in self.plan["shards"] if self._path("out", s, ".parquet").exists()]
+
+    def pending(self) -> list[int]:
+        # Shards no document hashed to are not in the plan
+        return [s for s in self.plan["shards"] if not self._path("out", s, ".parquet").exists()]
+
+    def _acquire(self, lease: pathlib.Path) -> bool:
+        if _create(lease, self.owner):
+            return True
+        try:
+            if time.time() - lease.stat().st_mtime < self.lease_seconds:
+                return False
+            # Expired: of several workers renaming it away, exactly one succeeds
+            stale = lease.with_name(f"{lease.name}.{self.owner}")
+            os.rename(lease, stale)
+            stale.unlink()
+        except FileNotFoundError:
+            return False
+        inc("shard_leases_reclaimed")
+        return _create(lease, self.owner)
+
+    def claim(self) -> int | None:
+        for s in self.pending():
+            if self._acquire(self._path("leases", s, ".lease")):
+                if not self._path("out", s, ".parquet").exists():
+                    return s
+                self.release(s)  # finished by the previous holder after all
+        return None
+
+    def heartbeat(self, shard: int) -> None:
+        try:
+            os.utime(self._path("leases", shard, ".lease"))
+        except FileNotFoundError:
+            pass
+
+    def owns(self, shard: int) -> bool:
+        try:
+            return self._path("leases", shard, ".lease").read_text() == self.owner
+        except FileNotFoundError:
+            return False
+
+    def release(self, shard: int) -> None:
+        if self.owns(shard):
+            self._path("leases", shard, ".lease").unlink(missing_ok=True)
+
+    def commit(self, shard: int, result: t.Any, meta: dict | None = None) -> None:
+        # result: DataFrame or pyarrow Table. A worker whose lease was taken over still commits;
+        # both runs computed the same shard, and os.replace keeps whichever lands last intact.
+        dest = self._path("out", shard, ".parquet")
+        if meta is not None:
+            tmp = dest.with_name(f".{dest.stem}.json.{self.owner}")
+            tmp.write_text(json.dumps(meta, default=str))
+            os.replace(tmp, dest.with_suffix(".json"))
+        tmp = dest.with_name(f".{dest.name}.{self.owner}")
+        if isinstance(result, pd.DataFrame):
+            result.to_parquet(tmp, index=False)
+        else:
+            import pyarrow.parquet as pq
+            pq.write_table(result, tmp)
+        os.replace(tmp, dest)
+        self.release(shard)
+
+    def metas(self) -> list[dict]:
+        return [json.loads(p.read_text()) for p in sorted((self.root / "out").glob("shard-*.json"))]
+
+    def merge(self, dest: pathlib.Path) -> ParquetDataset:
+        """Shard outputs as one part-NNNNN.parquet dataset at dest: hard links where possible,
+        rewritten to the common schema where a shard's differs (all-null columns, empty lists)."""
+        import pyarrow as pa, pyarrow.parquet as pq
+        dest = pathlib.Path(dest)
+        tmp = dest.with_name(f"{dest.name}.merge-{self.owner}")
+        _clear(tmp)
+        tmp.mkdir(parents=True)
+        srcs = [self._path("out", s, ".parquet") for s in self.plan["shards"]]
+        schemas = [pq.read_schema(p).remove_metadata() for p in srcs]
+        common = pa.unify_schemas(schemas, promote_options="permissive") if schemas else None
+        for i, (src, schema) in enumerate(zip(srcs, schemas)):
+            part = tmp / f"part-{i:05d}.parquet"
+            if schema.equals(common):
+                try:
+                    os.link(src, part)
+                except OSError:
+                    shutil.copy2(src, part)
+            else:
+                pq.write_table(pq.read_table(src).cast(common.select(schema.names)), part)
+        _clear(dest)
+        try:
+            os.replace(tmp, dest)
+        except OSError:
+            _clear(tmp)  # another worker merged the same shards first
+        shutil.rmtree(self.root / "input", ignore_errors=True)
+        return ParquetDataset(dest)
+
+def run_worker(queue: ShardQueue, compute: t.Callable[[pd.DataFrame], t.Any], log=None, poll: float = 1.0) -> int:
+    """Claim, compute and commit shards until all are done; waits on shards other workers hold so
+    that their leases can be reclaimed if they die. Returns the number of shards computed here."""
+    n = 0
+    while queue.pending():
+        shard = queue.claim()
+        if shard is None:
+            time.sleep(poll)
+            continue
+        stop = threading.Event()
+
+        def beat(shard=shard):
+            while not stop.wait(queue.lease_seconds / 3):
+                queue.heartbeat(shard)
+        beater = threading.Thread(target=beat, daemon=True)
+        beater.start()
+        t0 = time.perf_counter()
+        try:
+            res = compute(queue.input(shard))
+        except BaseException:
+            queue.release(shard)
+            raise
+        finally:
+            stop.set()
+            beater.join()
+        res, meta = res if isinstance(res, tuple) else (res, None)
+        queue.commit(shard, res, meta)
+        inc("shards_done")
+        n += 1
+        if log is not None:
+            log.info(f"shard {shard} done in {time.perf_counter() - t0:.1f}s ({queue.owner})")
+    return n
+
+def _child(root: pathlib.Path, lease_seconds: float, job: Job, cfg: dict, job_args: tuple) -> None:
+    run_worker(ShardQueue(root, lease_seconds), job(cfg, *job_args))
+
+def run_sharded(cfg: dict, name: str, data: pd.DataFrame | ParquetDataset, job: Job, dest: pathlib.Path,
+                version: str = "", art_dir: pathlib.Path = ART_DIR, log=None,
+                job_args: tuple = ()) -> tuple[ParquetDataset, list[dict]]:
+    """Run job(cfg, *job_args)(shard_frame) over cfg["shards"] doc_id-hash shards of data and merge the
+    outputs into a dataset at dest; returns it with the per-shard metadata (jobs may return
+    (frame, meta)). Start the same command on more machines sharing art_dir to add workers;
+    cfg["shard_workers"] processes run here. job must be a module-level function and job_args
+    picklable."""
+    queue = ShardQueue(pathlib.Path(art_dir) / "shards" / name, float(cfg.get("shard_lease_seconds", 600)))
+    cfg_version = json.dumps({k: v for k, v in cfg.items() if k not in RUNTIME_KEYS}, sort_keys=True, default=str)
+    if queue.prepare(data, int(cfg["shards"]), stage_version(name, version, cfg_version),
+                     int(cfg.get("ingest_batch_size", 1000))) and log is not None:
+        log.info(f"{name}: split into {queue.plan['n_shards']} shards")
+    elif log is not None:
+        log.info(f"{name}: resuming, {len(queue.done())} of {len(queue.plan['shards'])} shards already done")
+    ctx = multiprocessing.get_context("spawn")  # fresh interpreters: no forked locks or SDK clients
+    procs = [ctx.Process(target=_child, args=(queue.root, queue.lease_seconds, job, cfg, job_args), daemon=True)
+             for _ in range(min(int(cfg.get("shard_workers", 1)), len(queue.pending())) - 1)]
+    for p in procs:
+        p.start()
+    try:
+        n = run_worker(queue, job(cfg, *job_args), log)
+    finally:
+        for p in procs:
+            p.join()
+    if log is not None:
+        log.info(f"{name}: {n} shards computed by this process, {len(procs)} helper processes")
+    return queue.merge(dest), queue.metas()
@@ -0,0 +1,143 @@
+# Author: Kartheek Nagelli
+from __future__ import annotations
+import abc, json, pathlib, queue, sqlite3, threading, time, uuid, typing as t
+from .gcp import ApiExecutor, get_bq_client
+from .metrics import inc
+
+BASE = pathlib.Path(__file__).resolve().parents[2]
+DEFAULT_SQLITE = BASE / "artifacts" / "results.sqlite"
+
+class BatchSink(abc.ABC):
+    """Buffers result rows and uploads them in batches of at most max_rows, or whatever
+    has accumulated after max_seconds, on a background thread so uploads overlap compute.
+    Rows are upserted on doc_id, so re-sending a batch is harmless. Retryable (quota)
+    errors back off through ApiExecutor; batches that still fail are counted in `failed`."""
+
+    def __init__(self, table: str, max_rows: int = 500, max_seconds: float = 10.0, max_retries: int = 5,
+                 max_pending: int = 4, sleep=time.sleep):
+        self.table = table
+        self.max_rows, self.max_seconds = max(1, int(max_rows)), float(max_seconds)
+        self.ex = ApiExecutor(max_concurrency=1, rate_per_sec=0, max_retries=max_retries, sleep=sleep,
+                              name=f"sink_{table}")
+        self.buf: list[dict] = []
+        self.buf_since = 0.0
+        self.n_rows = self.failed = 0
+        self.lock = threading.Lock()
+        self.q: queue.Queue = queue.Queue(maxsize=max_pending)  # bounded: compute waits if uploads fall behind
+        self.worker = threading.Thread(target=self._run, name=f"sink-{table}", daemon=True)
+        self.worker.start()
+
+    @abc.abstractmethod
+    def upsert(self, rows: list[dict]) -> None:
+        """Write one batch; rows already stored under the same doc_id are replaced."""
+
+    def write(self, rows: t.Iterable[dict]) -> None:
+        with self.lock:
+            if not self.buf:
+                self.buf_since = time.monotonic()
+            self.buf.extend(rows)
+            while len(self.buf) >= self.max_rows:
+                batch, self.buf = self.buf[:self.max_rows], self.buf[self.max_rows:]
+                self.q.put(batch)
+
+    def _take(self) -> list:
+        with self.lock:
+            batch, self.buf = self.buf, []
+        return batch
+
+    def _run(self) -> None:
+        while True:
+            try:
+                batch = self.q.get(timeout=self.max_seconds)
+            except queue.Empty:
+                with self.lock:
+                    due = self.buf and time.monotonic() - self.buf_since >= self.max_seconds
+                if not due:
+                    continue
+                batch = self._take()
+            if batch is None:
+                return
+            if self.ex.map(self._upload, [batch])[0] is None:
+                self.failed += len(batch)
+                inc("sink_rows_failed", len(batch), table=self.table)
+            else:
+                self.n_rows += len(batch)
+                inc("sink_rows", len(batch), table=self.table)
+
+    def _upload(self, batch: list) -> bool:
+        # Duplicate doc_ids inside one batch: the last row wins, as it would across batches
+        self.upsert(list({r["doc_id"]: r for r in batch}.values()))
+        return True
+
+    def close(self) -> None:
+        rest = self._take()
+        if rest:
+            self.q.put(rest)
+        self.q.put(None)
+        self.worker.join()
+
+class SQLiteSink(BatchSink):
+    """Local sink with the BigQuery sink's semantics: one row per doc_id, payload as JSON."""
+
+    def __init__(self, path: pathlib.Path = DEFAULT_SQLITE, table: str = "results", **kw):
+        self.path = pathlib.Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.conn = sqlite3.connect(self.path, timeout=30, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute(f'CREATE TABLE IF NOT EXISTS "{table}" (doc_id TEXT PRIMARY KEY, data TEXT, updated_at REAL)')
+        self.conn.commit()
+        super().__init__(table, **kw)
+
+    def upsert(self, rows: list[dict]) -> None:
+        now = time.time()
+        with self.conn:
+            self.conn.executemany(f'INSERT OR REPLACE INTO "{self.table}" VALUES (?,?,?)',
+                                  [(str(r["doc_id"]), json.dumps(r, default=str), now) for r in rows])
+
+    def rows(self) -> list[dict]:
+        return [json.loads(d) for (d,) in self.conn.execute(f'SELECT data FROM "{self.table}" ORDER BY doc_id')]
+
+    def close(self) -> None:
+        super().close()
+        self.conn.close()
+
+class BigQuerySink(BatchSink):
+    """Each batch is load-jobbed into a staging table and MERGEd into the target on doc_id."""
+
+    def __init__(self, cfg: dict, table: str, **kw):
+        self.bq = get_bq_client(cfg)
+        self.table_id = f"{self.bq.project}.{cfg['bq_dataset']}.{table}"
+        self.bq.create_dataset(f"{self.bq.project}.{cfg['bq_dataset']}", exists_ok=True)
+        super().__init__(table, **kw)
+
+    def upsert(self, rows: list[dict]) -> None:
+        import pandas as pd
+        from google.cloud import bigquery
+        df = pd.DataFrame(rows)
+        staging = f"{self.table_id}__staging_{uuid.uuid4().hex[:12]}"
+        job_cfg = bigquery.LoadJobConfig(write_disposition="WRITE_TRUNCATE")
+        self.bq.load_table_from_dataframe(df, staging, job_config=job_cfg).result()
+        try:
+            cols = [c for c in df.columns if c != "doc_id"]
+            self.bq.query(f"CREATE TABLE IF NOT EXISTS `{self.table_id}` LIKE `{staging}`").result()
+            self.bq.query(
+                f"MERGE `{self.table_id}` T USING `{staging}` S ON T.doc_id = S.doc_id "
+                f"WHEN MATCHED THEN UPDATE SET {', '.join(f'{c} = S.{c}' for c in cols)} "
+                f"WHEN NOT MATCHED THEN INSERT ROW").result()
+        finally:
+            self.bq.delete_table(staging, not_found_ok=True)
+
+def result_sink(cfg: dict, table_key: str) -> BatchSink | None:
+    # result_sink: auto (BigQuery unless local_mode) | bigquery | sqlite | none
+    kind = cfg.get("result_sink", "auto")
+    if kind == "auto":
+        kind = "none" if cfg.get("local_mode") else "bigquery"
+    kw = {"max_rows": cfg.get("sink_batch_rows", 500), "max_seconds": cfg.get("sink_flush_seconds", 10),
+          "max_retries": cfg.get("api_max_retries", 5)}
+    table = cfg.get(table_key) or table_key
+    if kind == "bigquery":
+        return BigQuerySink(cfg, table, **kw)
+    if kind == "sqlite":
+        path = pathlib.Path(cfg.get("sink_sqlite_path") or DEFAULT_SQLITE)
+        return SQLiteSink(path if path.is_absolute() else BASE / path, table, **kw)
+    return None
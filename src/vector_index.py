@@ -0,0 +1,218 @@
+# Author: Kartheek Nagelli
+from __future__ import annotations
+import json, os, pathlib, shutil
+import numpy as np
+import pandas as pd
+from utils.data import ART_DIR, ParquetDataset, iter_batches
+from utils.metrics import timed_batches
+from preprocess import chunk_spans, clean_text, text_offsets
+from dedup import shingle_hashes
+
+# Offline dense retrieval without a model download: hashed unigram+bigram TF-IDF projected
+# to `dim` dimensions by a truncated SVD (LSA) fitted on a sample of chunks. Chunk vectors
+# are stored int8 with a per-row scale, grouped by IVF list (spherical k-means centroids),
+# and memory-mapped; a query scores only the nprobe lists nearest to it.
+
+def _features(texts: list[str], n_features: int) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+    # (row, col, sublinear tf) triplets, sorted by row then col
+    _, toks = text_offsets(texts)
+    h1, d1 = shingle_hashes(texts, toks, 1)
+    h2, d2 = shingle_hashes(texts, toks, 2)
+    key = np.r_[d1, d2] * n_features + (np.r_[h1, h2] % np.uint64(n_features)).astype(np.int64)
+    key, tf = np.unique(key, return_counts=True)
+    return key // n_features, key % n_features, (1 + np.log(tf)).astype(np.float32)
+
+def _normalize(v: np.ndarray) -> np.ndarray:
+    n = np.linalg.norm(v, axis=-1, keepdims=True)
+    return v / np.where(n > 0, n, 1)
+
+def _tfidf(rows, cols, vals, idf, n_rows) -> np.ndarray:
+    vals = vals * idf[cols]
+    norm = np.sqrt(np.bincount(rows, vals * vals, minlength=n_rows))
+    return (vals / np.where(norm > 0, norm, 1)[rows]).astype(np.float32)
+
+def _project(rows, cols, vals, n_out: int, W: np.ndarray, block: int = 256) -> np.ndarray:
+    # out[rows] += vals * W[cols]: per block of output rows, a dense [block, unique cols] slab @ W
+    out = np.zeros((n_out, W.shape[1]), dtype=np.float32)
+    if not len(rows):
+        return out
+    order = np.argsort(rows, kind="stable")
+    rows, cols, vals = rows[order], cols[order], vals[order]
+    bounds = np.searchsorted(rows, np.arange(0, n_out + block, block))
+    for b, (i, j) in enumerate(zip(bounds[:-1], bounds[1:])):
+        if i == j:
+            continue
+        u, inv = np.unique(cols[i:j], return_inverse=True)
+        M = np.zeros((block, len(u)), dtype=np.float32)
+        M[rows[i:j] - b * block, inv] = vals[i:j]  # (row, col) pairs are unique
+        lo = b * block
+        out[lo:lo + block] = (M @ np.asarray(W[u], dtype=np.float32))[:n_out - lo]
+    return out
+
+def _fit_projection(rows, cols, vals, n_rows: int, n_features: int, dim: int, seed: int = 0) -> np.ndarray:
+    # Randomized SVD (Halko et al.) of the sparse sample: W = top right singular vectors, D x dim
+    rng = np.random.default_rng(seed)
+    l = max(1, min(dim + 10, n_rows))
+    Y = _project(rows, cols, vals, n_rows, rng.standard_normal((n_features, l), dtype=np.float32))
+    Q, _ = np.linalg.qr(Y)
+    BT = _project(cols, rows, vals, n_features, Q.astype(np.float32))  # B.T = X.T @ Q
+    # SVD of the small l x D matrix B via the eigenvectors of B @ B.T (l x l)
+    s2, U = np.linalg.eigh(BT.T.astype(np.float64) @ BT)
+    keep = np.argsort(-s2)[:dim]
+    keep = keep[s2[keep] > 1e-9 * max(float(s2.max()), 1e-30)]
+    W = np.zeros((n_features, dim), dtype=np.float32)
+    W[:, :len(keep)] = BT @ (U[:, keep] / np.sqrt(s2[keep]))  # V = B.T U S^-1
+    return W
+
+def _kmeans(X: np.ndarray, nlist: int, iters: int = 10, seed: int = 0) -> np.ndarray:
+    # Spherical k-means (cosine); empty lists keep their previous centroid
+    rng = np.random.default_rng(seed)
+    C = X[rng.choice(len(X), nlist, replace=False)].copy()
+    for _ in range(iters):
+        a = np.argmax(X @ C.T, axis=1)
+        order = np.argsort(a, kind="stable")
+        seg = np.flatnonzero(np.r_[True, a[order][1:] != a[order][:-1]])
+        C[a[order][seg]] = _normalize(np.add.reduceat(X[order], seg, axis=0))
+    return C
+
+def _quantize(V: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+    scale = np.abs(V).max(axis=1) / 127
+    scale[scale == 0] = 1
+    return np.round(V / scale[:, None]).astype(np.int8), scale.astype(np.float32)
+
+def _chunks(batch: pd.DataFrame, size: int, overlap: int):
+    texts = list(batch["text_clean"])
+    sents = list(batch["sent_offsets"]) if "sent_offsets" in batch else text_offsets(texts)[0]
+    for d, (text, so) in enumerate(zip(texts, sents)):
+        for s, e in chunk_spans(so, len(text), size, overlap):
+            yield d, s, e, text[s:e]
+
+def build_vector_index(data: pd.DataFrame | ParquetDataset, out_dir: pathlib.Path = ART_DIR / "vector_index",
+                       batch_size: int = 1000, dim: int = 128, n_features: int = 1 << 16,
+                       chunk_chars: int = 1000, overlap: int = 150, fit_chunks: int = 20_000,
+                       nlist: int | None = None, seed: int = 0) -> pathlib.Path:
+    # Pass 1: chunk document frequencies, and the first fit_chunks chunks as the SVD/k-means sample
+    df_count = np.zeros(n_features, dtype=np.int64)
+    sample, n_sample, n_chunks = [], 0, 0
+    for batch in timed_batches(iter_batches(data, batch_size), "vector_fit"):
+        texts = [c[3] for c in _chunks(batch, chunk_chars, overlap)]
+        if not texts:
+            continue
+        rows, cols, vals = _features(texts, n_features)
+        df_count += np.bincount(cols, minlength=n_features)
+        if n_sample < fit_chunks:
+            keep = rows < fit_chunks - n_sample
+            sample.append((rows[keep] + n_sample, cols[keep], vals[keep]))
+            n_sample += min(len(texts), fit_chunks - n_sample)
+        n_chunks += len(texts)
+    idf = np.log((1 + n_chunks) / (1 + df_count)).astype(np.float32) + 1
+    rows, cols, vals = (np.concatenate(x) for x in zip(*sample)) if sample else (np.zeros(0, np.int64),) * 3
+    vals = _tfidf(rows, cols, vals.astype(np.float32), idf, n_sample)
+    W = _fit_projection(rows, cols, vals, max(n_sample, 1), n_features, dim, seed)
+    X = _normalize(_project(rows, cols, vals, n_sample, W))
+    nlist = max(1, min(nlist or int(np.sqrt(max(n_chunks, 1))), 4096, max(n_sample, 1)))
+    C = _kmeans(X, nlist, seed=seed) if n_sample else np.zeros((1, dim), np.float32)
+
+    tmp = out_dir.with_name(out_dir.name + ".tmp")
+    shutil.rmtree(tmp, ignore_errors=True)
+    tmp.mkdir(parents=True)
+    # Pass 2: embed, assign to the nearest list and quantize; rows land in build order first
+    q_all = np.lib.format.open_memmap(tmp / "unsorted.i8.npy", mode="w+", dtype=np.int8, shape=(max(n_chunks, 1), dim))
+    scales, lists, chunk_doc, spans, doc_ids = [], [], [], [], []
+    n = 0
+    for batch in timed_batches(iter_batches(data, batch_size), "vector_index"):
+        ch = list(_chunks(batch, chunk_chars, overlap))
+        if not ch:
+            doc_ids += [str(x) for x in batch["doc_id"]]
+            continue
+        r, c, v = _features([x[3] for x in ch], n_features)
+        V = _normalize(_project(r, c, _tfidf(r, c, v, idf, len(ch)), len(ch), W))
+        q, sc = _quantize(V)
+        q_all[n:n + len(ch)] = q
+        scales.append(sc)
+        lists.append(np.argmax(V @ C.T, axis=1).astype(np.int32))
+        d = np.array([x[0] for x in ch])
+        chunk_doc.append(d + len(doc_ids))
+        spans.append(np.array([(x[1], x[2]) for x in ch], dtype=np.int32).reshape(-1, 2))
+        doc_ids += [str(x) for x in batch["doc_id"]]
+        n += len(ch)
+
+    cat = lambda xs, dt, shape=(0,): np.concatenate(xs) if xs else np.zeros(shape, dt)
+    lists, scales = cat(lists, np.int32), cat(scales, np.float32)
+    order = np.argsort(lists, kind="stable")
+    vec = np.lib.format.open_memmap(tmp / "vectors.i8.npy", mode="w+", dtype=np.int8, shape=(max(n, 1), dim))
+    for i in range(0, n, 1 << 16):  # gather into list order a slab at a time, reading rows ascending
+        sel = order[i:i + (1 << 16)]
+        asc = np.argsort(sel)
+        slab = np.empty((len(sel), dim), dtype=np.int8)
+        slab[asc] = q_all[sel[asc]]
+        vec[i:i + len(sel)] = slab
+    vec.flush()
+    del vec, q_all
+    (tmp / "unsorted.i8.npy").unlink()
+    np.save(tmp / "scales.npy", scales[order])
+    np.save(tmp / "list_off.npy", np.searchsorted(lists[order], np.arange(len(C) + 1)).astype(np.int64))
+    np.save(tmp / "chunk_doc.npy", cat(chunk_doc, np.int64)[order].astype(np.int32))
+    np.save(tmp / "chunk_span.npy", cat(spans, np.int32, (0, 2))[order])
+    np.save(tmp / "centroids.npy", C.astype(np.float32))
+    np.save(tmp / "proj.npy", W.astype(np.float16))
+    np.save(tmp / "idf.npy", idf)
+    np.save(tmp / "doc_ids.npy", np.array(doc_ids, dtype="S"))
+    (tmp / "meta.json").write_text(json.dumps({"n_chunks": n, "n_docs": len(doc_ids), "dim": dim, "n_features": n_features,
+                                               "nlist": len(C), "chunk_chars": chunk_chars, "overlap": overlap}))
+    shutil.rmtree(out_dir, ignore_errors=True)
+    os.replace(tmp, out_dir)
+    return out_dir
+
+class VectorIndex:
+    """Memory-mapped IVF index written by build_vector_index. nprobe (lists scanned per query)
+    trades recall for latency; nprobe >= nlist is an exact scan."""
+
+    def __init__(self, path: pathlib.Path = ART_DIR / "vector_index", nprobe: int = 8):
+        self.path = pathlib.Path(path)
+        self.meta = json.loads((self.path / "meta.json").read_text())
+        self.nprobe = nprobe
+        load = lambda name: np.load(self.path / name, mmap_mode="r")
+        self.vectors, self.scales, self.list_off = load("vectors.i8.npy"), load("scales.npy"), load("list_off.npy")
+        self.chunk_doc, self.chunk_span, self.doc_ids = load("chunk_doc.npy"), load("chunk_span.npy"), load("doc_ids.npy")
+        # Small and hit by every query: kept in memory
+        self.centroids, self.idf = np.load(self.path / "centroids.npy"), np.load(self.path / "idf.npy")
+        self.proj = np.load(self.path / "proj.npy", mmap_mode="r")
+
+    @staticmethod
+    def exists(path: pathlib.Path = ART_DIR / "vector_index") -> bool:
+        return (pathlib.Path(path) / "meta.json").exists()
+
+    def embed(self, texts: list[str]) -> np.ndarray:
+        texts = [clean_text(x) for x in texts]
+        r, c, v = _features(texts, self.meta["n_features"])
+        return _normalize(_project(r, c, _tfidf(r, c, v, self.idf, len(texts)), len(texts), self.proj))
+
+    def search_chunks(self, query: str, k: int = 10, nprobe: int | None = None) -> list[tuple[str, int, int, float]]:
+        """Top-k chunks as (doc_id, start, end, cosine) with text_clean[start:end] the chunk."""
+        if self.meta["n_chunks"] == 0:
+            return []
+        q = self.embed([query])[0]
+        if not q.any():
+            return []
+        nprobe = min(nprobe or self.nprobe, len(self.centroids))
+        probe = np.argpartition(-(self.centroids @ q), nprobe - 1)[:nprobe]
+        ids, scores = [], []
+        for li in probe.tolist():
+            a, b = int(self.list_off[li]), int(self.list_off[li + 1])
+            if a < b:
+                ids.append(np.arange(a, b))
+                scores.append((np.asarray(self.vectors[a:b], dtype=np.float32) @ q) * self.scales[a:b])
+        if not ids:
+            return []
+        ids, scores = np.concatenate(ids), np.concatenate(scores)
+        top = np.argsort(-scores, kind="stable")[:k]
+        return [(self.doc_ids[self.chunk_doc[i]].decode(), int(self.chunk_span[i, 0]), int(self.chunk_span[i, 1]),
+                 float(s)) for i, s in zip(ids[top], scores[top])]
+
+    def search(self, query: str, k: int = 10, nprobe: int | None = None) -> list[tuple[str, float]]:
+        # Documents ranked by their best chunk
+        best: dict[str, float] = {}
+        for doc_id, _, _, s in self.search_chunks(query, k * 4, nprobe):
+            best.setdefault(doc_id, s)
+        return sorted(best.items(), key=lambda kv: -kv[1])[:k]
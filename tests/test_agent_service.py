@@ -0,0 +1,74 @@
+import asyncio, json
+import pandas as pd
+from src.agent_service import AgentService
+from src.utils.data import publish_version
+
+def _artifacts(art, summary="Delays on route 7."):
+    pd.DataFrame({"doc_id": ["a", "b"], "filename": ["transit.txt", "sales.txt"],
+                  "text_clean": ["Transit report: delays.", "Sales grew."]}).to_parquet(art / "corpus_clean.parquet")
+    pd.DataFrame({"doc_id": ["a", "b"], "summary": [summary, "Up 5%."]}).to_parquet(art / "summaries.parquet")
+    publish_version(art, ["summarize"])
+
+def test_concurrent_identical_queries_coalesce_and_results_are_cached(tmp_path):
+    _artifacts(tmp_path)
+
+    async def go():
+        svc = await AgentService(tmp_path, reload_seconds=0).start()
+        outs = await asyncio.gather(*[svc.query("Find transit report") for _ in range(5)])
+        again = await svc.query("find   TRANSIT report")
+        await svc.close()
+        return svc, outs, again
+
+    svc, outs, again = asyncio.run(go())
+    assert svc.stats["executed"] == 1 and svc.stats["coalesced"] == 4 and svc.stats["cache_hits"] == 1
+    assert [r["doc_id"] for r in outs[0]["results"]] == ["a"]
+    assert again["results"] == outs[0]["results"] and again["query"] == "find   TRANSIT report"
+
+def test_new_published_version_is_hot_reloaded(tmp_path):
+    _artifacts(tmp_path)
+
+    async def go():
+        svc = await AgentService(tmp_path, reload_seconds=0).start()
+        before = await svc.query("Find transit report")
+        assert not await svc.reload_if_changed()
+        _artifacts(tmp_path, summary="Delays cleared.")
+        assert await svc.reload_if_changed()
+        after = await svc.query("Find transit report")
+        await svc.close()
+        return before, after
+
+    before, after = asyncio.run(go())
+    assert before["results"][0]["summary"] == "Delays on route 7."
+    assert after["results"][0]["summary"] == "Delays cleared."
+
+def test_http_query_and_health(tmp_path):
+    _artifacts(tmp_path)
+
+    async def request(port, raw):
+        reader, writer = await asyncio.open_connection("127.0.0.1", port)
+        writer.write(raw)
+        await writer.drain()
+        resp = await reader.read()
+        writer.close()
+        head, _, body = resp.partition(b"\r\n\r\n")
+        return int(head.split()[1]), json.loads(body)
+
+    async def go():
+        svc = await AgentService(tmp_path, reload_seconds=0).start()
+        server = await asyncio.start_server(svc.handle, "127.0.0.1", 0)
+        port = server.sockets[0].getsockname()[1]
+        body = json.dumps({"query": "Find transit report"}).encode()
+        out = [await request(port, b"GET /query?q=Find+transit+report HTTP/1.1\r\nHost: x\r\n\r\n"),
+               await request(port, b"POST /query HTTP/1.1\r\nContent-Length: %d\r\n\r\n" % len(body) + body),
+               await request(port, b"GET /query HTTP/1.1\r\n\r\n"),
+               await request(port, b"GET /health HTTP/1.1\r\n\r\n")]
+        for bad in (b'[1]', b'"x"', b'{"query": 5}', b'{"query": ["a"]}', b'not json'):
+            out.append(await request(port, b"POST /query HTTP/1.1\r\nContent-Length: %d\r\n\r\n" % len(bad) + bad))
+        server.close()
+        await svc.close()
+        return out
+
+    (s1, r1), (s2, r2), (s3, _), (s4, health), *bad = asyncio.run(go())
+    assert s1 == s2 == 200 and r1["results"] == r2["results"] and r1["results"][0]["doc_id"] == "a"
+    assert s3 == 400 and s4 == 200 and health["executed"] == 1 and health["cache_hits"] == 1
+    assert [s for s, _ in bad] == [400] * 5 and all("error" in r for _, r in bad)
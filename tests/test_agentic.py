@@ -5,3 +5,65 @@ def test_plan_includes_search_for_issue_queries():
     tool_names = [s["tool"] for s in steps]
     assert "search_corpus" in tool_names
     assert "summarize" in tool_names
+
+def test_search_fuses_keyword_and_vector_indexes(tmp_path):
+    import pandas as pd
+    from src.agentic_workflow import search_corpus_local
+    from src.search_index import build_index
+    from src.vector_index import build_vector_index
+    df = pd.DataFrame({"doc_id": ["a", "b", "c"], "filename": ["a.txt", "b.txt", "c.txt"],
+                       "text_clean": ["Transit delays on the bus route.", "Quarterly profit grew.", "Subway transit report."]})
+    df.to_parquet(tmp_path / "corpus_clean.parquet")
+    assert [r["doc_id"] for r in search_corpus_local("transit report", tmp_path)] == ["c", "a"]  # no index: term matches
+    build_index(df, tmp_path / "search_index")
+    build_vector_index(df, tmp_path / "vector_index", dim=4)
+    hits = [r["doc_id"] for r in search_corpus_local("transit report", tmp_path)]
+    assert hits[:2] == ["c", "a"] and "text_clean" in search_corpus_local("profit", tmp_path)[0]
+
+def test_entity_questions_use_the_entity_index(tmp_path):
+    import pandas as pd
+    from src.agentic_workflow import run
+    from src.entity_index import EntityIndex
+    pd.DataFrame({"doc_id": ["a", "b"], "filename": ["a.txt", "b.txt"],
+                  "text_clean": ["Acme Corp missed targets.", "Acme Corp grew."]}).to_parquet(tmp_path / "corpus_clean.parquet")
+    pd.DataFrame({"doc_id": ["a", "b"], "summary": ["Missed.", "Grew."]}).to_parquet(tmp_path / "summaries.parquet")
+    idx = EntityIndex(tmp_path / "entity_index.sqlite")
+    idx.add([{"doc_id": d, "filename": f"{d}.txt", "entities": [{"type": "ORGANIZATION", "text": "Acme Corp"}],
+              "sentiment": {"label": s, "confidence": 0.8}} for d, s in [("a", "negative"), ("b", "positive")]])
+    idx.close()
+    out = run("Which documents mention ORG Acme with negative sentiment?", tmp_path)
+    assert out["plan"][0] == {"tool": "entity_lookup", "args": {"entity": "Acme", "type": "ORGANIZATION", "sentiment": "negative"}}
+    assert [r["doc_id"] for r in out["results"]] == ["a"]
+    assert out["results"][0]["mentions"] == 1 and out["results"][0]["summary"] == "Missed."
+
+def test_capitalised_words_not_in_the_entity_index_are_searched(tmp_path):
+    import pandas as pd
+    from src.agentic_workflow import plan, run
+    from src.entity_index import EntityIndex
+    pd.DataFrame({"doc_id": ["a", "b"], "filename": ["a.txt", "b.txt"],
+                  "text_clean": ["Transit report: delays.", "Acme Corp grew."]}).to_parquet(tmp_path / "corpus_clean.parquet")
+    pd.DataFrame({"doc_id": ["a", "b"], "summary": ["Delays.", "Grew."]}).to_parquet(tmp_path / "summaries.parquet")
+    idx = EntityIndex(tmp_path / "entity_index.sqlite")
+    idx.add([{"doc_id": "b", "filename": "b.txt", "entities": [{"type": "ORGANIZATION", "text": "Acme Corp"}],
+              "sentiment": {"label": "positive", "confidence": 0.8}}])
+    idx.close()
+    for q in ["Find issues in NYC transit report", "Where do I find transit delays?", "Show the Q3 transit sentiment"]:
+        assert plan(q, tmp_path)[0]["tool"] == "search_corpus"
+        assert [r["doc_id"] for r in run(q, tmp_path)["results"]] == ["a"]
+    # Known entity, but no document passes the sentiment filter: falls back to search
+    out = run("Which documents mention Acme with negative sentiment?", tmp_path)
+    assert out["plan"][0]["tool"] == "entity_lookup" and [r["doc_id"] for r in out["results"]] == ["b"]
+
+def test_vector_nprobe_config_is_read_once(tmp_path, monkeypatch):
+    import pandas as pd, config
+    from src import agentic_workflow as aw
+    from src.vector_index import build_vector_index
+    build_vector_index(pd.DataFrame({"doc_id": ["a"], "filename": ["a.txt"], "text_clean": ["Transit delays."]}),
+                       tmp_path / "vector_index", dim=4)
+    calls = []
+    monkeypatch.setattr(config, "load_cfg", lambda: calls.append(1) or {"vector_nprobe": 3})
+    aw.default_nprobe.cache_clear()
+    try:
+        assert all(aw.open_vector_index(tmp_path).nprobe == 3 for _ in range(3)) and len(calls) == 1
+    finally:
+        aw.default_nprobe.cache_clear()
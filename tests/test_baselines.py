@@ -0,0 +1,31 @@
+import sys
+from types import SimpleNamespace
+import src.baselines as bl
+
+def test_spacy_model_is_loaded_once_and_docs_are_piped_in_batches(monkeypatch):
+    calls = {"load": 0, "pipe": []}
+    class FakeNLP:
+        def pipe(self, texts, batch_size, n_process):
+            texts = list(texts)
+            calls["pipe"].append((len(texts), batch_size, n_process))
+            for t in texts:
+                yield SimpleNamespace(ents=[SimpleNamespace(text=w, label_="ORG") for w in t.split() if w.isupper()])
+    def load(name, disable):
+        calls["load"] += 1
+        assert "parser" in disable and "ner" not in disable
+        return FakeNLP()
+    monkeypatch.setitem(sys.modules, "spacy", SimpleNamespace(load=load))
+    bl._spacy.cache_clear()
+    try:
+        out = bl.spacy_ner_batch(["ACME buys NASA", "no ents"], batch_size=32)
+        bl.spacy_ner("MTA")
+    finally:
+        bl._spacy.cache_clear()
+    assert out == [[{"text": "ACME", "label": "ORG"}, {"text": "NASA", "label": "ORG"}], []]
+    assert calls["load"] == 1 and calls["pipe"][0] == (2, 32, 1)
+
+def test_merge_reports_sums_worker_time_without_rounding_it_away():
+    from src.evaluate_baselines import merge_reports
+    shard = {"textrank": {"docs": 10, "seconds": 0.0004, "docs_per_sec": 25000.0}}
+    assert merge_reports([shard, shard]) == {"textrank": {"docs": 20, "seconds": 0.001, "docs_per_sec": 25000.0}}
+    assert merge_reports([{"textrank": {"docs": 0, "seconds": 0.0, "docs_per_sec": None}}])["textrank"]["docs_per_sec"] is None
@@ -0,0 +1,13 @@
+from tools.bench import synth_corpus, compare
+
+def test_synth_corpus_is_deterministic():
+    a, b = synth_corpus(50, seed=1), synth_corpus(50, seed=1)
+    assert a.equals(b) and a["doc_id"].is_unique
+    assert a["text"].str.len().min() > 0
+
+def test_compare_flags_regressions_beyond_threshold():
+    rec = {"size": 1000, "bench": "preprocess", "throughput": 100.0, "p99_ms": 1.0, "peak_rss_mb": 100.0}
+    base = {"results": [rec]}
+    cur = {"results": [dict(rec, throughput=80.0, p99_ms=1.05)]}
+    flagged = compare(cur, base, threshold=0.1)
+    assert [f["metric"] for f in flagged] == ["throughput"]
@@ -4,3 +4,23 @@ def test_load_cfg_has_defaults():
     cfg = load_cfg()
     assert "local_mode" in cfg
     assert "project_id" in cfg or cfg.get("local_mode") is True
+
+def test_load_cfg_is_parsed_once_and_copied():
+    from src import config
+    a, b = config.load_cfg(), config.load_cfg()
+    assert a == b and a is not b
+    a["heuristic_workers"] = 99
+    assert config.load_cfg()["heuristic_workers"] != 99
+    assert config._load.cache_info().hits >= 2
+
+def test_validate_cfg_rejects_bad_values():
+    import pytest
+    from src.config import validate_cfg
+    with pytest.raises(ValueError, match="api_max_concurrency.*result_sink"):
+        validate_cfg({"local_mode": True, "api_max_concurrency": 0, "result_sink": "s3"})
+    with pytest.raises(ValueError, match="project_id"):
+        validate_cfg({"local_mode": False, "bq_dataset": "d"})
+    with pytest.raises(ValueError, match="dedup_threshold must be <= 1.0"):
+        validate_cfg({"local_mode": True, "dedup_threshold": 1.5})
+    assert validate_cfg({"local_mode": True, "eval_workers": 0})["eval_workers"] == 0
+    assert validate_cfg({"local_mode": True, "dedup_threshold": 1})["dedup_threshold"] == 1
@@ -0,0 +1,38 @@
+import random
+import pandas as pd
+from src.dedup import Duplicates, find_duplicates, lsh_params
+from src.preprocess import add_text_index
+
+def _corpus():
+    rng = random.Random(0)
+    words = [f"word{chr(97 + i % 26)}{chr(97 + i // 26 % 26)}" for i in range(2000)]
+    base = [rng.choices(words, k=200) for _ in range(50)]
+    near = []
+    for toks in base[:10]:  # a few edits: 5-shingle Jaccard stays around 0.85
+        toks = list(toks)
+        for j in rng.sample(range(200), 3):
+            toks[j] = "edited"
+        near.append(toks)
+    texts = [" ".join(t) for t in base + near] + ["", "Short note."]
+    df = pd.DataFrame({"doc_id": [f"d{i:03d}" for i in range(len(texts))],
+                       "filename": [f"f{i}.txt" for i in range(len(texts))], "text": texts})
+    return add_text_index(df)
+
+def test_near_duplicates_map_to_their_earlier_original():
+    out = find_duplicates({"dedup_threshold": 0.7, "ingest_batch_size": 16}, _corpus())
+    assert dict(zip(out["doc_id"], out["canonical_id"])) == {f"d{50 + i:03d}": f"d{i:03d}" for i in range(10)}
+    assert (out["similarity"] >= 0.7).all()
+    assert find_duplicates({"dedup": False}, _corpus()).empty
+
+def test_lsh_params_fit_the_signature():
+    bands, rows = lsh_params(0.8, 128)
+    assert bands * rows <= 128 and 0.6 < (1 / bands) ** (1 / rows) < 0.9
+
+def test_duplicates_skip_members_and_copy_canonical_rows():
+    dups = Duplicates(pd.DataFrame({"doc_id": ["b", "c"], "filename": ["b.txt", "c.txt"],
+                                    "canonical_id": ["a", "a"], "similarity": [0.9, 0.85]}))
+    batch = pd.DataFrame({"doc_id": ["a", "b", "x"], "filename": ["a.txt", "b.txt", "x.txt"]})
+    assert list(dups.canonical(batch)["doc_id"]) == ["a", "x"]
+    rows = dups.expand([{"doc_id": "a", "filename": "a.txt", "summary": "S"}, {"doc_id": "x", "filename": "x.txt", "summary": "T"}])
+    assert [(r["doc_id"], r["filename"], r["summary"]) for r in rows] == [
+        ("a", "a.txt", "S"), ("b", "b.txt", "S"), ("c", "c.txt", "S"), ("x", "x.txt", "T")]
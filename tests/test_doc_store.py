@@ -0,0 +1,17 @@
+import pandas as pd
+from src.doc_store import DocStore
+
+def test_get_many_preserves_order_and_reports_misses(tmp_path):
+    sums = pd.DataFrame({"doc_id": ["a", "b", "c"], "summary": ["A.", "B.", "C."]})
+    store = DocStore.from_frames(tmp_path, summaries=sums)
+    rows = store.get_many("summaries", ["c", "zz", "a"])
+    assert [r and r["summary"] for r in rows] == ["C.", None, "A."]
+    assert store.get("summaries", "b")["summary"] == "B."
+
+def test_large_tables_are_read_lazily_through_a_bounded_lru(tmp_path):
+    pd.DataFrame({"doc_id": [f"d{i}" for i in range(50)], "summary": [str(i) for i in range(50)]}) \
+        .to_parquet(tmp_path / "summaries.parquet")
+    store = DocStore(tmp_path, cache_size=5, max_rows_in_memory=10)
+    assert [r["summary"] for r in store.get_many("summaries", ["d7", "d42"])] == ["7", "42"]
+    store.get_many("summaries", [f"d{i}" for i in range(10, 20)])
+    assert len(store.tables["summaries"].lru) == 5
@@ -0,0 +1,43 @@
+from src.entity_index import EntityIndex, normalize, parse_query
+
+def _row(doc_id, ents, label="neutral", conf=0.5):
+    return {"doc_id": doc_id, "filename": f"{doc_id}.txt", "entities": [{"type": ty, "text": x} for ty, x in ents],
+            "sentiment": {"label": label, "confidence": conf}}
+
+ROWS = [
+    _row("a", [("ORGANIZATION", "Federal Transit Administration (FTA)"), ("ORGANIZATION", "NVIDIA Corp.")], "negative", 0.9),
+    _row("b", [("ORGANIZATION", "FTA"), ("ORGANIZATION", "Nvidia"), ("DATE", "August")], "positive"),
+    _row("c", [("ORGANIZATION", "NVIDIA"), ("PERCENT", "12 %")], "negative", 0.4),
+]
+
+def test_normalize_surface_forms():
+    assert normalize("NVIDIA Corp.") == normalize("Nvidia") == normalize("nvidia's") == "nvidia"
+    assert normalize("12 %") == "12%" and normalize("$ 5.5") == "$5.5"
+
+def test_lookup_merges_variants_and_filters_sentiment(tmp_path):
+    idx = EntityIndex(tmp_path / "e.sqlite")
+    assert idx.add(ROWS) == {"added": 3, "updated": 0, "unchanged": 0}
+    assert [h["doc_id"] for h in idx.lookup("nvidia")] == ["a", "b", "c"]
+    assert [h["doc_id"] for h in idx.lookup("NVIDIA", "ORGANIZATION", "negative")] == ["a", "c"]
+    assert {h["doc_id"] for h in idx.lookup("FTA")} == {h["doc_id"] for h in idx.lookup("Federal Transit Administration")} == {"a", "b"}
+    assert idx.lookup("nvidia", "DATE") == [] and idx.lookup("unknown") == []
+    related = {r["entity"]: r["documents"] for r in idx.related("Nvidia")}
+    assert related["Federal Transit Administration (FTA)"] == 1 and related["August"] == 1
+
+def test_incremental_updates_and_sync(tmp_path):
+    idx = EntityIndex(tmp_path / "e.sqlite")
+    idx.add(ROWS)
+    assert idx.add(ROWS[:1]) == {"added": 0, "updated": 0, "unchanged": 1}
+    assert idx.add([_row("b", [("ORGANIZATION", "Acme Inc")], "negative")])["updated"] == 1
+    assert [h["doc_id"] for h in idx.lookup("acme", sentiment="negative")] == ["b"]
+    assert [h["doc_id"] for h in idx.lookup("nvidia")] == ["a", "c"]
+    assert "August" not in {r["entity"] for r in idx.related("nvidia")}
+    stats = idx.sync([[ROWS[0]]])
+    assert stats["removed"] == 2 and stats["unchanged"] == 1
+    assert idx.lookup("acme") == [] and idx.related("nvidia")[0]["documents"] == 1
+
+def test_parse_query():
+    assert parse_query("Which documents mention ORG Acme Corp with negative sentiment?") == {
+        "entity": "Acme Corp", "type": "ORGANIZATION", "sentiment": "negative"}
+    assert parse_query('Show docs about "federal reserve"')["entity"] == "federal reserve"
+    assert parse_query("Find issues in transit report") is None
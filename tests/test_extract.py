@@ -0,0 +1,25 @@
+from src.extract_entities import heuristic_extract, heuristic_extract_many
+
+def test_single_pass_scanner_keeps_entity_types_and_order():
+    text = "In August Analysts said NASA (JPL) grew 4.5 % in Q3 to $ 12.5. The cost issue remains! Support improved."
+    out = heuristic_extract(text)
+    assert [(e["type"], e["text"]) for e in out["entities"]] == [
+        ("ORGANIZATION", "In August Analysts"), ("ORGANIZATION", "NASA"), ("ORGANIZATION", "JPL"),
+        ("DATE", "August"), ("DATE", "Q3"), ("PERCENT", "4.5 %"), ("PERCENT", "$ 12.5"),
+    ]
+    assert out["issues"] == ["The cost issue remains!"]
+    assert out["sentiment"] == {"label": "neutral", "confidence": 0.0}
+
+def test_process_pool_output_matches_serial_order():
+    texts = [f"Doc {i} from Acme Corp reported {i}% growth in March." for i in range(100)]
+    assert heuristic_extract_many(texts, workers=2) == [heuristic_extract(t) for t in texts]
+
+def test_tokens_stay_aligned_when_lowercasing_changes_length():
+    text = "The project faces a major risk and delay."
+    assert heuristic_extract(text)["issues"] == [text]
+    assert heuristic_extract("İİİİ " + text)["issues"] == ["İİİİ " + text]
+
+def test_issue_words_need_word_boundaries_like_the_original_regex():
+    for word, hit in [("risk", True), ("risk's", True), ("risk_free", False), ("cost2", False), ("2cost", False), ("riskñ", False)]:
+        text = f"The {word} remains."
+        assert heuristic_extract(text)["issues"] == ([text] if hit else []), word
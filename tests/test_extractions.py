@@ -0,0 +1,25 @@
+import json
+from src.extractions import ExtractionWriter, read_extractions, to_row
+from src.extract_entities import heuristic_extract
+
+TEXTS = ["Acme Corp improved margins by 5% in March.", "The cost issue is a concern for MTA.",
+         "Crowding risk remains a concern."]
+
+def _records():
+    return [{"doc_id": f"d{i}", "filename": f"d{i}.txt", "heuristic": heuristic_extract(t)} for i, t in enumerate(TEXTS)]
+
+def test_parquet_dataset_supports_projection_and_nested_filters(tmp_path):
+    recs = _records() + [{"doc_id": "x", "filename": "x.txt", "nl_api": None, "error": "quota"}]
+    w = ExtractionWriter(tmp_path)
+    w.write(recs[:2]); w.write(recs[2:])
+    assert w.close().name == "extractions.parquet" and w.n_parts == 2
+    neg = read_extractions(tmp_path, columns=["doc_id", "issues"], filters=[("sentiment.label", "=", "negative")])
+    assert [r["doc_id"] for r in neg] == ["d1", "d2"] and set(neg[0]) == {"doc_id", "issues"}
+    failed = read_extractions(tmp_path, filters=[("error", "!=", "")])
+    assert failed[0]["backend"] == "nl_api" and failed[0]["entities"] == []
+
+def test_jsonl_fallback_reader_applies_the_same_filters(tmp_path):
+    (tmp_path / "extractions.jsonl").write_text("".join(json.dumps(to_row(r)) + "\n" for r in _records()))
+    rows = read_extractions(tmp_path, columns=["doc_id"], filters=[("sentiment.label", "in", ["negative"])])
+    assert rows == [{"doc_id": "d1"}, {"doc_id": "d2"}]
+    assert read_extractions(tmp_path, filters=[("error", "!=", "")]) == []
@@ -0,0 +1,76 @@
+import threading
+from types import SimpleNamespace
+import pandas as pd
+import src.extract_entities as ie
+from src.utils.gcp import ApiExecutor, TokenBucket
+
+class ResourceExhausted(Exception):
+    pass
+
+class FakeLanguageClient:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.in_flight = self.peak = 0
+        self.attempts = {}
+
+    def annotate_text(self, request):
+        text = request["document"]["content"]
+        with self.lock:
+            self.in_flight += 1
+            self.peak = max(self.peak, self.in_flight)
+            self.attempts[text] = self.attempts.get(text, 0) + 1
+            n = self.attempts[text]
+        try:
+            if text == "flaky" and n < 3:
+                raise ResourceExhausted("quota")
+            if text == "broken":
+                raise ValueError("bad document")
+            ent = SimpleNamespace(name=text.title(), type_=SimpleNamespace(name="ORGANIZATION"))
+            return SimpleNamespace(entities=[ent], document_sentiment=SimpleNamespace(score=0.5))
+        finally:
+            with self.lock:
+                self.in_flight -= 1
+
+def test_executor_retries_quota_errors_and_records_failures_without_aborting():
+    ex = ApiExecutor(max_concurrency=3, rate_per_sec=0, base_delay=0, sleep=lambda s: None)
+    client = FakeLanguageClient()
+    items = ["ok", "flaky", "broken"] + [f"doc{i}" for i in range(20)]
+    out = ex.map(lambda t: ie.extract_with_nl_api(client, t), items)
+    assert out[0]["entities"][0]["text"] == "Ok" and out[1] is not None and out[2] is None
+    assert client.attempts["flaky"] == 3 and client.attempts["broken"] == 1
+    assert [f["key"] for f in ex.failures] == [2] and "bad document" in ex.failures[0]["error"]
+    assert client.peak <= 3 and ex.stats["retries"] == 2
+
+def test_executor_backs_off_only_before_retries():
+    sleeps = []
+    ex = ApiExecutor(max_concurrency=1, rate_per_sec=0, max_retries=2, base_delay=1, sleep=sleeps.append)
+    client = FakeLanguageClient()
+    ex.map(lambda t: ie.extract_with_nl_api(client, t), ["a", "b", "c"])
+    assert sleeps == []
+    ex.map(lambda t: ie.extract_with_nl_api(client, t), ["flaky", "broken"])
+    assert len(sleeps) == 2 and ex.stats["retries"] == 2  # flaky: two retries; broken: not retryable
+    ex = ApiExecutor(max_concurrency=1, rate_per_sec=0, max_retries=1, sleep=sleeps.append)
+    assert ex.map(lambda t: ie.extract_with_nl_api(FakeLanguageClient(), t), ["flaky"]) == [None]
+    assert len(sleeps) == 3  # no sleep before re-raising the final failure
+
+def test_token_bucket_waits_for_refill():
+    now = [0.0]
+    slept = []
+    def sleep(s):
+        slept.append(s)
+        now[0] += s
+    bucket = TokenBucket(rate=2, capacity=2, clock=lambda: now[0], sleep=sleep)
+    for _ in range(4):
+        bucket.acquire()
+    assert abs(sum(slept) - 1.0) < 1e-9
+
+def test_extract_corpus_uses_one_shared_client_and_marks_failed_docs(monkeypatch, tmp_path):
+    client = FakeLanguageClient()
+    monkeypatch.setattr(ie, "get_language_client", lambda cfg: client)
+    cfg = {"local_mode": False, "use_nl_api": True, "api_rate_per_sec": 0,
+           "result_store_path": str(tmp_path / "rs.sqlite"),
+           "result_sink": "sqlite", "sink_sqlite_path": str(tmp_path / "sink.sqlite")}
+    df = pd.DataFrame({"doc_id": ["a", "b"], "filename": ["a.txt", "b.txt"], "text_clean": ["acme", "broken"]})
+    recs = ie.extract_corpus(cfg, df)
+    assert recs[0]["nl_api"]["entities"][0]["text"] == "Acme"
+    assert recs[1]["nl_api"] is None and "bad document" in recs[1]["error"]
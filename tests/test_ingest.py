@@ -0,0 +1,44 @@
+import pandas as pd
+from src.utils.data import DatasetWriter, iter_batches
+
+def test_dataset_writer_streams_parts_and_reads_back_in_batches(tmp_path):
+    w = DatasetWriter(tmp_path / "corpus.parquet")
+    for i in range(3):
+        w.write(pd.DataFrame({"doc_id": [f"d{i}a", f"d{i}b"], "text": ["x", "y"]}))
+    ds = w.close()
+    assert len(ds.parts()) == 3 and len(ds) == 6
+    sizes = [len(b) for b in iter_batches(ds, batch_size=2)]
+    assert sizes == [2, 2, 2]
+    assert list(ds.to_pandas(columns=["doc_id"])["doc_id"])[:2] == ["d0a", "d0b"]
+
+def test_compact_reads_project_columns_and_use_arrow_strings(tmp_path):
+    from src.utils.data import compact_frame, open_corpus, write_artifact
+    df = pd.DataFrame({"doc_id": ["a", "b", "c"], "filename": ["x.txt", "x.txt", "y.txt"],
+                       "text_clean": ["one", "two", None], "n": [1, 2, 3]})
+    write_artifact(df, "corpus_clean", tmp_path)
+    got = open_corpus(["doc_id", "filename", "text_clean"], art_dir=tmp_path)
+    assert list(got.columns) == ["doc_id", "filename", "text_clean"]
+    assert got["doc_id"].dtype == "string[pyarrow]" and isinstance(got["filename"].dtype, pd.CategoricalDtype)
+    assert list(got["filename"].cat.categories) == ["x.txt", "y.txt"] and got["text_clean"].isna().tolist() == [False, False, True]
+    assert compact_frame(df.copy())["text_clean"].dtype.storage == "pyarrow"  # pandas 3 "str" is already Arrow
+    w = DatasetWriter(tmp_path / "streamed.parquet")
+    w.write(df.iloc[:2])
+    w.write(df.iloc[2:])
+    batches = list(open_corpus(["doc_id", "filename"], "streamed", tmp_path).batches(2))
+    assert [len(b) for b in batches] == [2, 1] and all(list(b.columns) == ["doc_id", "filename"] for b in batches)
+    assert batches[0]["doc_id"].dtype == "string[pyarrow]" and isinstance(batches[1]["filename"].dtype, pd.CategoricalDtype)
+
+def test_identical_files_keep_their_own_doc_ids_and_dedup_pairs_them(tmp_path):
+    import os
+    from src.ingest import _doc_row
+    from src.dedup import find_duplicates
+    from src.preprocess import add_text_index
+    text = " ".join(f"token{i}" for i in range(50))
+    for name in ("a.txt", "b.txt"):
+        (tmp_path / name).write_text(text, encoding="utf-8")
+    a, b = _doc_row(tmp_path / "a.txt"), _doc_row(tmp_path / "b.txt")
+    assert a["doc_id"] != b["doc_id"]
+    os.utime(tmp_path / "a.txt", (0, 0))
+    assert _doc_row(tmp_path / "a.txt")["doc_id"] == a["doc_id"]
+    out = find_duplicates({}, add_text_index(pd.DataFrame([a, b])))
+    assert out[["doc_id", "filename", "canonical_id"]].values.tolist() == [[b["doc_id"], "b.txt", a["doc_id"]]]
@@ -0,0 +1,35 @@
+import threading
+from src.utils.llm_cache import LLMCache, cache_key, cached_generate
+
+def test_hits_skip_generation_and_ttl_expires(tmp_path):
+    now = [1000.0]
+    cache = LLMCache(tmp_path / "c.sqlite", ttl_seconds=60, clock=lambda: now[0])
+    calls = []
+    gen = lambda: calls.append(1) or "summary"
+    assert cached_generate(cache, "gemini", "PROMPT", "doc", gen) == "summary"
+    assert cached_generate(cache, "gemini", "PROMPT", "doc", gen) == "summary"
+    assert cached_generate(cache, "gemini", "OTHER PROMPT", "doc", gen) == "summary"
+    assert len(calls) == 2 and cache.stats()["hits"] == 1
+    now[0] += 61
+    assert cache.get(cache_key("gemini", "PROMPT", "doc")) is None
+
+def test_lru_eviction_keeps_recently_used_entries(tmp_path):
+    now = [0.0]
+    cache = LLMCache(tmp_path / "c.sqlite", max_bytes=100, ttl_seconds=None, evict_every=1000, clock=lambda: now[0])
+    for i in range(5):
+        now[0] += 1
+        cache.put(f"k{i}", "x" * 30)
+    now[0] += 1
+    cache.get("k0")
+    cache.evict()
+    assert cache.get("k0") is not None and cache.get("k1") is None and cache.get("k4") is not None
+
+def test_concurrent_writers(tmp_path):
+    cache = LLMCache(tmp_path / "c.sqlite", evict_every=10)
+    def work(n):
+        for i in range(50):
+            cache.put(f"{n}-{i}", "v")
+    threads = [threading.Thread(target=work, args=(n,)) for n in range(4)]
+    [t.start() for t in threads]
+    [t.join() for t in threads]
+    assert all(cache.get(f"{n}-49") == "v" for n in range(4))
@@ -0,0 +1,28 @@
+import json, logging
+from src.logs import JsonFormatter
+from src.utils.metrics import Registry
+
+def test_registry_renders_prometheus_text():
+    reg = Registry(buckets=(0.1, 1.0))
+    reg.inc("docs_processed", 3, stage="extract")
+    reg.inc("docs_processed", 2, stage="extract")
+    reg.observe("api_latency_seconds", 0.5, api="nl_api")
+    with reg.span("stage", stage="extract") as sp:
+        pass
+    text = reg.to_prometheus()
+    assert 'nlp_pipeline_docs_processed_total{stage="extract"} 5' in text
+    assert 'nlp_pipeline_api_latency_seconds_bucket{api="nl_api",le="0.1"} 0' in text
+    assert 'nlp_pipeline_api_latency_seconds_bucket{api="nl_api",le="+Inf"} 1' in text
+    assert sp.seconds >= 0 and 'nlp_pipeline_stage_seconds_count{stage="extract"} 1' in text
+
+def test_json_formatter_carries_extra_fields():
+    rec = logging.LogRecord("pipeline", logging.INFO, __file__, 1, "stage done", (), None)
+    rec.stage, rec.seconds = "extract", 1.25
+    out = json.loads(JsonFormatter().format(rec))
+    assert out["stage"] == "extract" and out["seconds"] == 1.25 and out["message"] == "stage done"
+
+def test_prometheus_label_values_are_escaped():
+    reg = Registry()
+    reg.inc("errors", error='Bad "quote" \\ path\nnext line')
+    line = reg.to_prometheus().splitlines()[1]
+    assert line == 'nlp_pipeline_errors_total{error="Bad \\"quote\\" \\\\ path\\nnext line"} 1'
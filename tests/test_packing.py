@@ -0,0 +1,43 @@
+import json
+from src.utils.gcp import ApiExecutor
+from src.utils.packing import pack_documents, packed_map, plan_packs, split_response
+
+def _summary(item):
+    return item["summary"].strip() or None
+
+def test_plan_packs_respects_budget_and_max_docs():
+    texts = ["x" * 40] * 5 + ["y" * 4000] + ["z" * 40] * 3  # 11 tokens each + 8 for tags; the long one alone
+    assert plan_packs(texts, budget=100, overhead=20, max_docs=3) == [[0, 1, 2], [3, 4], [5], [6, 7, 8]]
+
+def test_split_response_validates_and_keys_by_doc_id():
+    raw = "```json\n" + json.dumps([{"doc_id": "d1", "summary": "B"}, {"doc_id": "d0", "summary": "A"},
+                                    {"doc_id": "d2", "summary": ""}, {"doc_id": "d3", "summary": "x"},
+                                    {"doc_id": "d3", "summary": "y"}, {"doc_id": "d9", "summary": "?"}]) + "\n```"
+    assert split_response(raw, 5, _summary) == ["A", "B", None, None, None]
+    assert split_response("not json", 2, _summary) == [None, None]
+
+def test_packed_map_falls_back_to_single_requests_for_unanswered_docs():
+    calls = []
+    def call_packed(texts):
+        calls.append(len(texts))
+        block = pack_documents(texts)
+        assert '<doc id="d3">' in block
+        # answers every doc except the one mentioning "skip"
+        return json.dumps([{"doc_id": f"d{i}", "summary": t.upper()} for i, t in enumerate(texts) if "skip" not in t])
+    def call_single(text):
+        calls.append(1)
+        return "single:" + text
+    texts = ["a", "b", "skip me", "c", "d"]
+    ex = ApiExecutor(rate_per_sec=0, sleep=lambda s: None)
+    out = packed_map(ex, texts, call_single, call_packed, _summary, budget=1000)
+    assert out == ["A", "B", "single:skip me", "C", "D"]
+    assert calls == [5, 1]
+
+def test_failed_pack_requests_are_not_failed_docs():
+    from src.utils.metrics import REGISTRY
+    def call_packed(texts):
+        raise ValueError("pack rejected")
+    ex = ApiExecutor(name="packtest", rate_per_sec=0, sleep=lambda s: None)
+    out = packed_map(ex, ["a", "b", "c"], lambda t: t.upper(), call_packed, _summary, budget=1000)
+    assert out == ["A", "B", "C"] and ex.failures == [] and ex.stats["failed"] == 0
+    assert REGISTRY.snapshot()["counters"]['pack_failures{api="packtest"}'] == 1
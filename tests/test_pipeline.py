@@ -0,0 +1,30 @@
+import threading
+from src.pipeline import Pipeline, Stage
+
+def test_pipeline_passes_outputs_in_memory_and_runs_independent_stages_concurrently(tmp_path):
+    barrier = threading.Barrier(2, timeout=5)
+    p = Pipeline(cfg={}, art_dir=tmp_path, checkpoint=False)
+    p.add(Stage("a", lambda cfg: [1, 2, 3], (), "nums"))
+    # b and c both depend only on "nums"; the barrier only clears if they overlap
+    p.add(Stage("b", lambda cfg, xs: (barrier.wait(), sum(xs))[1], ("nums",), "total"))
+    p.add(Stage("c", lambda cfg, xs: (barrier.wait(), max(xs))[1], ("nums",), "top"))
+    out = p.run()
+    assert out["total"] == 6 and out["top"] == 3
+    assert not list(tmp_path.iterdir())
+
+def test_pipeline_loads_missing_inputs_from_checkpoint(tmp_path):
+    p = Pipeline(cfg={}, art_dir=tmp_path)
+    p.add(Stage("a", lambda cfg: 5, (), "n", save=lambda v, art: (art / "n.txt").write_text(str(v)),
+                load=lambda art: int((art / "n.txt").read_text())))
+    p.add(Stage("b", lambda cfg, n: n * 2, ("n",), "double"))
+    p.run(["a"])
+    assert p.run(["b"])["double"] == 10
+
+def test_pipeline_releases_checkpointed_intermediates(tmp_path):
+    p = Pipeline(cfg={}, art_dir=tmp_path)
+    save = lambda v, art: None
+    p.add(Stage("a", lambda cfg: [1, 2], (), "nums", save=save))
+    p.add(Stage("b", lambda cfg, xs: sum(xs), ("nums",), "total", save=save))
+    p.add(Stage("c", lambda cfg, xs, n: len(xs) + n, ("nums", "total"), "out"))
+    out = p.run()
+    assert out == {"out": 5}
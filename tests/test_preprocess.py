@@ -12,3 +12,17 @@ def test_basic_eda_counts():
     stats = basic_eda(df)
     assert stats.loc[0,"n_docs"] == 3
     assert int(stats.loc[0,"avg_len"]) >= 1
+
+def test_text_index_offsets_slice_sentences_and_tokens():
+    from src.preprocess import add_text_index, sentences
+    df = add_text_index(pd.DataFrame({"text": ["  Rates rose 4.5%.\nRisk remains!  Q2 ok ", ""]}))
+    text, sent, tok = df.loc[0, "text_clean"], df.loc[0, "sent_offsets"], df.loc[0, "tok_offsets"]
+    assert text == "Rates rose 4.5%. Risk remains! Q2 ok" and sent.dtype == "int32" and tok.dtype == "int32"
+    assert sentences(text, sent) == ["Rates rose 4.5%.", "Risk remains!", "Q2 ok"]
+    assert [text[s:e] for s, e in tok.reshape(-1, 2)] == ["Rates", "rose", "4", "5", "Risk", "remains", "Q", "2", "ok"]
+    assert sentences(df.loc[1, "text_clean"], df.loc[1, "sent_offsets"]) == [""]
+
+def test_preprocess_corpus_keeps_compact_clean_columns_only():
+    from src.preprocess import preprocess_corpus
+    out = preprocess_corpus({}, pd.DataFrame({"doc_id": ["a"], "filename": ["a.txt"], "text": [" Hi  there. "]}))
+    assert "text" not in out and out["text_clean"].dtype == "string[pyarrow]" and out.loc[0, "text_clean"] == "Hi there."
@@ -0,0 +1,11 @@
+from src.profiling import Profiler
+
+def busy_loop(n):
+    return sum(i * i for i in range(n))
+
+def test_profiler_writes_stage_outputs(tmp_path):
+    prof = Profiler(tmp_path)
+    with prof.stage("extract"):
+        busy_loop(20_000)
+    assert {p.name for p in tmp_path.iterdir()} == {"extract.pstats", "extract.collapsed", "extract.alloc.txt"}
+    assert "busy_loop" in prof.report()
@@ -0,0 +1,21 @@
+from src.utils.result_store import ResultStore, cached_map, stage_version
+
+def test_cached_map_computes_only_new_texts_and_versions_are_isolated(tmp_path):
+    store = ResultStore(tmp_path / "rs.sqlite")
+    calls = []
+    def compute(texts):
+        calls.extend(texts)
+        return [{"len": len(x)} for x in texts]
+
+    v1 = stage_version("vertex", "gemini-1.5-flash", "prompt A")
+    out, n = cached_map(store, "summarize", v1, ["aa", "bbb"], compute)
+    assert n == 2 and out == [{"len": 2}, {"len": 3}]
+    out, n = cached_map(store, "summarize", v1, ["bbb", "cccc", "aa"], compute)
+    assert n == 1 and [o["len"] for o in out] == [3, 4, 2]
+    assert calls == ["aa", "bbb", "cccc"]
+
+    v2 = stage_version("vertex", "gemini-1.5-flash", "prompt B")
+    _, n = cached_map(store, "summarize", v2, ["aa"], compute)
+    assert n == 1
+    _, n = cached_map(store, "extract", v1, ["aa"], compute)
+    assert n == 1
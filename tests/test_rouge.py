@@ -0,0 +1,30 @@
+import pandas as pd
+import pytest
+from src.rouge import evaluate_systems
+from src.evaluate import evaluate_summaries
+
+REFS = pd.DataFrame({"doc_id": ["a", "b"], "reference": [
+    "The transit authority reported improved reliability in the second quarter.",
+    "Operators requested clearer guidance on running costs."]})
+SUMS = pd.DataFrame({"doc_id": ["a", "b"], "filename": ["a.txt", "b.txt"], "summary": [
+    "Transit reliability improved in the second quarter, the authority reported.",
+    "Operators asked for guidance on costs."]})
+
+def test_scores_match_rouge_score_reference_implementation():
+    rouge_scorer = pytest.importorskip("rouge_score.rouge_scorer")
+    per_doc, report = evaluate_systems({"sys": SUMS}, REFS, workers=1, n_boot=200)
+    scorer = rouge_scorer.RougeScorer(["rouge1", "rouge2", "rougeL"], use_stemmer=True)
+    for row, ref, pred in zip(per_doc.to_dict(orient="records"), REFS["reference"], SUMS["summary"]):
+        expected = scorer.score(ref, pred)
+        for m in ("rouge1", "rouge2", "rougeL"):
+            assert row[f"{m}_fmeasure"] == pytest.approx(expected[m].fmeasure)
+    r1 = report.set_index("metric").loc["rouge1"]
+    assert r1["n"] == 2 and r1["ci_low"] <= r1["mean"] <= r1["ci_high"]
+
+def test_evaluate_scores_pipeline_and_baseline_systems(tmp_path):
+    REFS.to_parquet(tmp_path / "references.parquet")
+    SUMS.assign(textrank_summary=REFS["reference"]).to_parquet(tmp_path / "baselines_eval.parquet")
+    out = evaluate_summaries({"local_mode": True, "eval_workers": 1, "eval_bootstrap": 50}, SUMS, tmp_path)
+    report = pd.read_parquet(tmp_path / "rouge_report.parquet")
+    assert set(report["system"]) == {"heuristic", "textrank"} and len(out["rouge"]) == 6
+    assert report.query("system == 'textrank'")["mean"].eq(1.0).all()
@@ -0,0 +1,19 @@
+import numpy as np
+import pandas as pd
+from src.search_index import SearchIndex, build_index, varbyte_decode, varbyte_encode
+
+def test_varbyte_roundtrip():
+    vals = np.array([0, 1, 127, 128, 16383, 16384, 2**28 + 5, 2**32 - 1])
+    assert (varbyte_decode(varbyte_encode(vals)) == vals).all()
+
+def test_bm25_ranks_by_relevance_and_matches_word_forms(tmp_path):
+    df = pd.DataFrame({
+        "doc_id": ["a", "b", "c"],
+        "filename": ["a.txt", "b.txt", "c.txt"],
+        "text_clean": ["Transit ridership up.", "Transit report: transit delays reported on transit lines.", "GPU news."],
+    })
+    idx = SearchIndex(build_index(df, tmp_path / "idx"))
+    hits = idx.search("transit report", k=2)
+    assert [h[0] for h in hits] == ["b", "a"]
+    assert idx.search("reports")[0][0] == "b"
+    assert idx.search("nothing-here") == []
@@ -0,0 +1,45 @@
+import os, time
+import pandas as pd
+from src.utils.data import ParquetDataset
+from src.utils.shards import ShardQueue, run_sharded, shard_of
+
+def _corpus(n=200):
+    return pd.DataFrame({"doc_id": [f"d{i}" for i in range(n)], "text_clean": [f"text {i}" for i in range(n)]})
+
+def _upper_job(cfg):
+    return lambda df: (df.assign(out=df["text_clean"].str.upper(), pid=os.getpid()), {"docs": len(df)})
+
+def test_shard_of_is_stable():
+    assert shard_of(["a", "b", "a"], 8) == shard_of(["a", "b", "a"], 8)
+    assert set(shard_of(range(1000), 4)) == {0, 1, 2, 3}
+
+def test_killed_worker_lease_is_reclaimed_and_run_resumes(tmp_path):
+    q = ShardQueue(tmp_path / "s", lease_seconds=0.2, owner="dead")
+    assert q.prepare(_corpus(), 4, "v1")
+    assert not ShardQueue(tmp_path / "s").prepare(_corpus(), 4, "v1")  # same version: resume, no re-split
+    first = q.claim()
+    n_first = len(q.input(first))
+    q.commit(first, q.input(first).assign(out="x"))
+    crashed = q.claim()  # claimed, never committed: the worker "dies" here
+    other = ShardQueue(tmp_path / "s", lease_seconds=0.2, owner="live")
+    claimed = []
+    while (s := other.claim()) is not None:
+        claimed.append(s)
+        other.commit(s, other.input(s).assign(out="y"))
+    assert crashed not in claimed and sorted(other.pending()) == [crashed]
+    time.sleep(0.3)
+    assert other.claim() == crashed
+    other.commit(crashed, other.input(crashed).assign(out="y"))
+    merged = other.merge(tmp_path / "out.parquet").to_pandas()
+    assert sorted(merged["doc_id"]) == sorted(_corpus()["doc_id"]) and (merged["out"] == "x").sum() == n_first
+    assert not (tmp_path / "s" / "input").exists()
+
+def test_run_sharded_with_worker_processes(tmp_path):
+    cfg = {"shards": 6, "shard_workers": 2, "shard_lease_seconds": 60}
+    ds, metas = run_sharded(cfg, "upper", _corpus(), _upper_job, tmp_path / "upper.parquet", art_dir=tmp_path)
+    out = ds.to_pandas()
+    assert isinstance(ds, ParquetDataset) and len(out) == 200 and out["doc_id"].is_unique
+    assert (out["out"] == out["text_clean"].str.upper()).all() and sum(m["docs"] for m in metas) == 200
+    # Unchanged input and config: every shard is already committed
+    ds2, _ = run_sharded({**cfg, "shard_workers": 1}, "upper", _corpus(), _upper_job, tmp_path / "upper.parquet", art_dir=tmp_path)
+    assert set(ds2.to_pandas()["pid"]) == set(out["pid"])
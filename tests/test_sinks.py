@@ -0,0 +1,39 @@
+from src.utils.sinks import BatchSink, SQLiteSink
+
+class ResourceExhausted(Exception):
+    pass
+
+class FlakySink(BatchSink):
+    def __init__(self, **kw):
+        self.batches, self.calls = [], 0
+        super().__init__("t", sleep=lambda s: None, **kw)
+
+    def upsert(self, rows):
+        self.calls += 1
+        if self.calls == 1:
+            raise ResourceExhausted("quota")
+        self.batches.append([r["doc_id"] for r in rows])
+
+def test_batches_are_size_bounded_and_retried_on_quota_errors():
+    sink = FlakySink(max_rows=2, max_seconds=60)
+    sink.write({"doc_id": str(i)} for i in range(5))
+    sink.close()
+    assert sink.batches == [["0", "1"], ["2", "3"], ["4"]] and sink.n_rows == 5 and sink.failed == 0
+
+def test_sqlite_sink_upserts_on_doc_id(tmp_path):
+    sink = SQLiteSink(tmp_path / "r.sqlite", "summaries", max_rows=2)
+    sink.write([{"doc_id": "a", "summary": "old"}, {"doc_id": "b", "summary": "x"}, {"doc_id": "a", "summary": "new"}])
+    sink.close()
+    again = SQLiteSink(tmp_path / "r.sqlite", "summaries")
+    again.write([{"doc_id": "b", "summary": "y"}])
+    again.close()
+    check = SQLiteSink(tmp_path / "r.sqlite", "summaries")
+    assert [(r["doc_id"], r["summary"]) for r in check.rows()] == [("a", "new"), ("b", "y")]
+    check.close()
+
+def test_sinks_without_upsert_fail_at_construction():
+    import pytest
+    class Incomplete(BatchSink):
+        pass
+    with pytest.raises(TypeError):
+        Incomplete("t")
@@ -0,0 +1,28 @@
+import json, os, pathlib, subprocess, sys
+
+import pytest
+
+SRC = pathlib.Path(__file__).resolve().parents[1] / "src"
+# Cold-start budgets in seconds (override on slow runners); a fresh interpreter per import
+BUDGETS = {"cli": float(os.getenv("IMPORT_BUDGET_CLI", "0.5")),
+           "preprocess": float(os.getenv("IMPORT_BUDGET_STAGE", "3.0")),
+           "extract_entities": float(os.getenv("IMPORT_BUDGET_STAGE", "3.0")),
+           "summarize": float(os.getenv("IMPORT_BUDGET_STAGE", "3.0"))}
+
+PROBE = """
+import json, sys, time
+sys.path.insert(0, sys.argv[1])
+t0 = time.perf_counter()
+__import__(sys.argv[2])
+dt = time.perf_counter() - t0
+print(json.dumps({"seconds": dt, "sdks": sorted(m for m in sys.modules if m.startswith(("google.cloud", "vertexai")))}))
+"""
+
+@pytest.mark.parametrize("module", sorted(BUDGETS))
+def test_import_within_budget_without_cloud_sdks(module):
+    env = {**os.environ, "LOCAL_MODE": "true"}
+    out = subprocess.run([sys.executable, "-c", PROBE, str(SRC), module], env=env,
+                         capture_output=True, text=True, check=True)
+    res = json.loads(out.stdout.strip().splitlines()[-1])
+    assert res["sdks"] == []
+    assert res["seconds"] < BUDGETS[module], f"import {module} took {res['seconds']:.3f}s"
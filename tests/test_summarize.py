@@ -0,0 +1,36 @@
+from src.preprocess import text_offsets
+from src.summarize import chunk_spans, heuristic_summarize, hierarchical_summarize
+
+TEXT = " ".join(f"Part {i} reports {'results ' * (i % 7 + 3)}in detail." for i in range(300))
+
+def test_chunk_spans_are_sentence_aligned_overlapping_and_cover_the_text():
+    (offsets,), _ = text_offsets([TEXT])
+    spans = chunk_spans(offsets, len(TEXT), 1000, 200)
+    assert spans[0][0] == 0 and spans[-1][1] == len(TEXT)
+    assert all(TEXT[s:e].startswith("Part") and TEXT[s:e].endswith(".") and e - s <= 1000 for s, e in spans)
+    assert all(0 < a_end - b_start <= 200 + 60 for (_, a_end), (b_start, _) in zip(spans, spans[1:]))
+
+def test_hierarchical_summarize_maps_all_chunks_together_and_skips_failed_docs():
+    calls = []
+    short = "Part A fails. Part B is fine."
+    def summarize_chunks(xs):
+        calls.append(len(xs))
+        return [None if x == short else x[:40] for x in xs]
+    def reduce(xs):
+        return [f"{x.count(chr(10)) + 1} parts" for x in xs]
+    out = hierarchical_summarize([TEXT, short], summarize_chunks, reduce, chunk_chars=2000, overlap=100)
+    assert out[1] is None and out[0].endswith("parts") and calls[0] > 10
+
+def test_heuristic_summary_of_long_docs_spans_the_document():
+    (offsets,), _ = text_offsets([TEXT])
+    lead = heuristic_summarize(TEXT, offsets)
+    spread = heuristic_summarize(TEXT, offsets, long_chars=5000, chunk_chars=2000)
+    assert lead.startswith("Part 0") and "Part 299" not in lead
+    assert spread.startswith("Part 0") and spread.count("Part") == 4 and "Part 2" in spread.split(". ")[-1]
+
+def test_heuristic_summary_of_unpunctuated_long_docs_is_never_longer_than_the_text():
+    for text in ["word " * 8000, "Intro sentence here. " + "word " * 8000, "x" * 4001, "Short intro. " + "y" * 4100]:
+        text = text.strip()
+        (offsets,), _ = text_offsets([text])
+        out = heuristic_summarize(text, offsets, long_chars=2000, chunk_chars=1000)
+        assert len(out) <= len(text) and len(out) <= 4 * 1000 + 3
@@ -0,0 +1,43 @@
+import random
+import pandas as pd
+from src.vector_index import VectorIndex, build_vector_index
+
+TOPICS = {
+    "transit": "bus train subway delays signal commuters route station ridership schedule".split(),
+    "finance": "revenue profit quarter earnings shares investors margin growth forecast dividend".split(),
+    "health": "hospital patients doctors vaccine clinic treatment nurses disease care trial".split(),
+}
+
+def _corpus(n=300, seed=0):
+    rng = random.Random(seed)
+    rows = []
+    for i in range(n):
+        topic = list(TOPICS)[i % len(TOPICS)]
+        sents = [" ".join(rng.choices(TOPICS[topic], k=6) + rng.choices("the a of and in to".split(), k=4)) + "."
+                 for _ in range(rng.randint(2, 12))]
+        rows.append((f"d{i}", f"f{i}.txt", " ".join(sents).capitalize(), topic))
+    return pd.DataFrame(rows, columns=["doc_id", "filename", "text_clean", "topic"])
+
+def test_chunks_retrieve_their_topic(tmp_path):
+    df = _corpus()
+    idx = VectorIndex(build_vector_index(df, tmp_path / "vi", batch_size=100, dim=32, chunk_chars=200, overlap=30))
+    topic = dict(zip(df["doc_id"], df["topic"]))
+    for q, want in [("subway signal delays", "transit"), ("vaccine trial patients", "health"), ("profit forecast", "finance")]:
+        hits = idx.search(q, k=5)
+        assert len(hits) == 5 and {topic[d] for d, _ in hits} == {want}
+    doc_id, s, e, score = idx.search_chunks("commuters station", k=1)[0]
+    assert 0 < e - s <= 400 and -1 <= score <= 1.01
+    assert idx.search("zzz unknownword") == []
+
+def test_probing_every_list_is_exact(tmp_path):
+    idx = VectorIndex(build_vector_index(_corpus(), tmp_path / "vi", dim=32, chunk_chars=200, overlap=30, nlist=8))
+    q = idx.embed(["hospital nurses care"])[0]
+    exact = (idx.vectors.astype("float32") @ q) * idx.scales
+    got = idx.search_chunks("hospital nurses care", k=10, nprobe=8)
+    assert [round(s, 5) for *_, s in got] == [round(float(s), 5) for s in sorted(exact, reverse=True)[:10]]
+    assert len(idx.search_chunks("hospital nurses care", k=10, nprobe=1)) == 10
+
+def test_empty_corpus(tmp_path):
+    df = pd.DataFrame(columns=["doc_id", "filename", "text_clean"])
+    idx = VectorIndex(build_vector_index(df, tmp_path / "vi", dim=8))
+    assert idx.search("anything") == []
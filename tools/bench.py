@@ -0,0 +1,186 @@
+"""Scaling benchmarks for the local pipeline on synthetic corpora.
+
+    python tools/bench.py run --sizes 1000,100000 --out bench_results.json
+    python tools/bench.py compare bench_results.json bench_baseline.json --threshold 0.15
+"""
+import argparse, json, os, pathlib, platform, random, resource, sys, tempfile, threading, time
+
+ROOT = pathlib.Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(ROOT / "src"))
+
+import numpy as np
+import pandas as pd
+
+ORGS = ["Acme Corp", "Global Transit Authority", "NVIDIA", "MTA", "Northwind Traders", "BBC", "European Central Bank"]
+MONTHS = ["January", "March", "May", "August", "October", "December", "Q1", "Q2", "Q3", "Q4"]
+TOPIC = ["transit", "report", "revenue", "model", "signal", "platform", "customers", "guidance", "operators",
+         "reliability", "governance", "workflow", "quarter", "maintenance", "latency", "accuracy", "market"]
+TONE = ["improved", "expanded", "higher", "better", "reliable", "support", "concern", "risk", "cost", "issue",
+        "crowding", "limitations", "requested"]
+FILLER = ["the", "and", "of", "in", "on", "for", "with", "across", "its", "while", "after", "during", "new", "key"]
+
+def synth_corpus(n: int, seed: int = 0, mean_sents: float = 8.0) -> pd.DataFrame:
+    # Log-normal sentence counts give a long tail of long documents, like news/report corpora
+    rng = random.Random(seed)
+    n_sents = np.maximum(1, np.random.default_rng(seed).lognormal(np.log(mean_sents), 0.7, n).astype(int))
+    words = TOPIC * 3 + TONE + FILLER * 4
+    texts = []
+    for k in n_sents:
+        sents = []
+        for _ in range(k):
+            body = " ".join(rng.choices(words, k=rng.randint(6, 18)))
+            extra = rng.random()
+            if extra < 0.3:
+                body += f" {rng.randint(1, 99)}.{rng.randint(0, 9)}%"
+            elif extra < 0.45:
+                body += f" in {rng.choice(MONTHS)}"
+            sents.append(f"{rng.choice(ORGS)} {body}.")
+        texts.append("\n".join(sents))
+    ids = [f"{i:012x}" for i in range(n)]
+    return pd.DataFrame({"doc_id": ids, "filename": [f"synth_{i}.txt" for i in ids], "text": texts})
+
+class PeakRSS:
+    """Samples resident set size while a benchmark runs (Linux /proc; ru_maxrss elsewhere)."""
+
+    def __init__(self, interval: float = 0.01):
+        self.interval, self.peak, self._stop = interval, 0, threading.Event()
+
+    def _rss(self) -> int:
+        try:
+            with open("/proc/self/statm") as f:
+                return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+        except OSError:
+            return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+    def _run(self):
+        while not self._stop.is_set():
+            self.peak = max(self.peak, self._rss())
+            self._stop.wait(self.interval)
+
+    def __enter__(self):
+        self.peak = self._rss()
+        self._t = threading.Thread(target=self._run, daemon=True)
+        self._t.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._t.join()
+        self.peak = max(self.peak, self._rss())
+
+def _record(size, name, n_items, total, lat, rss) -> dict:
+    lat_ms = np.array(lat) * 1000 if lat else np.array([total * 1000 / max(n_items, 1)])
+    return {"size": size, "bench": name, "items": n_items, "seconds": round(total, 4),
+            "throughput": round(n_items / total, 2) if total else None,
+            "p50_ms": round(float(np.percentile(lat_ms, 50)), 4), "p99_ms": round(float(np.percentile(lat_ms, 99)), 4),
+            "peak_rss_mb": round(rss / 2**20, 1)}
+
+def _per_item(fn, items) -> tuple[float, list]:
+    lat = []
+    t0 = time.perf_counter()
+    for x in items:
+        s = time.perf_counter()
+        fn(x)
+        lat.append(time.perf_counter() - s)
+    return time.perf_counter() - t0, lat
+
+def run_size(size: int, n_queries: int, seed: int) -> list:
+    from preprocess import preprocess_corpus, clean_text
+    from extract_entities import heuristic_extract
+    from summarize import heuristic_summarize
+    from search_index import build_index
+    from doc_store import DocStore
+    import agentic_workflow
+
+    cfg = {"local_mode": True}
+    corpus = synth_corpus(size, seed)
+    rng = random.Random(seed)
+    sample = min(size, 10_000)  # per-doc latency percentiles come from a bounded sample
+    out = []
+
+    with PeakRSS() as rss:
+        t0 = time.perf_counter()
+        clean = preprocess_corpus(cfg, corpus)
+        total = time.perf_counter() - t0
+        _, lat = _per_item(clean_text, corpus["text"].iloc[:sample])
+    out.append(_record(size, "preprocess", size, total, lat, rss.peak))
+    texts = clean["text_clean"].tolist()
+    # Downstream stages get preprocess's sentence/token offsets, as in the pipeline
+    docs = list(zip(texts, clean["sent_offsets"], clean["tok_offsets"]))
+
+    for name, fn in [("heuristic_extract", lambda d: heuristic_extract(*d)),
+                     ("heuristic_summarize", lambda d: heuristic_summarize(d[0], d[1]))]:
+        with PeakRSS() as rss:
+            total, lat = _per_item(fn, docs)
+        out.append(_record(size, name, size, total, lat, rss.peak))
+
+    with tempfile.TemporaryDirectory() as tmp:
+        art = pathlib.Path(tmp)
+        summaries = pd.DataFrame({"doc_id": clean["doc_id"], "filename": clean["filename"],
+                                  "summary": [heuristic_summarize(x, s) for x, s, _ in docs]})
+        with PeakRSS() as rss:
+            t0 = time.perf_counter()
+            build_index(clean, art / "search_index")
+            total = time.perf_counter() - t0
+        out.append(_record(size, "build_index", size, total, [], rss.peak))
+
+        terms = [rng.choice(TOPIC + TONE) for _ in range(n_queries)]
+        store = DocStore.from_frames(art, corpus_clean=clean, summaries=summaries)
+        with PeakRSS() as rss:
+            total, lat = _per_item(lambda q: agentic_workflow.search_corpus_local(q, art, store), terms)
+        out.append(_record(size, "search_corpus_local", n_queries, total, lat, rss.peak))
+        with PeakRSS() as rss:
+            total, lat = _per_item(lambda q: agentic_workflow.run(f"Find issues in {q}", art, store), terms)
+        out.append(_record(size, "agent_run", n_queries, total, lat, rss.peak))
+    return out
+
+def compare(current: dict, baseline: dict, threshold: float) -> list:
+    # A regression is throughput down, or p99 latency / peak RSS up, by more than `threshold`
+    base = {(r["size"], r["bench"]): r for r in baseline["results"]}
+    flagged = []
+    for r in current["results"]:
+        b = base.get((r["size"], r["bench"]))
+        if b is None:
+            continue
+        checks = [("throughput", b["throughput"], r["throughput"], -1), ("p99_ms", b["p99_ms"], r["p99_ms"], 1),
+                  ("peak_rss_mb", b["peak_rss_mb"], r["peak_rss_mb"], 1)]
+        for metric, old, new, direction in checks:
+            if old and new is not None and direction * (new - old) / old > threshold:
+                flagged.append({"size": r["size"], "bench": r["bench"], "metric": metric, "baseline": old,
+                                "current": new, "change": round((new - old) / old, 3)})
+    return flagged
+
+def main():
+    ap = argparse.ArgumentParser(description="Pipeline scaling benchmarks")
+    sub = ap.add_subparsers(dest="cmd", required=True)
+    r = sub.add_parser("run")
+    r.add_argument("--sizes", default="1000,100000,1000000")
+    r.add_argument("--queries", type=int, default=200)
+    r.add_argument("--seed", type=int, default=0)
+    r.add_argument("--out", default="bench_results.json")
+    c = sub.add_parser("compare")
+    c.add_argument("current")
+    c.add_argument("baseline")
+    c.add_argument("--threshold", type=float, default=0.15)
+    args = ap.parse_args()
+
+    if args.cmd == "run":
+        results = []
+        for size in [int(s) for s in args.sizes.split(",") if s]:
+            for rec in run_size(size, args.queries, args.seed):
+                print(json.dumps(rec))
+                results.append(rec)
+        meta = {"python": platform.python_version(), "platform": platform.platform(),
+                "cpus": os.cpu_count(), "timestamp": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime())}
+        pathlib.Path(args.out).write_text(json.dumps({"meta": meta, "results": results}, indent=2))
+        print(f"Wrote {len(results)} results -> {args.out}")
+    else:
+        flagged = compare(json.loads(pathlib.Path(args.current).read_text()),
+                          json.loads(pathlib.Path(args.baseline).read_text()), args.threshold)
+        for f in flagged:
+            print(f"REGRESSION {f['bench']}@{f['size']}: {f['metric']} {f['baseline']} -> {f['current']} ({f['change']:+.1%})")
+        print("no regressions" if not flagged else f"{len(flagged)} regressions beyond {args.threshold:.0%}")
+        sys.exit(1 if flagged else 0)
+
+if __name__ == "__main__":
+    main()